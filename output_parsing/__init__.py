@@ -0,0 +1 @@
+""" __init__.py for output_parsing """
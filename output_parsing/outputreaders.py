@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+
+import os
+import re
+
+BLOCK_SIZE = 8192
+# ----------------------------------------- Iteration    1(   3)  -----------
+OUTCAR_ITERATION = re.compile(r'-+\s*Iteration\s+(\d+)\s*\(\s*(\d+)\)')
+OUTCAR_FREE_ENERGY = 'FREE ENERGIE OF THE ION-ELECTRON SYSTEM'
+
+
+def parse_value(text, value_type):
+    # converts a vasprun.xml <i> value following pymatgen's type conventions
+    text = (text or '').strip()
+    if value_type == 'logical':
+        return text.upper().startswith('T')
+    elif value_type == 'string':
+        return text
+    elif value_type == 'int':
+        try:
+            return int(text)
+        except ValueError:
+            return text
+    else:
+        try:
+            return float(text)
+        except ValueError:
+            return text
+
+
+def reverse_lines(path, block_size=BLOCK_SIZE):
+    # yields the lines of path from the last to the first, reading fixed
+    # size blocks backwards from the end of the file
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        remainder = b''
+        while position > 0:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            lines = (f.read(read_size) + remainder).split(b'\n')
+            # the first line may continue in the previous block
+            remainder = lines.pop(0)
+            for line in reversed(lines):
+                yield line.decode('ascii', 'replace')
+        yield remainder.decode('ascii', 'replace')
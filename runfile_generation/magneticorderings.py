@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+
+import numpy as np
+
+SAMPLE_BATCH_SIZE = 256
+# exhaustive enumeration walks 2**(magnetic sites - 1) patterns
+EXHAUSTIVE_MAX_SITES = 20
+ENUMERATION_BATCH_SIZE = 4096
+# magnetic sites within this factor of the shortest magnetic-magnetic
+# distance count as nearest neighbours
+NEIGHBOR_TOLERANCE = 1.1
+
+
+def pattern_keys(bits):
+    # hashable key per row of a (patterns, sites) 0/1 array: the packed bitmask
+    packed = np.packbits(np.asarray(bits, dtype=np.uint8), axis=1)
+    return [row.tobytes() for row in packed]
+
+
+class SpinPatternSampler:
+    # Draws random collinear spin patterns for the magnetic (nonzero magmom)
+    # sites of a ferromagnetic magmom list, in numpy batches. Patterns are
+    # deduplicated through a set of packed sign bitmasks; the ferromagnetic
+    # pattern itself is never returned.
+    def __init__(self, ferro_magmom, rng=None, batch_size=SAMPLE_BATCH_SIZE):
+        self.ferro_magmom = np.asarray(ferro_magmom, dtype=float)
+        self.magnetic_sites = np.flatnonzero(self.ferro_magmom != 0)
+        if rng is None:
+            rng = np.random.default_rng()
+        self.rng = rng
+        self.batch_size = batch_size
+        # distinct patterns besides the ferromagnetic one
+        self.num_patterns = 2 ** len(self.magnetic_sites) - 1
+        ferro_bits = np.ones((1, len(self.magnetic_sites)), dtype=np.uint8)
+        self.seen = set(pattern_keys(ferro_bits))
+
+    def magmoms(self, bits):
+        # (patterns, sites) magmom array; 1 keeps and 0 flips a site's moment
+        magmoms = np.tile(self.ferro_magmom, (len(bits), 1))
+        magmoms[:, self.magnetic_sites] *= 2 * np.asarray(bits, dtype=float) - 1
+        return magmoms
+
+    def exhausted(self):
+        return len(self.seen) - 1 >= self.num_patterns
+
+    def sample(self, max_draws):
+        # yields new distinct magmom arrays; stops after max_draws random
+        # draws or once every pattern has been returned
+        draws = 0
+        while draws < max_draws and not self.exhausted():
+            batch_size = min(self.batch_size, max_draws - draws)
+            bits = self.rng.integers(0, 2, size=(batch_size, len(self.magnetic_sites)),
+                                     dtype=np.uint8)
+            draws += batch_size
+            new_rows = []
+            for i, key in enumerate(pattern_keys(bits)):
+                if key not in self.seen:
+                    self.seen.add(key)
+                    new_rows.append(i)
+            for magmom in self.magmoms(bits[new_rows]):
+                yield magmom
+
+
+def with_magmoms(structure, magmoms):
+    # copy of structure with its magmom site property set from a magmom
+    # array in one operation, instead of one Structure.replace per site;
+    # + 0 turns -0.0 into 0.0 and tolist() keeps plain floats for the INCAR
+    return structure.copy(site_properties={'magmom': (np.asarray(magmoms, dtype=float) + 0).tolist()})
+
+
+def site_permutations(structure, symprec=0.01, tolerance=0.1):
+    # (operations, sites) array; row k maps each site to its image under the
+    # k-th space group operation of the structure (magmoms ignored)
+    from pymatgen.core.structure import Structure
+    from pymatgen.symmetry.analyzer import SpacegroupAnalyzer
+    bare_structure = Structure(structure.lattice, structure.species, structure.frac_coords)
+    operations = SpacegroupAnalyzer(bare_structure, symprec=symprec).get_symmetry_operations(
+        cartesian=False)
+    frac_coords = np.asarray(structure.frac_coords)
+    matrix = np.asarray(structure.lattice.matrix)
+    species = np.array([str(specie) for specie in structure.species])
+    permutations = []
+    for operation in operations:
+        images = frac_coords @ np.asarray(operation.rotation_matrix).T + operation.translation_vector
+        diff = images[:, None, :] - frac_coords[None, :, :]
+        diff -= np.round(diff)
+        distances = np.linalg.norm(diff @ matrix, axis=2)
+        permutation = np.argmin(distances, axis=1)
+        if distances[np.arange(len(permutation)), permutation].max() > tolerance or \
+                len(set(permutation.tolist())) != len(permutation) or \
+                not np.array_equal(species[permutation], species):
+            continue
+        permutations.append(permutation)
+    if not permutations:
+        permutations.append(np.arange(len(structure)))
+    return np.array(permutations)
+
+
+class MagneticOrderingIndex:
+    # Canonical keys of collinear magnetic orderings on one parent structure.
+    # The key of a magmom array is the smallest packed up/down bitmask over
+    # all images of its spin pattern under the parent's symmetry operations,
+    # with and without a global spin flip, so orderings equivalent by symmetry
+    # or time reversal share a key and deduplication is a set lookup.
+    def __init__(self, parent_structure, symprec=0.01, permutations=None):
+        magmoms = np.asarray(parent_structure.site_properties.get(
+            'magmom', [0] * len(parent_structure)), dtype=float)
+        self.magnetic_mask = (magmoms != 0).astype(np.uint8)
+        if permutations is None:
+            permutations = site_permutations(parent_structure, symprec)
+        self.permutations = permutations
+        self.keys = set()
+
+    def magnetic_permutations(self):
+        # the permutations restricted to the magnetic sites, in terms of
+        # positions within np.flatnonzero(self.magnetic_mask)
+        magnetic_sites = np.flatnonzero(self.magnetic_mask)
+        position = np.full(len(self.magnetic_mask), -1)
+        position[magnetic_sites] = np.arange(len(magnetic_sites))
+        permutations = position[self.permutations[:, magnetic_sites]]
+        permutations = permutations[(permutations >= 0).all(axis=1)]
+        if len(permutations) == 0:
+            permutations = np.arange(len(magnetic_sites))[None, :]
+        return permutations
+
+    def canonical_key(self, magmom):
+        bits = (np.asarray(magmom, dtype=float) > 0).astype(np.uint8) & self.magnetic_mask
+        images = bits[self.permutations]
+        images = np.concatenate([images, images ^ self.magnetic_mask[self.permutations]])
+        return min(pattern_keys(images))
+
+    def add(self, magmom):
+        # True if magmom is a new ordering, which is then recorded
+        key = self.canonical_key(magmom)
+        if key in self.keys:
+            return False
+        self.keys.add(key)
+        return True
+
+
+def gray_codes(start, stop):
+    # the reflected binary Gray codes of start..stop-1; consecutive codes
+    # differ in a single bit, i.e. a single flipped spin
+    indices = np.arange(start, stop, dtype=np.int64)
+    return indices ^ (indices >> 1)
+
+
+def code_bits(codes, num_sites):
+    # (patterns, sites) 0/1 array; a set bit k flips magnetic site k
+    return ((codes[:, None] >> np.arange(num_sites, dtype=np.int64)) & 1).astype(np.uint8)
+
+
+def nearest_neighbor_pairs(structure, sites, tolerance=NEIGHBOR_TOLERANCE):
+    # (pairs, 2) positions within sites of minimum-image nearest neighbours
+    distances = np.asarray(structure.distance_matrix)[np.ix_(sites, sites)]
+    pairs = np.argwhere(np.triu(distances > 1e-8, k=1))
+    if len(pairs) == 0:
+        return pairs
+    pair_distances = distances[pairs[:, 0], pairs[:, 1]]
+    return pairs[pair_distances <= tolerance * pair_distances.min()]
+
+
+class ExhaustiveOrderingEnumerator:
+    # Every collinear ordering of the magnetic sites of a ferromagnetic
+    # structure up to symmetry and a global spin flip. Patterns are walked in
+    # Gray-code order with the last magnetic site fixed (the flipped half is
+    # equivalent); a pattern is kept only if its code is the smallest over its
+    # symmetry orbit, so each orbit is kept exactly once without a lookup set.
+    # Orderings are ranked by their number of antiparallel nearest neighbours.
+    def __init__(self, ferro_structure, ordering_index=None, batch_size=ENUMERATION_BATCH_SIZE):
+        if ordering_index is None:
+            ordering_index = MagneticOrderingIndex(ferro_structure)
+        self.ferro_magmom = np.asarray(ferro_structure.site_properties['magmom'], dtype=float)
+        self.magnetic_sites = np.flatnonzero(self.ferro_magmom != 0)
+        self.num_magnetic = len(self.magnetic_sites)
+        self.permutations = ordering_index.magnetic_permutations()
+        self.neighbor_pairs = nearest_neighbor_pairs(ferro_structure, self.magnetic_sites)
+        self.batch_size = batch_size
+
+    def too_large(self, max_sites=EXHAUSTIVE_MAX_SITES):
+        return self.num_magnetic > max_sites
+
+    def image_tables(self):
+        # (operations, bytes, 256) lookup tables: the image of a code under
+        # operation k is the OR of table[k, j, byte j of the code] over j
+        num_bytes = (self.num_magnetic + 7) // 8
+        inverse = np.argsort(self.permutations, axis=1)
+        weights = np.zeros((len(self.permutations), num_bytes * 8), dtype=np.int64)
+        weights[:, :self.num_magnetic] = np.int64(1) << inverse.astype(np.int64)
+        byte_bits = (np.arange(256)[:, None] >> np.arange(8)) & 1
+        weights = weights.reshape(len(self.permutations), num_bytes, 8)
+        return np.einsum('vb,kjb->kjv', byte_bits.astype(np.int64), weights)
+
+    def orbit_representatives(self, codes, tables):
+        # the codes that are the smallest of their orbit
+        images = np.zeros((len(tables), len(codes)), dtype=np.int64)
+        for j in range(tables.shape[1]):
+            images |= tables[:, j, (codes >> (8 * j)) & 255]
+        full = (np.int64(1) << self.num_magnetic) - 1
+        smallest = np.minimum(images, full - images).min(axis=0)
+        return codes[codes == smallest]
+
+    def antiparallel_neighbors(self, codes):
+        bits = code_bits(codes, self.num_magnetic)
+        if len(self.neighbor_pairs) == 0:
+            return np.zeros(len(codes), dtype=np.int64)
+        return (bits[:, self.neighbor_pairs[:, 0]] != bits[:, self.neighbor_pairs[:, 1]]).sum(axis=1)
+
+    def enumerate(self, max_orderings):
+        # (magmoms, antiparallel neighbour counts) of at most max_orderings
+        # distinct non-ferromagnetic orderings, most antiparallel first;
+        # ties keep Gray-code order, so the result is reproducible
+        if self.num_magnetic < 2:
+            return np.zeros((0, len(self.ferro_magmom))), np.zeros(0, dtype=np.int64)
+        representatives = []
+        tables = self.image_tables()
+        num_patterns = 1 << (self.num_magnetic - 1)
+        for start in range(0, num_patterns, self.batch_size):
+            codes = gray_codes(start, min(start + self.batch_size, num_patterns))
+            representatives.append(self.orbit_representatives(codes, tables))
+        codes = np.concatenate(representatives)
+        # code 0 is the ferromagnetic ordering
+        codes = codes[codes != 0]
+        counts = self.antiparallel_neighbors(codes)
+        order = np.argsort(-counts, kind='stable')[:max_orderings]
+        codes, counts = codes[order], counts[order]
+        magmoms = np.tile(self.ferro_magmom, (len(codes), 1))
+        # a set bit flips the spin of that magnetic site
+        magmoms[:, self.magnetic_sites] *= 1 - 2 * code_bits(codes, self.num_magnetic).astype(float)
+        return magmoms, counts
@@ -3,25 +3,27 @@
 import yaml
 import os
 import sys
-import random
 import numpy as np
-import copy
-from pymatgen.ext.matproj import MPRester
-from configuration.mp_api import MP_api_key
+from structure_retrieval.structureretrieval import StructureRetriever, report_invalid_mpids
+from structure_retrieval.finalstructure import final_structure_from_prev_run
+from runfile_generation.magneticorderings import SpinPatternSampler, MagneticOrderingIndex, \
+    ExhaustiveOrderingEnumerator, with_magmoms
+from runfile_generation.symmetrycache import SymmetryCache, STREAM_CACHE_SIZE
+from runfile_generation.sharedfiles import PotcarCache, SharedFileStore, POTCAR_CACHE_DIR, \
+    SHARED_FILES_DIR
+from workflow_management.auxiliaryfiles import write_manifest
 from pymatgen.io.vasp import Poscar
 from pymatgen.analysis.magnetism.analyzer import \
     CollinearMagneticStructureAnalyzer
-from pymatgen.symmetry.analyzer import SpacegroupAnalyzer
 from pymatgen.core.periodic_table import Element
 from pymatgen.core.structure import Structure
-from pymatgen.io.vasp.outputs import Vasprun
-from pymatgen.io.vasp.outputs import Outcar
 from pymatgen.io.vasp.inputs import Kpoints
-from pymatgen.io.vasp.sets import get_structure_from_prev_run
 from pymatgen.io.vasp.sets import batch_write_input
 from yaml.scanner import ScannerError
 import tempfile
-import shutil
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 
 class LoadYaml:
@@ -81,18 +83,90 @@ class LoadYaml:
         except KeyError:
             print('Max_Submissions not in %s; invalid input file' % load_path)
             sys.exit(1)
+        # optional; static files placed in every job directory
+        try:
+            self.auxiliary_files = self.loaded_dictionary['Auxiliary_Files']
+        except KeyError:
+            self.auxiliary_files = []
+        self.auxiliary_files = self.validate_auxiliary_files(load_path)
+
+    def validate_auxiliary_files(self, load_path):
+        # Auxiliary_Files entries are {Source, Name (optional), INCAR_Tag
+        # (optional)}; relative Sources are relative to the .yml
+        auxiliary_files = []
+        for entry in self.auxiliary_files or []:
+            if not isinstance(entry, dict) or 'Source' not in entry:
+                print('Auxiliary_Files entry %s has no Source; invalid input file' % entry)
+                sys.exit(1)
+            source = os.path.join(os.path.dirname(os.path.abspath(load_path)),
+                                  os.path.expanduser(str(entry['Source'])))
+            if not os.path.isfile(source):
+                print('Auxiliary file %s does not exist; invalid input file' % source)
+                sys.exit(1)
+            auxiliary_files.append({'Source': source,
+                                    'Name': str(entry.get('Name', os.path.basename(source))),
+                                    'INCAR_Tag': entry.get('INCAR_Tag')})
+        return auxiliary_files
+
+
+def load_path_structure(path):
+    # (structure, None) or (None, error message); run in worker processes by
+    # PmgStructureObjects.path_structures. A vasprun.xml and OUTCAR next to
+    # path give the final structure and magnetic moments of that run, read
+    # as get_structure_from_prev_run would but from the file ends only
+    parent_dir = os.path.dirname(os.path.abspath(path))
+    vasprun_path = os.path.join(parent_dir, 'vasprun.xml')
+    outcar_path = os.path.join(parent_dir, 'OUTCAR')
+    if os.path.exists(vasprun_path) == True and os.path.exists(outcar_path) == True:
+        try:
+            return final_structure_from_prev_run(parent_dir), None
+        except (UnicodeDecodeError, OSError):
+            return None, 'Either %s or %s not readable' % (vasprun_path, outcar_path)
+        except Exception as e:
+            # e.g. a truncated vasprun.xml; one bad path must not stop the pool
+            return None, '%s not loaded: %s' % (path, e)
+    else:
+        try:
+            poscar = Poscar.from_file(path)
+            return poscar.structure, None
+        except FileNotFoundError:
+            return None, '%s path does not exist' % path
+        except (UnicodeDecodeError, OSError):
+            return None, '%s likely not a valid CONTCAR or POSCAR' % path
+        except Exception as e:
+            return None, '%s not loaded: %s' % (path, e)
 
 
 class PmgStructureObjects:
-    def __init__(self, mpids, paths, rescale):
+    def __init__(self, mpids, paths, rescale, structure_retriever=None, workers=1,
+                 stream=False):
         self.mpids = mpids
         self.paths = paths
         self.rescale = rescale
+        self.workers = workers
+        if structure_retriever is None:
+            structure_retriever = StructureRetriever()
+        self.structure_retriever = structure_retriever
         self.structures_dict = {}
         self.structure_number = 1
 
-        self.mpid_structures()
-        self.path_structures()
+        # with stream=True structures are only loaded through iter_structures()
+        if stream == False:
+            for structure_key, structure in self.iter_structures():
+                self.structures_dict[structure_key] = structure
+
+    def iter_structures(self):
+        # (structure_key, structure) pairs, mp-ids first and then PATHs;
+        # each structure is rescaled only when it is reached
+        for item in self.mpid_structures():
+            yield item
+        for item in self.path_structures():
+            yield item
+
+    def add_structure_key(self, structure):
+        structure_key = str(structure.formula) + ' ' + str(self.structure_number)
+        self.structure_number += 1
+        return structure_key
 
     def structure_rescaler(self, structure):
         if len(structure.species) <= 2:
@@ -114,133 +188,131 @@ class PmgStructureObjects:
         return structure
 
     def mpid_structures(self):
-        for mpid in self.mpids:
-            with MPRester(MP_api_key) as m:
-                try:
-                    structure = m.get_structures(mpid, final=True)[0]
-                    if self.rescale == True:
-                        structure = self.structure_rescaler(structure)
-                    structure_key = str(structure.formula) + ' ' + str(self.structure_number)
-                    self.structures_dict[structure_key] = structure
-                    self.structure_number += 1
-                except BaseException:
-                    print('%s is not a valid mp-id' % mpid)
-                    continue
+        # all mp-ids in chunked queries over one client session; the unit
+        # cells are small, so only their rescaled copies are made lazily
+        structures, invalid_mpids = self.structure_retriever.get_structures(self.mpids)
+        report_invalid_mpids(invalid_mpids, len(self.mpids))
+        for mpid in list(structures.keys()):
+            structure = structures.pop(mpid)
+            if self.rescale == True:
+                structure = self.structure_rescaler(structure)
+            yield self.add_structure_key(structure), structure
 
     def path_structures(self):
-        for path in self.paths:
-            parent_dir = os.path.dirname(os.path.abspath(path))
-            vasprun_path = os.path.join(parent_dir, 'vasprun.xml')
-            outcar_path = os.path.join(parent_dir, 'OUTCAR')
-            if os.path.exists(vasprun_path) == True and os.path.exists(outcar_path) == True:
-                try:
-                    V = Vasprun(vasprun_path)
-                    O = Outcar(outcar_path)
-                    structure = get_structure_from_prev_run(V, O)
-                    if self.rescale == True:
-                        structure = self.structure_rescaler(structure)
-                    structure_key = str(structure.formula) + ' ' + str(self.structure_number)
-                    self.structures_dict[structure_key] = structure
-                    self.structure_number += 1
-                except UnicodeDecodeError:
-                    print('Either %s or %s not readable' % (vasprun_path, outcar_path))
-                    continue
-                except OSError:
-                    print('Either %s or %s not readable' % (vasprun_path, outcar_path))
-                    continue
-            else:
-                try:
-                    poscar = Poscar.from_file(path)
-                    structure = poscar.structure
-                    if self.rescale == True:
-                        structure = self.structure_rescaler(structure)
-                    structure_key = str(structure.formula) + ' ' + str(self.structure_number)
-                    self.structures_dict[structure_key] = structure
-                    self.structure_number += 1
-                except FileNotFoundError:
-                    print('%s path does not exist' % path)
-                    continue
-                except UnicodeDecodeError:
-                    print('%s likely not a valid CONTCAR or POSCAR' % path)
-                    continue
-                except OSError:
-                    print('%s likely not a valid CONTCAR or POSCAR' % path)
-                    continue
+        # structures are loaded in parallel with workers > 1 but numbered in
+        # the order of self.paths; errors are reported together
+        paths = list(self.paths)
+        errors = []
+        if self.workers > 1 and len(paths) > 1:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                results = self.bounded_results(executor, paths)
+                for item in self.loaded_path_structures(results, errors):
+                    yield item
+        else:
+            results = (load_path_structure(path) for path in paths)
+            for item in self.loaded_path_structures(results, errors):
+                yield item
+        if errors:
+            print('%s of %s PATHs not loaded:\n  %s' % (len(errors), len(paths), '\n  '.join(errors)))
+
+    def bounded_results(self, executor, paths):
+        # load_path_structure results in the order of paths, with at most
+        # self.workers paths submitted ahead of the consumer, so a stream
+        # never holds more than that many loaded structures
+        pending = deque()
+        paths = iter(paths)
+        for path in itertools.islice(paths, self.workers):
+            pending.append(executor.submit(load_path_structure, path))
+        while pending:
+            result = pending.popleft().result()
+            for path in itertools.islice(paths, 1):
+                pending.append(executor.submit(load_path_structure, path))
+            yield result
+
+    def loaded_path_structures(self, results, errors):
+        for structure, error in results:
+            if error is not None:
+                errors.append(error)
+                continue
+            if self.rescale == True:
+                structure = self.structure_rescaler(structure)
+            yield self.add_structure_key(structure), structure
 
 class Magnetism:
-    def __init__(self, structures_dict, magnetization_dict):
+    # structures_dict is {structure_key: structure}, or with stream=True an
+    # iterable of (structure_key, structure) pairs that is only consumed
+    # through iter_magnetic_structures()
+    def __init__(self, structures_dict, magnetization_dict, symmetry_cache=None, stream=False):
         self.structures_dict = structures_dict
         self.magnetization_dict = magnetization_dict
+        if symmetry_cache is None:
+            symmetry_cache = SymmetryCache()
+        self.symmetry_cache = symmetry_cache
         self.magnetized_structures_dict = {}
         try:
-            self.num_tries = self.magnetization_dict['Max_antiferro']*5 # Avoid recursion errors
+            self.num_tries = self.magnetization_dict['Max_antiferro']*5 # random draws per structure
         except:
             self.num_tries = 0
+        # optional Seed makes the random AFM orderings reproducible
+        self.rng = np.random.default_rng(self.magnetization_dict.get('Seed'))
         self.structure_number = 1
+        # {structure_key: {magnetism: magmom numpy array}}
         self.unique_magnetizations = {}
 
-        self.get_magnetic_structures()
-
-    def random_antiferromagnetic(self, ferro_magmom, used_enumerations, num_afm, num_tries):
-        # checks if all unique iterations complete OR too many tries achieved
-        if num_afm == 0 or num_tries == 0:
-            return used_enumerations
-        # checks if proposed enumeration is the ferromagnetic enumeration
-        dont_use = False
-        antiferro_mag_scheme = random.choices([-1, 1], k=len(ferro_magmom))
-        antiferro_mag = np.multiply(antiferro_mag_scheme, ferro_magmom)
-        if np.array_equal(antiferro_mag, np.array(ferro_magmom)):
-            dont_use = True
-        # checks if proposed scheme is an already existing antiferromagnetic scheme
-        for used_enumeration in used_enumerations:
-            if np.array_equal(antiferro_mag, used_enumeration):
-                dont_use = True
-        # if dont_use = True: tries again with num_tries - 1
-        if dont_use is True:
-            return self.random_antiferromagnetic(ferro_magmom, used_enumerations,
-                                            num_afm, num_tries - 1)
-        # else: appends to used_enumerations: tries again with num_rand - 1
-        else:
-            used_enumerations.append(antiferro_mag)
-            return self.random_antiferromagnetic(ferro_magmom, used_enumerations,
-                                            num_afm, num_tries - 1)
+        if stream == False:
+            self.get_magnetic_structures()
+
+    def random_antiferromagnetic(self, ferro_magmom, num_tries):
+        # distinct non-ferromagnetic magmom arrays from at most num_tries
+        # random draws; ends early once all spin patterns have been drawn
+        sampler = SpinPatternSampler(ferro_magmom, self.rng)
+        return sampler.sample(num_tries)
+
+    def exhaustive_antiferromagnetic(self, ferro_structure, ordering_index):
+        # all symmetry-distinct orderings, most antiparallel nearest neighbours
+        # first; None if there are too many magnetic sites to enumerate
+        enumerator = ExhaustiveOrderingEnumerator(ferro_structure, ordering_index)
+        if enumerator.too_large():
+            print('%s has %s magnetic sites, too many for exhaustive enumeration; '
+                  'sampling antiferromagnetic orderings at random'
+                  % (str(ferro_structure.formula), enumerator.num_magnetic))
+            return None
+        magmoms, antiparallel_counts = enumerator.enumerate(self.magnetization_dict['Max_antiferro'])
+        print('%s: %s antiferromagnetic orderings enumerated (antiparallel nearest neighbours: %s)'
+              % (str(ferro_structure.formula), len(magmoms),
+                 ', '.join(str(count) for count in antiparallel_counts)))
+        return magmoms
 
-    def afm_structures(self, structure_key, ferro_structure):
+    def afm_structures(self, structure_key, ferro_structure, exhaustive=False):
         # sets magnetism on a structures key and assigns to self.magnetized_structures_dict
         if set(ferro_structure.site_properties["magmom"]) == set([0]):
             print("%s is not magnetic; ferromagnetic structure to be run"
                     % str(ferro_structure.formula))
             self.magnetized_structures_dict[structure_key]['FM'] = ferro_structure
-            self.unique_magnetizations[structure_key]['FM'] = ferro_structure.site_properties["magmom"]
+            self.unique_magnetizations[structure_key]['FM'] = np.asarray(ferro_structure.site_properties["magmom"], dtype=float)
         else:
-            random_enumerations = self.random_antiferromagnetic(
-                ferro_structure.site_properties["magmom"], [],
-                self.magnetization_dict['Max_antiferro'], self.num_tries)
+            # orderings equivalent by symmetry or a global spin flip share a key;
+            # the ferromagnetic ordering is never an antiferromagnetic one
+            ordering_index = MagneticOrderingIndex(
+                ferro_structure, permutations=self.symmetry_cache.site_permutations(ferro_structure))
+            ordering_index.add(ferro_structure.site_properties["magmom"])
+            enumerations = None
+            if exhaustive == True:
+                enumerations = self.exhaustive_antiferromagnetic(ferro_structure, ordering_index)
+            if enumerations is None:
+                enumerations = self.random_antiferromagnetic(
+                    ferro_structure.site_properties["magmom"], self.num_tries)
             afm_enum_number = 1
             written = 0
-            for enumeration in random_enumerations:
-                antiferro_structure = ferro_structure.copy()
-                for magmom_idx in range(len(antiferro_structure.site_properties["magmom"])):
-                    antiferro_structure.replace(magmom_idx, antiferro_structure.species[magmom_idx], properties={'magmom': enumeration[magmom_idx] + 0})
-                # Check to make sure the structure isn't equal to any existing structures
-                exists = False
-                csm = CollinearMagneticStructureAnalyzer(antiferro_structure)
-                for existing_key in list(self.magnetized_structures_dict[structure_key]):
-                     matches = csm.matches_ordering(self.magnetized_structures_dict[structure_key][existing_key])
-                     if matches == True:
-                         exists = True
-                         break
-                     else:
-                         pass
-                # Write to the magnetism dictionary if the structure does not exist
-                if exists == False:
+            for enumeration in enumerations:
+                # Write to the magnetism dictionary if the ordering does not exist
+                if ordering_index.add(enumeration):
+                    antiferro_structure = with_magmoms(ferro_structure, enumeration)
                     afm_key = 'AFM' + str(afm_enum_number)
                     self.magnetized_structures_dict[structure_key][afm_key] = antiferro_structure
-                    self.unique_magnetizations[structure_key][afm_key] = antiferro_structure.site_properties["magmom"]
+                    self.unique_magnetizations[structure_key][afm_key] = np.asarray(enumeration, dtype=float) + 0
                     afm_enum_number += 1
                     written += 1
-                else:
-                    pass
 
                 # Break condition if Max_antiferro is reached
                 if written == self.magnetization_dict['Max_antiferro']:
@@ -250,56 +322,84 @@ class Magnetism:
         # assigns magnetism to structures. returns the magnetic get_structures
         # num_rand and num_tries only used for random antiferromagnetic assignment
         for structure in self.structures_dict.values():
-            collinear_object = CollinearMagneticStructureAnalyzer(
-                structure, make_primitive=False, overwrite_magmom_mode="replace_all")
-            ferro_structure = collinear_object.get_ferromagnetic_structure(make_primitive=False)
-            structure_key = str(structure.formula) + ' ' + str(self.structure_number)
-            self.unique_magnetizations[structure_key] = {}
-            self.magnetized_structures_dict[structure_key] = {}
-
-            if self.magnetization_dict['Scheme'] == 'preserve':
-                self.magnetized_structures_dict[structure_key]['preserve'] = structure
-                try:
-                    self.unique_magnetizations[structure_key]['preserve'] = structure.site_properties["magmom"]
-                except KeyError:
-                    self.unique_magnetizations[structure_key]['preserve'] = ferro_structure.site_properties["magmom"]
-
-            elif self.magnetization_dict['Scheme'] == 'FM':
-                self.magnetized_structures_dict[structure_key]['FM'] = ferro_structure
-                self.unique_magnetizations[structure_key]['FM'] = ferro_structure.site_properties["magmom"]
-
-            elif self.magnetization_dict['Scheme'] == 'AFM':
-                self.afm_structures(structure_key, ferro_structure)
-
-            elif self.magnetization_dict['Scheme'] == 'FM+AFM':
-                self.magnetized_structures_dict[structure_key]['FM'] = ferro_structure
-                self.unique_magnetizations[structure_key]['FM'] = ferro_structure.site_properties["magmom"]
-                self.afm_structures(structure_key, ferro_structure)
+            self.magnetize(structure)
+
+    def iter_magnetic_structures(self):
+        # (structure_key, {magnetism: structure}) one structure at a time;
+        # the magnetic structures are not kept once yielded, nor their
+        # unique magnetizations once the consumer asks for the next one
+        for input_key, structure in self.structures_dict:
+            structure_key = self.magnetize(structure)
+            yield structure_key, self.magnetized_structures_dict.pop(structure_key)
+            self.unique_magnetizations.pop(structure_key, None)
+
+    def magnetize(self, structure):
+        # magnetic structures of one structure; returns its structure_key
+        collinear_object = CollinearMagneticStructureAnalyzer(
+            structure, make_primitive=False, overwrite_magmom_mode="replace_all")
+        ferro_structure = collinear_object.get_ferromagnetic_structure(make_primitive=False)
+        structure_key = str(structure.formula) + ' ' + str(self.structure_number)
+        self.unique_magnetizations[structure_key] = {}
+        self.magnetized_structures_dict[structure_key] = {}
+
+        if self.magnetization_dict['Scheme'] == 'preserve':
+            self.magnetized_structures_dict[structure_key]['preserve'] = structure
+            try:
+                self.unique_magnetizations[structure_key]['preserve'] = np.asarray(structure.site_properties["magmom"], dtype=float)
+            except KeyError:
+                self.unique_magnetizations[structure_key]['preserve'] = np.asarray(ferro_structure.site_properties["magmom"], dtype=float)
 
-            else:
-                print('Magnetization Scheme %s not recognized; fatal error' % self.magnetization_dict['Scheme'])
-                sys.exit(1)
+        elif self.magnetization_dict['Scheme'] == 'FM':
+            self.magnetized_structures_dict[structure_key]['FM'] = ferro_structure
+            self.unique_magnetizations[structure_key]['FM'] = np.asarray(ferro_structure.site_properties["magmom"], dtype=float)
+
+        elif self.magnetization_dict['Scheme'] == 'AFM':
+            self.afm_structures(structure_key, ferro_structure)
+
+        elif self.magnetization_dict['Scheme'] == 'AFM-exhaustive':
+            self.afm_structures(structure_key, ferro_structure, exhaustive=True)
+
+        elif self.magnetization_dict['Scheme'] == 'FM+AFM':
+            self.magnetized_structures_dict[structure_key]['FM'] = ferro_structure
+            self.unique_magnetizations[structure_key]['FM'] = np.asarray(ferro_structure.site_properties["magmom"], dtype=float)
+            self.afm_structures(structure_key, ferro_structure)
+
+        else:
+            print('Magnetization Scheme %s not recognized; fatal error' % self.magnetization_dict['Scheme'])
+            sys.exit(1)
 
-            self.structure_number += 1
+        self.structure_number += 1
+        return structure_key
 
 
 class CalculationType:
-    def __init__(self, magnetic_structures_dict, calculation_dict):
+    # magnetic_structures_dict is {structure_key: {magnetism: structure}}, or
+    # with stream=True an iterable of (structure_key, {magnetism: structure})
+    # pairs that is only consumed through iter_calculation_structures()
+    def __init__(self, magnetic_structures_dict, calculation_dict, symmetry_cache=None,
+                 stream=False):
         self.magnetic_structures_dict = magnetic_structures_dict
         self.calculation_dict = calculation_dict
-        self.calculation_structures_dict = copy.deepcopy(self.magnetic_structures_dict)
+        self.calculation_structures_dict = {}
         self.unique_defect_sites = None
-
-        self.alter_structures()
+        # magnetic variants of a structure share one symmetry search
+        if symmetry_cache is None:
+            symmetry_cache = SymmetryCache()
+        self.symmetry_cache = symmetry_cache
+
+        if stream == False:
+            # new dictionaries, but the structures are shared with
+            # magnetic_structures_dict; none of them is modified here
+            for structure, magnetic_dict in self.magnetic_structures_dict.items():
+                self.calculation_structures_dict[structure] = dict(magnetic_dict)
+            self.alter_structures()
 
     def get_unique_sites(self, structure):
-        SGA = SpacegroupAnalyzer(structure)
-        symm_structure = SGA.get_symmetrized_structure()
-        equivalent_sites = symm_structure.as_dict()['equivalent_positions']
+        equivalent_sites = self.symmetry_cache.equivalent_indices(structure)
         unique_site_indices, site_counts = np.unique(equivalent_sites, return_counts=True)
         periodic_site_list = []
         for ind in unique_site_indices:
-            periodic_site_list.append(symm_structure.sites[ind])
+            periodic_site_list.append(structure.sites[ind])
 
         unique_site_dict = {}
         for i in range(len(periodic_site_list)):
@@ -308,60 +408,139 @@ class CalculationType:
             unique_site_dict[periodic_site_list[i]]['Equivalent Sites'] = site_counts[i]
         return unique_site_dict
 
+    def vacancy_structure(self, base_structure, index):
+        # base_structure without the site at index, built once from its site
+        # data instead of deep-copying base_structure and removing the site
+        keep = [i for i in range(len(base_structure)) if i != index]
+        site_properties = {}
+        for key, values in base_structure.site_properties.items():
+            site_properties[key] = [values[i] for i in keep]
+        return Structure(base_structure.lattice, [base_structure[i].species for i in keep],
+                         base_structure.frac_coords[keep],
+                         site_properties=site_properties or None)
+
     def alter_structures(self):
+        if self.calculation_dict['Type'] == 'defect':
+            self.unique_defect_sites = {}
+        elif self.calculation_dict['Type'] != 'bulk':
+            print('Calculation Type %s not recognized; fatal error' % self.calculation_dict['Type'])
+            sys.exit(1)
+        for structure in self.calculation_structures_dict.keys():
+            self.alter_structure(structure, self.calculation_structures_dict[structure])
+
+    def iter_calculation_structures(self):
+        # (structure_key, {magnetism: {calculation key: structure}}) one
+        # structure at a time; the streamed magnetic structures are altered
+        # in place since nothing else holds them, and a structure's unique
+        # defect sites are dropped once its leaves have been written
+        if self.calculation_dict['Type'] == 'defect':
+            self.unique_defect_sites = {}
+        for structure, magnetic_dict in self.magnetic_structures_dict:
+            yield structure, self.alter_structure(structure, magnetic_dict)
+            if self.unique_defect_sites is not None:
+                self.unique_defect_sites.pop(structure, None)
+
+    def alter_structure(self, structure, magnetic_dict):
+        # replaces each magnetic structure of one structure key with its
+        # {calculation key: structure} dictionary
         if self.calculation_dict['Type'] == 'bulk':
-            for structure in self.calculation_structures_dict.keys():
-                for magnetism in self.calculation_structures_dict[structure].keys():
-                    base_structure = self.calculation_structures_dict[structure][magnetism]
-                    bulk_dict = {}
-                    bulk_key = str(base_structure.formula)
-                    bulk_dict[bulk_key] = base_structure
-                    self.calculation_structures_dict[structure][magnetism] = bulk_dict
+            for magnetism in magnetic_dict.keys():
+                base_structure = magnetic_dict[magnetism]
+                bulk_dict = {}
+                bulk_key = str(base_structure.formula)
+                bulk_dict[bulk_key] = base_structure
+                magnetic_dict[magnetism] = bulk_dict
 
         elif self.calculation_dict['Type'] == 'defect':
-            self.unique_defect_sites = {}
             defect_element = self.calculation_dict['Defect']
-            for structure in self.calculation_structures_dict.keys():
-                for magnetism in self.calculation_structures_dict[structure].keys():
-                    base_structure = self.calculation_structures_dict[structure][magnetism]
-                    unique_site_dict = self.get_unique_sites(base_structure)
-
-                    defect_dict = {}
-                    # defect_key = str(defect_element) + ' Defect '
-                    defect_number = 1
-                    unique_defects_dict = {}
-                    for periodic_site in unique_site_dict.keys():
-                        #defect_structure = copy.deepcopy(rescaled_structure)
-                        defect_structure = copy.deepcopy(base_structure) # Fix this so re-scaling can be performed here
-                        if Element(periodic_site.as_dict()['species'][0]['element']) == Element(defect_element):
-                            unique_defects_dict[periodic_site] = unique_site_dict[periodic_site]
-                            defect_structure.remove_sites([unique_site_dict[periodic_site]['Index']])
-                            defect_key = str(defect_structure.formula)
-                            defect_dict[defect_key + ' ' + str(defect_number)] = defect_structure
-                            unique_defects_dict[periodic_site]['Run Directory Name'] = str(defect_key + ' ' + str(defect_number)).replace(' ', '_')
-                            defect_number += 1
-                        else:
-                            continue
-                    self.calculation_structures_dict[structure][magnetism] = defect_dict
-                    if unique_defects_dict != {}:
-                        self.unique_defect_sites[structure] = unique_defects_dict
+            for magnetism in magnetic_dict.keys():
+                base_structure = magnetic_dict[magnetism]
+                unique_site_dict = self.get_unique_sites(base_structure)
+
+                defect_dict = {}
+                # defect_key = str(defect_element) + ' Defect '
+                defect_number = 1
+                unique_defects_dict = {}
+                for periodic_site in unique_site_dict.keys():
+                    # only sites of the defect element get a (vacancy) structure
+                    if Element(periodic_site.specie.symbol) == Element(defect_element):
+                        unique_defects_dict[periodic_site] = unique_site_dict[periodic_site]
+                        defect_structure = self.vacancy_structure(
+                            base_structure, unique_site_dict[periodic_site]['Index'])
+                        defect_key = str(defect_structure.formula)
+                        defect_dict[defect_key + ' ' + str(defect_number)] = defect_structure
+                        unique_defects_dict[periodic_site]['Run Directory Name'] = str(defect_key + ' ' + str(defect_number)).replace(' ', '_')
+                        defect_number += 1
+                    else:
+                        continue
+                magnetic_dict[magnetism] = defect_dict
+                if unique_defects_dict != {}:
+                    self.unique_defect_sites[structure] = unique_defects_dict
 
         else:
             print('Calculation Type %s not recognized; fatal error' % self.calculation_dict['Type'])
             sys.exit(1)
+        return magnetic_dict
+
+
+# shipped auxiliary files, used unless Auxiliary_Files has one of the same Name
+VDW_KERNEL = {'Source': os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+                                     'extra_vasp_files', 'vdw_kernel.bindat'),
+              'Name': 'vdw_kernel.bindat', 'INCAR_Tag': 'LUSE_VDW'}
+DEFAULT_AUXILIARY_FILES = [VDW_KERNEL]
+
+# WriteVaspFiles of the current worker process, set by init_leaf_writer
+LEAF_WRITER = None
+
+
+def init_leaf_writer(writer):
+    global LEAF_WRITER
+    LEAF_WRITER = writer
+
+
+def write_leaf_in_worker(leaf):
+    return LEAF_WRITER.write_leaf(*leaf)
 
 
 class WriteVaspFiles:
+    # calculation_structures_dict is {structure_key: {magnetism: {calculation
+    # key: structure}}} or an iterable of such (structure_key, dictionary)
+    # pairs, e.g. CalculationType.iter_calculation_structures(); each
+    # structure's directories are written as soon as it is reached
     def __init__(self, calculation_structures_dict, calculation_dict,
-                 relaxation_set, incar_tags, kpoints):
+                 relaxation_set, incar_tags, kpoints, workers=1, link_mode='hardlink',
+                 auxiliary_files=None):
         self.calculation_structures_dict = calculation_structures_dict
         self.calculation_dict = calculation_dict
         self.relaxation_set = relaxation_set
         self.incar_tags = incar_tags
         self.kpoints = kpoints
+        # with workers > 1 the calculation directories are written by a
+        # process pool; the output does not depend on the number of workers
+        self.workers = workers
+        self.relax_set = self.get_relax_set()
+        self.first_step = self.get_0_step()
+        # each distinct POTCAR is assembled once and linked into the job directories
+        self.potcar_cache = PotcarCache(
+            os.path.join(self.calculation_dict['Type'], POTCAR_CACHE_DIR), link_mode)
+        # auxiliary files (e.g. the vdW kernel) are stored once and linked too
+        self.auxiliary_files = list(auxiliary_files or [])
+        names = [entry['Name'] for entry in self.auxiliary_files]
+        for entry in DEFAULT_AUXILIARY_FILES:
+            if entry['Name'] not in names:
+                self.auxiliary_files.append(entry)
+        self.shared_files = SharedFileStore(
+            os.path.join(self.calculation_dict['Type'], SHARED_FILES_DIR), link_mode)
 
         self.write_vasp_inputs()
 
+    def __getstate__(self):
+        # worker processes only need the settings, not the structures
+        state = dict(self.__dict__)
+        state['calculation_structures_dict'] = None
+        state['relax_set'] = None
+        return state
+
     def check_directory_existence(self, directory):
         try:
             os.mkdir(directory)
@@ -476,59 +655,126 @@ class WriteVaspFiles:
         elif self.calculation_dict['Type'] == 'defect':
             calc = str(self.calculation_dict['Defect']) + ' defect'
 
-        relax_set = self.get_relax_set()
-        first_step = self.get_0_step()
-
         top_level_dirname = self.calculation_dict['Type']
         self.check_directory_existence(top_level_dirname)
-        for structure in self.calculation_structures_dict.keys():
-            structure_dirname = structure.replace(' ', '_')
-            structure_dir_path = os.path.join(top_level_dirname, structure_dirname)
-            for magnetism in self.calculation_structures_dict[structure].keys():
-                magnetism_dirname = magnetism.replace(' ', '_')
-                magnetism_dir_path = os.path.join(structure_dir_path, magnetism_dirname)
-                if not bool(self.calculation_structures_dict[structure][magnetism]) == True:
-                    # empty dictionary check; sometimes occurs with defect calcs
-                    print('%s not compatible with %s calculation' % (structure, calc))
-                    continue
-                else:
-                    for calculation_type in self.calculation_structures_dict[structure][magnetism].keys():
-                        calculation_type_dirname = calculation_type.replace(' ', '_')
-                        calculation_type_dir_path = os.path.join(magnetism_dir_path, calculation_type_dirname)
-                        write_structure = self.calculation_structures_dict[structure][magnetism][calculation_type]
-                        if type(write_structure) == Structure:
-                            kpoints_object = self.get_kpoints_object(first_step, write_structure)
-                            self.check_directory_existence(structure_dir_path)
-                            self.check_directory_existence(magnetism_dir_path)
-                            self.check_directory_existence(calculation_type_dir_path)
-                            try:
-                                user_incar_settings = self.incar_tags["0 Step"]
-                            except:
-                                user_incar_settings = None
-                            v = relax_set(write_structure,
-                                          user_incar_settings=user_incar_settings,
-                                          user_kpoints_settings=kpoints_object)
-                            v.write_input(calculation_type_dir_path)
-
-                            with open(os.path.join(calculation_type_dir_path,'CONVERGENCE'),'w') as f:
-                                for line in self.format_convergence_file(write_structure):
-                                    f.write("%s\n" % line)
-                                f.close()
-
-                            if 'LSORBIT' in user_incar_settings or 'LNONCOLLINEAR' in user_incar_settings:
-                                if user_incar_settings['LSORBIT'] == True or user_incar_settings['LNONCOLLINEAR'] == True:
-                                    incar_file_path = os.path.join(calculation_type_dir_path, 'INCAR')
-                                    convergence_file_path = os.path.join(calculation_type_dir_path, 'CONVERGENCE')
-                                    rewrite_line = self.rewrite_magmom(incar_file_path, write_structure.site_properties['magmom'])
-                                    self.insert_string(convergence_file_path, rewrite_line)
-                                    self.remove_line(incar_file_path, 'MAGMOM')
-                                    #self.replace_string(incar_file_path, 'MAGMOM', rewrite_line + '\n')
-
-                            if 'LUSE_VDW' in user_incar_settings:
-                                if user_incar_settings['LUSE_VDW'] == True: # Van der Waals kernel needed
-                                    file_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
-                                    shutil.copyfile(os.path.join(file_path, 'extra_vasp_files/vdw_kernel.bindat'), os.path.join(calculation_type_dir_path, 'vdw_kernel.bindat'))
-
-                        else:
-                            print('Not valid structure type')
-                            continue
+        executor = None
+        if self.workers > 1:
+            executor = ProcessPoolExecutor(max_workers=self.workers,
+                                           initializer=init_leaf_writer, initargs=(self,))
+        errors = []
+        num_leaves = 0
+        try:
+            if isinstance(self.calculation_structures_dict, dict):
+                # every directory is planned before any is written
+                leaves = []
+                for structure, structure_dict in self.calculation_structures_dict.items():
+                    leaves += self.plan_structure_leaves(structure, structure_dict,
+                                                         top_level_dirname, calc)
+                errors += self.write_leaves(leaves, executor)
+                num_leaves += len(leaves)
+            else:
+                # streamed structures are written one structure at a time
+                for structure, structure_dict in self.calculation_structures_dict:
+                    leaves = self.plan_structure_leaves(structure, structure_dict,
+                                                        top_level_dirname, calc)
+                    errors += self.write_leaves(leaves, executor)
+                    num_leaves += len(leaves)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        if errors:
+            print('%s of %s directories not written:\n  %s' % (len(errors), num_leaves, '\n  '.join(errors)))
+
+    def plan_structure_leaves(self, structure, structure_dict, top_level_dirname, calc):
+        # creates the directories of one structure key and returns its
+        # (calculation directory path, structure) leaves in order
+        leaves = []
+        structure_dirname = structure.replace(' ', '_')
+        structure_dir_path = os.path.join(top_level_dirname, structure_dirname)
+        for magnetism in structure_dict.keys():
+            magnetism_dirname = magnetism.replace(' ', '_')
+            magnetism_dir_path = os.path.join(structure_dir_path, magnetism_dirname)
+            if not bool(structure_dict[magnetism]) == True:
+                # empty dictionary check; sometimes occurs with defect calcs
+                print('%s not compatible with %s calculation' % (structure, calc))
+                continue
+            else:
+                for calculation_type in structure_dict[magnetism].keys():
+                    calculation_type_dirname = calculation_type.replace(' ', '_')
+                    calculation_type_dir_path = os.path.join(magnetism_dir_path, calculation_type_dirname)
+                    write_structure = structure_dict[magnetism][calculation_type]
+                    if type(write_structure) == Structure:
+                        self.check_directory_existence(structure_dir_path)
+                        self.check_directory_existence(magnetism_dir_path)
+                        self.check_directory_existence(calculation_type_dir_path)
+                        leaves.append((calculation_type_dir_path, write_structure))
+                    else:
+                        print('Not valid structure type')
+                        continue
+        return leaves
+
+    def write_leaves(self, leaves, executor=None):
+        # error messages of the leaves that failed, in the order of leaves
+        if executor is None:
+            results = [self.write_leaf(*leaf) for leaf in leaves]
+        else:
+            results = executor.map(write_leaf_in_worker, leaves,
+                                   chunksize=max(1, len(leaves) // (self.workers * 4)))
+        return [error for error in results if error is not None]
+
+    def write_leaf(self, calculation_type_dir_path, write_structure):
+        # writes the inputs of one calculation directory; returns None or an
+        # error message so one bad directory does not stop the others
+        try:
+            self.write_leaf_inputs(calculation_type_dir_path, write_structure)
+        except Exception as e:
+            return '%s: %s' % (calculation_type_dir_path, e)
+        return None
+
+    def write_leaf_inputs(self, calculation_type_dir_path, write_structure):
+        if self.relax_set is None:
+            self.relax_set = self.get_relax_set()
+        kpoints_object = self.get_kpoints_object(self.first_step, write_structure)
+        try:
+            user_incar_settings = self.incar_tags["0 Step"]
+        except:
+            user_incar_settings = None
+        v = self.relax_set(write_structure,
+                           user_incar_settings=user_incar_settings,
+                           user_kpoints_settings=kpoints_object)
+        # POTCAR.spec in place of the POTCAR, which comes from the cache
+        v.write_input(calculation_type_dir_path, potcar_spec=True)
+        os.remove(os.path.join(calculation_type_dir_path, 'POTCAR.spec'))
+        self.potcar_cache.place(v.potcar_functional, v.potcar_symbols,
+                                os.path.join(calculation_type_dir_path, 'POTCAR'),
+                                lambda: v.potcar)
+
+        with open(os.path.join(calculation_type_dir_path,'CONVERGENCE'),'w') as f:
+            for line in self.format_convergence_file(write_structure):
+                f.write("%s\n" % line)
+            f.close()
+
+        if 'LSORBIT' in user_incar_settings or 'LNONCOLLINEAR' in user_incar_settings:
+            if user_incar_settings['LSORBIT'] == True or user_incar_settings['LNONCOLLINEAR'] == True:
+                incar_file_path = os.path.join(calculation_type_dir_path, 'INCAR')
+                convergence_file_path = os.path.join(calculation_type_dir_path, 'CONVERGENCE')
+                rewrite_line = self.rewrite_magmom(incar_file_path, write_structure.site_properties['magmom'])
+                self.insert_string(convergence_file_path, rewrite_line)
+                self.remove_line(incar_file_path, 'MAGMOM')
+                #self.replace_string(incar_file_path, 'MAGMOM', rewrite_line + '\n')
+
+        self.place_auxiliary_files(calculation_type_dir_path, user_incar_settings)
+
+    def place_auxiliary_files(self, calculation_type_dir_path, user_incar_settings):
+        # files whose INCAR_Tag is unset or True in the "0 Step" INCAR tags,
+        # e.g. the vdW kernel when LUSE_VDW = True; their sha256 digests go
+        # to the manifest checked by rerun_workflow.py before submission
+        digests = {}
+        for entry in self.auxiliary_files:
+            tag = entry['INCAR_Tag']
+            if tag is not None and (not user_incar_settings or user_incar_settings.get(tag) != True):
+                continue
+            digests[entry['Name']] = self.shared_files.place(
+                entry['Source'], os.path.join(calculation_type_dir_path, entry['Name']))
+        if digests:
+            write_manifest(calculation_type_dir_path, digests)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import hashlib
+from workflow_management.auxiliaryfiles import file_digest
+
+# tried in this order from the chosen mode on; copy always works
+LINK_MODES = ('hardlink', 'symlink', 'copy')
+POTCAR_CACHE_DIR = '.potcar_cache'
+SHARED_FILES_DIR = '.shared_files'
+
+
+def link_or_copy(source, destination, mode='hardlink'):
+    # places source at destination as a hardlink, falling back to an
+    # (absolute) symlink and then to a copy; returns the method used
+    source = os.path.abspath(source)
+    if os.path.lexists(destination):
+        os.remove(destination)
+    for method in LINK_MODES[LINK_MODES.index(mode):]:
+        try:
+            if method == 'hardlink':
+                os.link(source, destination)
+            elif method == 'symlink':
+                os.symlink(source, destination)
+            else:
+                shutil.copyfile(source, destination)
+            return method
+        except OSError:
+            if method == 'copy':
+                raise
+    return None
+
+
+class PotcarCache:
+    # Assembles each distinct POTCAR (functional and ordered symbols) once
+    # under cache_dir; job directories get a link to it, or a copy when
+    # linking is not possible. Safe to share between processes: a POTCAR is
+    # written to a temporary file and renamed into place.
+    def __init__(self, cache_dir, mode='hardlink'):
+        if mode not in LINK_MODES:
+            raise ValueError('Link mode %s not one of %s' % (mode, ', '.join(LINK_MODES)))
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.mode = mode
+        self.known = set()
+
+    def potcar_path(self, functional, symbols):
+        # symbols such as Fe_pv contain underscores, so the name is a digest
+        spec = '%s %s' % (functional, ' '.join(symbols))
+        digest = hashlib.sha1(spec.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.cache_dir, digest, 'POTCAR')
+
+    def get(self, functional, symbols, build_potcar):
+        # path of the cached POTCAR; build_potcar() returns a pymatgen Potcar
+        # and is only called if this POTCAR has not been assembled yet
+        path = self.potcar_path(functional, symbols)
+        if path not in self.known and not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = '%s.%s.tmp' % (path, os.getpid())
+            build_potcar().write_file(tmp_path)
+            with open(os.path.join(os.path.dirname(path), 'POTCAR.spec'), 'w') as f:
+                f.write('%s\n%s\n' % (functional, '\n'.join(symbols)))
+            os.replace(tmp_path, path)
+        self.known.add(path)
+        return path
+
+    def place(self, functional, symbols, destination, build_potcar):
+        return link_or_copy(self.get(functional, symbols, build_potcar), destination, self.mode)
+
+
+class SharedFileStore:
+    # Static files needed by many job directories, e.g. the vdW kernel. Each
+    # source is copied once into store_dir under its sha256 digest, so jobs
+    # do not depend on the source staying put, and placed into job
+    # directories with link_or_copy.
+    def __init__(self, store_dir, mode='hardlink'):
+        if mode not in LINK_MODES:
+            raise ValueError('Link mode %s not one of %s' % (mode, ', '.join(LINK_MODES)))
+        self.store_dir = os.path.abspath(store_dir)
+        self.mode = mode
+        self.stored = {}
+
+    def add(self, source):
+        # (stored path, sha256) of source
+        source = os.path.abspath(source)
+        if source not in self.stored:
+            digest = file_digest(source)
+            path = os.path.join(self.store_dir, digest)
+            if not os.path.exists(path):
+                os.makedirs(self.store_dir, exist_ok=True)
+                tmp_path = '%s.%s.tmp' % (path, os.getpid())
+                shutil.copyfile(source, tmp_path)
+                os.replace(tmp_path, path)
+            self.stored[source] = (path, digest)
+        return self.stored[source]
+
+    def place(self, source, destination):
+        # returns the sha256 of the placed file
+        path, digest = self.add(source)
+        link_or_copy(path, destination, self.mode)
+        return digest
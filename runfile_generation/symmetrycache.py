@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+import hashlib
+import numpy as np
+from runfile_generation.magneticorderings import site_permutations
+
+FINGERPRINT_DECIMALS = 6
+# geometries kept when generating inputs one structure at a time
+STREAM_CACHE_SIZE = 4
+
+
+def structure_fingerprint(structure, decimals=FINGERPRINT_DECIMALS):
+    # digest of the lattice, species and fractional coordinates; site
+    # properties such as magmom are left out, so magnetic variants of one
+    # geometry share a fingerprint
+    digest = hashlib.sha1()
+    lattice = np.round(np.asarray(structure.lattice.matrix, dtype=float), decimals) + 0.0
+    frac_coords = np.round(np.asarray(structure.frac_coords, dtype=float) % 1.0, decimals) % 1.0 + 0.0
+    digest.update(lattice.tobytes())
+    digest.update(' '.join(str(specie) for specie in structure.species).encode('utf-8'))
+    digest.update(frac_coords.tobytes())
+    return digest.hexdigest()
+
+
+class SymmetryCache:
+    # Space group site permutations per geometry fingerprint, so one symmetry
+    # search serves every magnetic variant of a structure. Like the
+    # SpacegroupAnalyzer it replaces, magmoms are ignored by default; with
+    # magnetic_symmetry=True a variant only uses the operations that map its
+    # magmoms onto themselves, or onto their global spin flip (time reversal),
+    # which splits sites into more, and so writes more, defect structures.
+    # With max_size only the most recently added geometries are kept.
+    def __init__(self, symprec=0.01, max_size=None, magnetic_symmetry=False):
+        self.symprec = symprec
+        self.max_size = max_size
+        self.magnetic_symmetry = magnetic_symmetry
+        self.permutations = {}
+        self.num_analyses = 0
+
+    def site_permutations(self, structure):
+        key = structure_fingerprint(structure)
+        if key not in self.permutations:
+            if self.max_size is not None and len(self.permutations) >= self.max_size:
+                # dictionaries keep insertion order; drop the oldest geometry
+                del self.permutations[next(iter(self.permutations))]
+            self.permutations[key] = site_permutations(structure, self.symprec)
+            self.num_analyses += 1
+        return self.permutations[key]
+
+    def magnetic_permutations(self, structure):
+        # the permutations that keep the magmoms, or flip all of them
+        permutations = self.site_permutations(structure)
+        magmoms = structure.site_properties.get('magmom')
+        if magmoms is None:
+            return permutations
+        magmoms = np.asarray(magmoms, dtype=float)
+        images = magmoms[permutations]
+        preserved = np.isclose(images, magmoms[None, :]).all(axis=1) | \
+            np.isclose(images, -magmoms[None, :]).all(axis=1)
+        return permutations[preserved]
+
+    def equivalent_indices(self, structure):
+        # for each site the smallest index of its symmetry orbit, like the
+        # equivalent_positions of a SymmetrizedStructure
+        if self.magnetic_symmetry:
+            return self.magnetic_permutations(structure).min(axis=0)
+        return self.site_permutations(structure).min(axis=0)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+import itertools
+import unittest
+import numpy as np
+from runfile_generation.magneticorderings import (pattern_keys, SpinPatternSampler,
+                                                  MagneticOrderingIndex,
+                                                  ExhaustiveOrderingEnumerator)
+
+
+class RingStructure:
+    # num_sites magnetic sites 2 A apart on a periodic chain, plus an
+    # optional nonmagnetic site; all the orderings code needs of a Structure
+    def __init__(self, magmoms):
+        self.site_properties = {'magmom': list(magmoms)}
+        self.num_magnetic = sum(1 for magmom in magmoms if magmom != 0)
+
+    def __len__(self):
+        return len(self.site_properties['magmom'])
+
+    @property
+    def distance_matrix(self):
+        positions = np.arange(len(self))
+        steps = np.abs(positions[:, None] - positions[None, :]) % self.num_magnetic
+        return 2.0 * np.minimum(steps, self.num_magnetic - steps)
+
+
+def ring_permutations(num_sites, reflections=False, extra_sites=0):
+    # translations (and reflections) of the ring; extra sites stay in place
+    rotations = [np.roll(np.arange(num_sites), -shift) for shift in range(num_sites)]
+    if reflections:
+        rotations += [rotation[::-1] for rotation in rotations]
+    fixed = np.arange(num_sites, num_sites + extra_sites)
+    return np.array([np.concatenate([rotation, fixed]) for rotation in rotations])
+
+
+class TestMagneticOrderings(unittest.TestCase):
+    def test_pattern_keys(self):
+        keys = pattern_keys([[1, 0, 1], [1, 0, 1], [0, 1, 1]])
+        self.assertEqual(keys[0], keys[1])
+        self.assertNotEqual(keys[0], keys[2])
+
+    def test_sampler(self):
+        sampler = SpinPatternSampler([5, 5, 0, 5], rng=np.random.default_rng(0), batch_size=4)
+        patterns = [tuple(magmom) for magmom in sampler.sample(1000)]
+        # every pattern but the ferromagnetic one, once, with the O site untouched
+        self.assertEqual(len(patterns), 7)
+        self.assertEqual(len(set(patterns)), 7)
+        self.assertNotIn((5, 5, 0, 5), patterns)
+        self.assertTrue(all(pattern[2] == 0 for pattern in patterns))
+        self.assertTrue(sampler.exhausted())
+        self.assertEqual(list(sampler.sample(10)), [])
+
+    def test_canonical_keys(self):
+        index = MagneticOrderingIndex(RingStructure([5, 5, 5, 5]),
+                                      permutations=ring_permutations(4))
+        key = index.canonical_key
+        # translations and a global spin flip give the same key
+        self.assertEqual(key([5, -5, 5, -5]), key([-5, 5, -5, 5]))
+        self.assertEqual(key([5, 5, -5, -5]), key([5, -5, -5, 5]))
+        self.assertEqual(key([5, 5, 5, -5]), key([-5, 5, -5, -5]))
+        self.assertNotEqual(key([5, -5, 5, -5]), key([5, 5, -5, -5]))
+        self.assertTrue(index.add([5, 5, -5, -5]))
+        self.assertFalse(index.add([-5, 5, 5, -5]))
+        self.assertTrue(index.add([5, -5, 5, -5]))
+
+    def test_nonmagnetic_sites_ignored(self):
+        index = MagneticOrderingIndex(RingStructure([5, 5, 5, 5, 0]),
+                                      permutations=ring_permutations(4, extra_sites=1))
+        self.assertEqual(index.canonical_key([5, -5, 5, -5, 0]),
+                         index.canonical_key([-5, 5, -5, 5, 0]))
+        self.assertEqual(index.magnetic_permutations().shape, (4, 4))
+
+    def test_enumerator_matches_canonical_keys(self):
+        for num_sites, reflections in ((4, False), (6, True), (8, False)):
+            structure = RingStructure([5] * num_sites)
+            index = MagneticOrderingIndex(structure,
+                                          permutations=ring_permutations(num_sites, reflections))
+            enumerator = ExhaustiveOrderingEnumerator(structure, index, batch_size=16)
+            magmoms, counts = enumerator.enumerate(1000)
+            keys = set(index.canonical_key(pattern)
+                       for pattern in itertools.product([5, -5], repeat=num_sites))
+            # every ordering but the ferromagnetic one, once each
+            self.assertEqual(len(magmoms), len(keys) - 1)
+            self.assertTrue(all(index.add(magmom) for magmom in magmoms))
+            self.assertTrue(index.add([5] * num_sites))
+            # most antiparallel neighbours first; the Neel ordering has all of them
+            self.assertEqual(counts.tolist(), sorted(counts.tolist(), reverse=True))
+            self.assertEqual(counts[0], num_sites)
+
+    def test_enumerator_limit(self):
+        structure = RingStructure([5] * 8)
+        index = MagneticOrderingIndex(structure, permutations=ring_permutations(8))
+        magmoms, counts = ExhaustiveOrderingEnumerator(structure, index).enumerate(2)
+        self.assertEqual(len(magmoms), 2)
+        self.assertEqual(np.abs(magmoms).tolist(), [[5] * 8] * 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+from runfile_generation.sharedfiles import link_or_copy, PotcarCache, SharedFileStore
+
+
+class FakePotcar:
+    # all PotcarCache needs from a pymatgen Potcar
+    def __init__(self, symbols):
+        self.symbols = symbols
+
+    def write_file(self, path):
+        with open(path, 'w') as f:
+            f.write('POTCAR %s\n' % ' '.join(self.symbols))
+
+
+def refuse(*args):
+    raise OSError(18, 'Invalid cross-device link')
+
+
+class TestLinkOrCopy(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.tmp.name, 'source')
+        with open(self.source, 'w') as f:
+            f.write('kernel')
+        self.destination = os.path.join(self.tmp.name, 'destination')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_hardlink(self):
+        self.assertEqual(link_or_copy(self.source, self.destination), 'hardlink')
+        self.assertEqual(os.stat(self.source).st_nlink, 2)
+        self.assertTrue(os.path.samefile(self.source, self.destination))
+
+    def test_replaces_destination(self):
+        with open(self.destination, 'w') as f:
+            f.write('old')
+        link_or_copy(self.source, self.destination)
+        with open(self.destination) as f:
+            self.assertEqual(f.read(), 'kernel')
+
+    def test_symlink_fallback(self):
+        with mock.patch('os.link', refuse):
+            self.assertEqual(link_or_copy(self.source, self.destination), 'symlink')
+        self.assertEqual(os.readlink(self.destination), os.path.abspath(self.source))
+
+    def test_copy_fallback(self):
+        with mock.patch('os.link', refuse), mock.patch('os.symlink', refuse):
+            self.assertEqual(link_or_copy(self.source, self.destination), 'copy')
+        self.assertFalse(os.path.islink(self.destination))
+        self.assertEqual(os.stat(self.source).st_nlink, 1)
+        self.assertEqual(os.stat(self.destination).st_nlink, 1)
+        with open(self.destination) as f:
+            self.assertEqual(f.read(), 'kernel')
+
+    def test_copy_mode(self):
+        with mock.patch('os.link') as link:
+            self.assertEqual(link_or_copy(self.source, self.destination, 'copy'), 'copy')
+        link.assert_not_called()
+
+
+class TestPotcarCache(unittest.TestCase):
+    def test_assembled_once(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = PotcarCache(os.path.join(tmp, '.potcar_cache'))
+            builds = []
+
+            def build_potcar():
+                builds.append(1)
+                return FakePotcar(['Ni_pv', 'O'])
+            for job in ('a', 'b', 'c'):
+                os.makedirs(os.path.join(tmp, job))
+                method = cache.place('PBE_54', ['Ni_pv', 'O'], os.path.join(tmp, job, 'POTCAR'),
+                                     build_potcar)
+                self.assertEqual(method, 'hardlink')
+            self.assertEqual(len(builds), 1)
+            path = cache.get('PBE_54', ['Ni_pv', 'O'], build_potcar)
+            self.assertEqual(os.stat(path).st_nlink, 4)
+            with open(os.path.join(tmp, 'b', 'POTCAR')) as f:
+                self.assertEqual(f.read(), 'POTCAR Ni_pv O\n')
+            # a different functional or symbol order is another POTCAR
+            self.assertNotEqual(cache.potcar_path('PBE', ['Ni_pv', 'O']), path)
+            self.assertNotEqual(cache.potcar_path('PBE_54', ['O', 'Ni_pv']), path)
+            # a new cache (e.g. another process) finds the assembled POTCAR
+            PotcarCache(cache.cache_dir).get('PBE_54', ['Ni_pv', 'O'], build_potcar)
+            self.assertEqual(len(builds), 1)
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            PotcarCache('.potcar_cache', 'reflink')
+
+
+class TestSharedFileStore(unittest.TestCase):
+    def test_place(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, 'vdw_kernel.bindat')
+            with open(source, 'w') as f:
+                f.write('kernel')
+            store = SharedFileStore(os.path.join(tmp, '.shared_files'))
+            digests = set()
+            for job in ('a', 'b'):
+                os.makedirs(os.path.join(tmp, job))
+                digests.add(store.place(source, os.path.join(tmp, job, 'vdw_kernel.bindat')))
+            path, digest = store.add(source)
+            self.assertEqual(digests, {digest})
+            self.assertEqual(os.path.basename(path), digest)
+            # the stored copy and two links; the source is not linked
+            self.assertEqual(os.stat(path).st_nlink, 3)
+            self.assertEqual(os.stat(source).st_nlink, 1)
+
+    def test_copy_fallback(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, 'vdw_kernel.bindat')
+            with open(source, 'w') as f:
+                f.write('kernel')
+            store = SharedFileStore(os.path.join(tmp, '.shared_files'), 'symlink')
+            destination = os.path.join(tmp, 'vdw_kernel.bindat.job')
+            with mock.patch('os.symlink', refuse):
+                store.place(source, destination)
+            self.assertFalse(os.path.islink(destination))
+            self.assertEqual(os.stat(store.add(source)[0]).st_nlink, 1)
+            with open(destination) as f:
+                self.assertEqual(f.read(), 'kernel')
+
+
+if __name__ == '__main__':
+    unittest.main()
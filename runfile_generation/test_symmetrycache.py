@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+import unittest
+from unittest import mock
+from types import SimpleNamespace
+import numpy as np
+from runfile_generation.symmetrycache import SymmetryCache, structure_fingerprint
+
+try:
+    from pymatgen.core.structure import Structure
+    from pymatgen.core.lattice import Lattice
+    from pymatgen.symmetry.analyzer import SpacegroupAnalyzer
+    HAS_PYMATGEN = True
+except ImportError:
+    HAS_PYMATGEN = False
+
+
+def chain_structure(magmoms):
+    # four sites along a, related by translations of a/4
+    frac_coords = np.array([[i / 4.0, 0.0, 0.0] for i in range(4)])
+    return SimpleNamespace(lattice=SimpleNamespace(matrix=np.diag([8.0, 5.0, 5.0])),
+                           frac_coords=frac_coords, species=['Ni'] * 4,
+                           site_properties={'magmom': magmoms})
+
+
+def chain_cache(magmoms, magnetic_symmetry):
+    # the translation permutations are seeded so no symmetry search is needed
+    structure = chain_structure(magmoms)
+    cache = SymmetryCache(magnetic_symmetry=magnetic_symmetry)
+    cache.permutations[structure_fingerprint(structure)] = np.array(
+        [np.roll(np.arange(4), -shift) for shift in range(4)])
+    return cache, structure
+
+
+class TestSymmetryCache(unittest.TestCase):
+    def test_fingerprint_ignores_magmoms(self):
+        self.assertEqual(structure_fingerprint(chain_structure([1, 1, 1, 1])),
+                         structure_fingerprint(chain_structure([1, -1, 1, -1])))
+
+    def test_magmoms_ignored_by_default(self):
+        cache, structure = chain_cache([1, 1, -1, -1], False)
+        self.assertEqual(cache.equivalent_indices(structure).tolist(), [0, 0, 0, 0])
+
+    def test_magnetic_symmetry(self):
+        # a shift by a/2 flips every spin of the up-up-down-down chain
+        cache, structure = chain_cache([1, 1, -1, -1], True)
+        self.assertEqual(cache.equivalent_indices(structure).tolist(), [0, 1, 0, 1])
+
+    def test_time_reversal(self):
+        # every shift maps up-down-up-down onto itself or its spin flip
+        cache, structure = chain_cache([1, -1, 1, -1], True)
+        self.assertEqual(cache.equivalent_indices(structure).tolist(), [0, 0, 0, 0])
+
+    def test_max_size(self):
+        # only the most recently added geometry is kept
+        cache = SymmetryCache(max_size=1)
+        identity = np.arange(4)[None, :]
+        with mock.patch('runfile_generation.symmetrycache.site_permutations',
+                        return_value=identity) as search:
+            first, second = chain_structure([1, 1, 1, 1]), chain_structure([1, 1, 1, 1])
+            second.frac_coords = second.frac_coords + 0.1
+            cache.site_permutations(first)
+            cache.site_permutations(first)
+            cache.site_permutations(second)
+            cache.site_permutations(first)
+        self.assertEqual(search.call_count, 3)
+        self.assertEqual(list(cache.permutations), [structure_fingerprint(first)])
+
+
+@unittest.skipUnless(HAS_PYMATGEN, 'pymatgen is not installed')
+class TestSymmetryCacheBaseline(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        # rock salt NiO doubled along c, with AFM orderings of the Ni planes
+        rocksalt = Structure.from_spacegroup('Fm-3m', Lattice.cubic(4.17),
+                                             ['Ni', 'O'], [[0, 0, 0], [0.5, 0.5, 0.5]])
+        self.structure = rocksalt * (1, 1, 2)
+        ni_z = [site.frac_coords[2] for site in self.structure if site.specie.symbol == 'Ni']
+        self.layers = sorted(set(np.round(ni_z, 3)))
+
+    def magnetized(self, layer_spins):
+        magmoms = []
+        for site in self.structure:
+            if site.specie.symbol == 'Ni':
+                magmoms.append(5.0 * layer_spins[self.layers.index(round(site.frac_coords[2], 3))])
+            else:
+                magmoms.append(0.0)
+        return self.structure.copy(site_properties={'magmom': magmoms})
+
+    def test_matches_spacegroup_analyzer(self):
+        cache = SymmetryCache()
+        for layer_spins in ([1, 1, 1, 1], [1, -1, 1, -1], [1, 1, -1, -1]):
+            structure = self.magnetized(layer_spins)
+            symm_structure = SpacegroupAnalyzer(structure).get_symmetrized_structure()
+            expected = symm_structure.as_dict()['equivalent_positions']
+            self.assertEqual(np.unique(cache.equivalent_indices(structure)).tolist(),
+                             np.unique(expected).tolist())
+        self.assertEqual(cache.num_analyses, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+
+import os
+import xml.etree.ElementTree as ET
+from output_parsing.outputreaders import parse_value, reverse_lines, OUTCAR_ITERATION, \
+    OUTCAR_FREE_ENERGY
+
+BLOCK_SIZE = 65536
+STRUCTURE_START = b'<structure'
+STRUCTURE_END = b'</structure>'
+LDAU_KEYS = ('LDAUU', 'LDAUJ', 'LDAUL')
+
+
+def parse_v(elem):
+    # a vasprun.xml <v> or varray row, following pymatgen's type conventions
+    value_type = elem.get('type')
+    values = (elem.text or '').split()
+    if value_type == 'logical':
+        return [value.upper().startswith('T') for value in values]
+    elif value_type == 'int':
+        return [int(value) for value in values]
+    elif value_type == 'string':
+        return values
+    return [float(value) for value in values]
+
+
+def parse_varray(elem):
+    return [parse_v(v) for v in elem.findall('v')]
+
+
+def read_vasprun_head(vasprun_path):
+    # INCAR, parameters and atomic symbols from the head of vasprun.xml;
+    # parsing stops at </atominfo>, before the first ionic step
+    head = {'incar': {}, 'parameters': {}, 'atomic_symbols': []}
+    path = []
+    root = None
+    for event, elem in ET.iterparse(vasprun_path, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = elem
+            path.append(elem.tag)
+            continue
+        path.pop()
+        if len(path) != 1:
+            continue
+        if elem.tag == 'incar':
+            for child in elem:
+                value = parse_v(child) if child.tag == 'v' else parse_value(child.text, child.get('type'))
+                head['incar'][child.get('name')] = value
+        elif elem.tag == 'parameters':
+            for child in elem.iter():
+                if child.tag == 'i':
+                    head['parameters'][child.get('name')] = parse_value(child.text, child.get('type'))
+                elif child.tag == 'v':
+                    head['parameters'][child.get('name')] = parse_v(child)
+        elif elem.tag == 'atominfo':
+            for array in elem.findall('array'):
+                if array.get('name') == 'atoms':
+                    for rc in array.find('set').findall('rc'):
+                        symbol = rc.find('c').text.strip()
+                        # pymatgen reads VASP's placeholder X as Xe
+                        head['atomic_symbols'].append('Xe' if symbol == 'X' else symbol)
+            break
+        root.clear()
+    return head
+
+
+def find_last_structure_block(vasprun_path, block_size=BLOCK_SIZE):
+    # bytes of the last complete <structure> block, found by reading
+    # vasprun.xml backwards; a block cut off by a killed run is skipped
+    with open(vasprun_path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        search_end = f.tell()
+        position = search_end
+        overlap = b''
+        while position > 0:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            data = f.read(read_size) + overlap
+            start = data.rfind(STRUCTURE_START)
+            while start != -1:
+                block_start = position + start
+                f.seek(block_start)
+                block = b''
+                while STRUCTURE_END not in block:
+                    chunk = f.read(block_size)
+                    if not chunk:
+                        break
+                    block += chunk
+                end = block.find(STRUCTURE_END)
+                if end != -1:
+                    return block[:end + len(STRUCTURE_END)]
+                start = data.rfind(STRUCTURE_START, 0, start)
+            # a start tag may straddle two blocks
+            overlap = data[:len(STRUCTURE_START) - 1]
+    return None
+
+
+def read_final_vasprun_structure(vasprun_path, atomic_symbols):
+    from pymatgen.core.structure import Structure
+    block = find_last_structure_block(vasprun_path)
+    if block is None:
+        raise ValueError('No complete <structure> block in %s' % vasprun_path)
+    elem = ET.fromstring(block)
+    lattice = parse_varray(elem.find('crystal').find('varray'))
+    positions = parse_varray(elem.find('varray'))
+    structure = Structure(lattice, atomic_symbols, positions)
+    selective = elem.find("varray/[@name='selective']")
+    if selective is not None:
+        structure.add_site_property('selective_dynamics', parse_varray(selective))
+    return structure
+
+
+def read_contcar_structure(contcar_path, atomic_symbols):
+    # None if CONTCAR is empty, unreadable or does not match vasprun.xml
+    from pymatgen.core.structure import Structure
+    from pymatgen.io.vasp.inputs import Poscar
+    if not os.path.exists(contcar_path) or os.path.getsize(contcar_path) == 0:
+        return None
+    try:
+        contcar_structure = Poscar.from_file(contcar_path, check_for_POTCAR=False).structure
+    except Exception:
+        return None
+    if [site.specie.symbol for site in contcar_structure] != list(atomic_symbols):
+        return None
+    # only the site properties vasprun.xml would give, e.g. no velocities
+    site_properties = {}
+    if 'selective_dynamics' in contcar_structure.site_properties:
+        site_properties['selective_dynamics'] = contcar_structure.site_properties['selective_dynamics']
+    return Structure(contcar_structure.lattice, contcar_structure.species,
+                     contcar_structure.frac_coords, site_properties=site_properties or None)
+
+
+def read_final_magnetization(outcar_path):
+    # 'tot' column of the last "magnetization (x)" table in OUTCAR, read
+    # backwards from the end of the file; None if there is none. Only the
+    # rows of one table are held, and the scan stops at the iterations of a
+    # complete ionic step without a table (e.g. no LORBIT), or at those of
+    # the previous step when the run stopped during its SCF
+    magnetization = []
+    in_table = False
+    free_energy_seen = False
+    ionic_step = None
+    for line in reverse_lines(outcar_path):
+        fields = line.split()
+        if in_table:
+            if line.strip() == 'magnetization (x)':
+                magnetization.reverse()
+                return magnetization or None
+            if fields and fields[0].isdigit():
+                magnetization.append(float(fields[-1]))
+                continue
+            if not fields or fields[0] == '#' or set(line.strip()) == {'-'}:
+                continue
+            # the rows of another table, e.g. total charge
+            in_table = False
+            magnetization = []
+        if fields and fields[0] == 'tot':
+            in_table = True
+            magnetization = []
+        elif OUTCAR_FREE_ENERGY in line:
+            free_energy_seen = True
+        else:
+            iteration = OUTCAR_ITERATION.search(line)
+            if iteration is None:
+                continue
+            if ionic_step is None:
+                if free_energy_seen:
+                    return None
+                ionic_step = iteration.group(1)
+            elif iteration.group(1) != ionic_step:
+                return None
+    return None
+
+
+def read_run_magnetization(directory, head):
+    # read_final_magnetization of the run in directory; None without reading
+    # OUTCAR if the run is not spin polarized. head is its read_vasprun_head
+    outcar_path = os.path.join(directory, 'OUTCAR')
+    if head['parameters'].get('ISPIN') != 2 or not os.path.exists(outcar_path):
+        return None
+    return read_final_magnetization(outcar_path)
+
+
+def prev_run_site_properties(structure, head, magnetization):
+    # the magmom and LDAU site properties get_structure_from_prev_run adds;
+    # the magmoms fall back to MAGMOM when OUTCAR has no magnetization
+    parameters = head['parameters']
+    site_properties = {}
+    if parameters.get('ISPIN') == 2:
+        if magnetization:
+            site_properties['magmom'] = magnetization
+        else:
+            site_properties['magmom'] = parameters['MAGMOM']
+    if parameters.get('LDAU', False):
+        for key in LDAU_KEYS:
+            values = head['incar'][key]
+            by_symbol = {}
+            site_values = []
+            for site in structure:
+                if site.specie.symbol not in by_symbol:
+                    by_symbol[site.specie.symbol] = values[len(by_symbol)]
+                site_values.append(by_symbol[site.specie.symbol])
+            site_properties[key.lower()] = site_values
+    return site_properties
+
+
+def final_structure_from_prev_run(directory, use_contcar=True):
+    # The final structure of the run in directory with the site properties
+    # pymatgen's get_structure_from_prev_run(Vasprun, Outcar) adds (magmom and
+    # LDAU values), without parsing the whole vasprun.xml and OUTCAR
+    vasprun_path = os.path.join(directory, 'vasprun.xml')
+    head = read_vasprun_head(vasprun_path)
+    structure = None
+    if use_contcar:
+        structure = read_contcar_structure(os.path.join(directory, 'CONTCAR'),
+                                           head['atomic_symbols'])
+    if structure is None:
+        structure = read_final_vasprun_structure(vasprun_path, head['atomic_symbols'])
+    site_properties = prev_run_site_properties(structure, head,
+                                               read_run_magnetization(directory, head))
+    return structure.copy(site_properties=site_properties)
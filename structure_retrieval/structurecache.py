@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+import os
+import gzip
+import json
+import time
+import sqlite3
+import hashlib
+
+CACHE_ENV_VARIABLE = 'VASP_WORKFLOW_STRUCTURE_CACHE'
+INDEX_NAME = 'index.db'
+OBJECTS_DIR = 'objects'
+# sqlite limits the number of parameters of a single statement
+SQL_CHUNK_SIZE = 500
+
+
+def default_cache_dir():
+    # $VASP_WORKFLOW_STRUCTURE_CACHE, otherwise ~/.cache/vasp_workflow/structures
+    if os.environ.get(CACHE_ENV_VARIABLE):
+        return os.path.expanduser(os.environ[CACHE_ENV_VARIABLE])
+    return os.path.join(os.path.expanduser('~'), '.cache', 'vasp_workflow', 'structures')
+
+
+def json_default(value):
+    # numpy scalars and arrays in site properties
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError('%s is not JSON serializable' % type(value).__name__)
+
+
+def serialize_structure(structure):
+    # lattice, species, fractional coordinates and site properties only;
+    # disordered structures keep the full Structure.as_dict()
+    if structure.is_ordered:
+        compact = {'lattice': structure.lattice.matrix.tolist(),
+                   'species': [str(site.specie) for site in structure],
+                   'coords': structure.frac_coords.tolist(),
+                   'site_properties': structure.site_properties}
+    else:
+        compact = {'structure': structure.as_dict()}
+    return json.dumps(compact, separators=(',', ':'), sort_keys=True,
+                      default=json_default).encode('utf-8')
+
+
+def deserialize_structure(data):
+    from pymatgen.core.structure import Structure
+    compact = json.loads(data.decode('utf-8'))
+    if 'structure' in compact:
+        return Structure.from_dict(compact['structure'])
+    return Structure(compact['lattice'], compact['species'], compact['coords'],
+                     site_properties=compact['site_properties'] or None)
+
+
+class StructureCache:
+    # Persistent Materials Project structure cache. Structures are stored
+    # once per content (gzipped compact JSON named by its sha256 digest under
+    # objects/); an sqlite index maps each mp-id to its digest, formula and
+    # fetch time. Entries older than max_age seconds count as missing.
+    def __init__(self, cache_dir=None, max_age=None):
+        if cache_dir is None:
+            cache_dir = default_cache_dir()
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.objects_dir = os.path.join(self.cache_dir, OBJECTS_DIR)
+        self.max_age = max_age
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(self.cache_dir, INDEX_NAME))
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS structures ('
+            'mpid TEXT PRIMARY KEY, digest TEXT, formula TEXT, fetched REAL)')
+        self.connection.commit()
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest + '.json.gz')
+
+    def write_object(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        object_path = self.object_path(digest)
+        if not os.path.exists(object_path):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            tmp_path = '%s.%s.tmp' % (object_path, os.getpid())
+            with gzip.open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, object_path)
+        return digest
+
+    def read_object(self, digest):
+        with gzip.open(self.object_path(digest), 'rb') as f:
+            return deserialize_structure(f.read())
+
+    def lookup(self, mpids, max_age=None):
+        # {mpid: (digest, formula, fetched)} of cached entries
+        entries = {}
+        mpids = list(mpids)
+        for i in range(0, len(mpids), SQL_CHUNK_SIZE):
+            chunk = mpids[i:i + SQL_CHUNK_SIZE]
+            rows = self.connection.execute(
+                'SELECT mpid, digest, formula, fetched FROM structures WHERE mpid IN (%s)' %
+                ', '.join('?' * len(chunk)), chunk).fetchall()
+            for mpid, digest, formula, fetched in rows:
+                entries[mpid] = (digest, formula, fetched)
+        if max_age is not None:
+            oldest = time.time() - max_age
+            entries = {mpid: entry for mpid, entry in entries.items() if entry[2] >= oldest}
+        return entries
+
+    def get_many(self, mpids, ignore_max_age=False):
+        # {mpid: Structure} of the cached, unexpired mpids
+        max_age = None if ignore_max_age else self.max_age
+        structures = {}
+        for mpid, (digest, formula, fetched) in self.lookup(mpids, max_age).items():
+            try:
+                structures[mpid] = self.read_object(digest)
+            except (OSError, ValueError):
+                # missing or damaged object; fetched again next time
+                continue
+        return structures
+
+    def get(self, mpid, ignore_max_age=False):
+        return self.get_many([mpid], ignore_max_age).get(mpid)
+
+    def formulas(self, mpids, ignore_max_age=False):
+        # {mpid: formula} without reading any structure
+        max_age = None if ignore_max_age else self.max_age
+        return {mpid: entry[1] for mpid, entry in self.lookup(mpids, max_age).items()}
+
+    def put_many(self, structures):
+        fetched = time.time()
+        rows = []
+        for mpid, structure in structures.items():
+            digest = self.write_object(serialize_structure(structure))
+            rows.append((mpid, digest, str(structure.formula), fetched))
+        self.connection.executemany(
+            'INSERT OR REPLACE INTO structures (mpid, digest, formula, fetched) '
+            'VALUES (?, ?, ?, ?)', rows)
+        self.connection.commit()
+
+    def put(self, mpid, structure):
+        self.put_many({mpid: structure})
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+import os
+import json
+
+MP_CHUNK_SIZE = 200
+
+
+def chunks(items, chunk_size):
+    for i in range(0, len(items), chunk_size):
+        yield items[i:i + chunk_size]
+
+
+def report_invalid_mpids(invalid_mpids, num_mpids):
+    # one summary line instead of one print per invalid mp-id
+    if invalid_mpids:
+        print('%s of %s mp-ids are not valid mp-ids: %s' %
+              (len(invalid_mpids), num_mpids, ', '.join(invalid_mpids)))
+
+
+class LocalStructureClient:
+    # Stand-in for MPRester that serves structures from memory, e.g. for
+    # testing or for running without access to the Materials Project. Supports
+    # the subset of MPRester used here: query() on material_id and
+    # get_structures(mpid, final=True).
+    def __init__(self, structures=None):
+        self.structures = dict(structures or {})
+        self.num_requests = 0
+
+    @classmethod
+    def from_directory(cls, directory):
+        # <mpid>.json (Structure.as_dict) or any file Structure.from_file
+        # reads, e.g. <mpid>.cif or <mpid>.vasp
+        from pymatgen.core.structure import Structure
+        structures = {}
+        for file_name in sorted(os.listdir(directory)):
+            mpid, extension = os.path.splitext(file_name)
+            file_path = os.path.join(directory, file_name)
+            if extension == '.json':
+                with open(file_path, 'r') as f:
+                    structures[mpid] = Structure.from_dict(json.load(f))
+            else:
+                structures[mpid] = Structure.from_file(file_path)
+        return cls(structures)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def query(self, criteria, properties):
+        self.num_requests += 1
+        mpids = criteria['material_id']['$in']
+        documents = []
+        for mpid in mpids:
+            if mpid in self.structures:
+                document = {'material_id': mpid, 'structure': self.structures[mpid].copy()}
+                documents.append({key: document[key] for key in properties})
+        return documents
+
+    def get_structures(self, mpid, final=True):
+        self.num_requests += 1
+        if mpid not in self.structures:
+            raise KeyError('%s not found' % mpid)
+        return [self.structures[mpid].copy()]
+
+
+class StructureRetriever:
+    # Fetches the final structures of many mp-ids over a single client session
+    # with chunked multi-ID queries. IDs the bulk query does not return (e.g.
+    # task IDs of a material) are retried individually before being reported
+    # as invalid. With a StructureCache, cached mp-ids are not fetched again
+    # and offline=True uses the cache only.
+    def __init__(self, client=None, chunk_size=MP_CHUNK_SIZE, cache=None, offline=False):
+        if offline and cache is None and client is None:
+            raise ValueError('Offline structure retrieval needs a structure cache')
+        self.client = client
+        self.chunk_size = chunk_size
+        self.cache = cache
+        self.offline = offline
+
+    def open_client(self):
+        if self.client is not None:
+            return self.client
+        from pymatgen.ext.matproj import MPRester
+        from configuration.mp_api import MP_api_key
+        return MPRester(MP_api_key)
+
+    def fetch_structures(self, mpids):
+        # ({mpid: Structure}, [invalid mpids]) from the client
+        fetched = {}
+        invalid_mpids = []
+        with self.open_client() as m:
+            for chunk in chunks(mpids, self.chunk_size):
+                try:
+                    documents = m.query(criteria={'material_id': {'$in': chunk}},
+                                        properties=['material_id', 'structure'])
+                except Exception as e:
+                    print('Bulk query of %s mp-ids failed (%s); querying them one by one' %
+                          (len(chunk), e))
+                    documents = []
+                for document in documents:
+                    fetched[str(document['material_id'])] = document['structure']
+                for mpid in chunk:
+                    if mpid in fetched:
+                        continue
+                    try:
+                        fetched[mpid] = m.get_structures(mpid, final=True)[0]
+                    except Exception:
+                        invalid_mpids.append(mpid)
+        return fetched, invalid_mpids
+
+    def get_structures(self, mpids):
+        # returns ({mpid: Structure} in the order of mpids, [invalid mpids])
+        mpids = list(dict.fromkeys(str(mpid) for mpid in mpids))
+        found = {}
+        invalid_mpids = []
+        if not mpids:
+            return found, invalid_mpids
+        if self.cache is not None:
+            found.update(self.cache.get_many(mpids, ignore_max_age=self.offline))
+        missing = [mpid for mpid in mpids if mpid not in found]
+        if missing and self.offline and self.client is None:
+            # not known to be invalid, so reported separately
+            print('Offline: %s of %s mp-ids not in the structure cache: %s' %
+                  (len(missing), len(mpids), ', '.join(missing)))
+        elif missing:
+            fetched, invalid_mpids = self.fetch_structures(missing)
+            if self.cache is not None and fetched:
+                self.cache.put_many(fetched)
+            found.update(fetched)
+        structures = {mpid: found[mpid] for mpid in mpids if mpid in found}
+        return structures, invalid_mpids
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+from structure_retrieval import finalstructure
+from structure_retrieval.finalstructure import read_final_magnetization, read_vasprun_head
+
+try:
+    from pymatgen.io.vasp.outputs import Vasprun, Outcar
+    from pymatgen.io.vasp.sets import get_structure_from_prev_run
+    HAS_PYMATGEN = True
+except ImportError:
+    HAS_PYMATGEN = False
+
+LATTICE = [[4.17, 0.0, 0.0], [0.0, 4.17, 0.0], [0.0, 0.0, 8.34]]
+SPECIES = ['Ni', 'Ni', 'O', 'O']
+INITIAL_POSITIONS = [[0.0, 0.0, 0.0], [0.5, 0.5, 0.5], [0.5, 0.5, 0.25], [0.0, 0.0, 0.75]]
+FINAL_POSITIONS = [[0.0, 0.0, 0.01], [0.5, 0.5, 0.49], [0.5, 0.5, 0.26], [0.0, 0.0, 0.74]]
+
+
+def varray(name, rows, value_format='%16.8f'):
+    return '<varray name="%s">\n%s</varray>\n' % (name, ''.join(
+        '<v>%s</v>\n' % ' '.join(value_format % value for value in row) for row in rows))
+
+
+def structure_xml(name, positions):
+    return ('<structure%s>\n<crystal>\n%s<i name="volume">145.02</i>\n%s</crystal>\n%s</structure>\n'
+            % (' name="%s"' % name if name else '', varray('basis', LATTICE),
+               varray('rec_basis', [[1 / 4.17, 0, 0], [0, 1 / 4.17, 0], [0, 0, 1 / 8.34]]),
+               varray('positions', positions)))
+
+
+def calculation_xml(positions, energy):
+    scsteps = ''.join('<scstep>\n<energy>\n<i name="e_fr_energy">%16.8f</i>\n'
+                      '<i name="e_wo_entrp">%16.8f</i>\n<i name="e_0_energy">%16.8f</i>\n'
+                      '</energy>\n</scstep>\n' % (energy + 0.1 / step, energy, energy)
+                      for step in range(1, 4))
+    return ('<calculation>\n%s%s%s<energy>\n<i name="e_fr_energy">%16.8f</i>\n'
+            '<i name="e_wo_entrp">%16.8f</i>\n<i name="e_0_energy">%16.8f</i>\n</energy>\n'
+            '</calculation>\n' % (scsteps, structure_xml(None, positions),
+                                  varray('forces', [[0.0, 0.0, 0.0]] * len(SPECIES)),
+                                  energy, energy, energy))
+
+
+def vasprun_xml(ispin=2, ldau=False):
+    incar = '<i type="string" name="SYSTEM">NiO</i>\n<i type="int" name="ISPIN">%s</i>\n' % ispin
+    incar += '<v name="MAGMOM">5.0 -5.0 0.6 0.6</v>\n'
+    parameters = ('<separator name="electronic">\n<i type="int" name="NELM">60</i>\n'
+                  '<i type="int" name="ISPIN">%s</i>\n<v name="MAGMOM">5.0 -5.0 0.6 0.6</v>\n'
+                  % ispin)
+    if ldau:
+        incar += ('<i type="logical" name="LDAU"> T  </i>\n<v type="int" name="LDAUL"> 2 -1</v>\n'
+                  '<v name="LDAUU">6.2 0.0</v>\n<v name="LDAUJ">0.0 0.0</v>\n')
+        parameters += ('<i type="logical" name="LDAU"> T  </i>\n<v type="int" name="LDAUL"> 2 -1</v>\n'
+                       '<v name="LDAUU">6.2 0.0</v>\n<v name="LDAUJ">0.0 0.0</v>\n')
+    else:
+        parameters += '<i type="logical" name="LDAU"> F  </i>\n'
+    parameters += ('</separator>\n<separator name="ionic">\n<i type="int" name="NSW">10</i>\n'
+                   '</separator>\n')
+    atoms = ''.join('<rc><c>%s</c><c>%s</c></rc>\n' % (symbol, 1 if symbol == 'Ni' else 2)
+                    for symbol in SPECIES)
+    return ('<?xml version="1.0" encoding="ISO-8859-1"?>\n<modeling>\n'
+            '<generator>\n<i name="program" type="string">vasp </i>\n'
+            '<i name="version" type="string">5.4.4.18Apr17-6-g9f103f2a35  </i>\n'
+            '<i name="subversion" type="string">(build Apr 17 2020)</i>\n'
+            '<i name="platform" type="string">LinuxIFC </i>\n'
+            '<i name="date" type="string">2020 01 01 </i>\n'
+            '<i name="time" type="string">00:00:00 </i>\n</generator>\n'
+            '<incar>\n%s</incar>\n'
+            '<kpoints>\n<generation param="Gamma">\n<v type="int" name="divisions">4 4 2</v>\n'
+            '<v name="usershift">0 0 0</v>\n</generation>\n%s%s</kpoints>\n'
+            '<parameters>\n%s</parameters>\n'
+            '<atominfo>\n<atoms>4</atoms>\n<types>2</types>\n'
+            '<array name="atoms">\n<dimension dim="1">ion</dimension>\n'
+            '<field type="string">element</field>\n<field type="int">atomtype</field>\n'
+            '<set>\n%s</set>\n</array>\n'
+            '<array name="atomtypes">\n<dimension dim="1">type</dimension>\n'
+            '<field type="int">atomspertype</field>\n<field type="string">element</field>\n'
+            '<field>mass</field>\n<field>valence</field>\n'
+            '<field type="string">pseudopotential</field>\n<set>\n'
+            '<rc><c>2</c><c>Ni</c><c>58.69</c><c>16.0</c><c>  PAW_PBE Ni_pv 06Sep2000</c></rc>\n'
+            '<rc><c>2</c><c>O </c><c>16.0</c><c>6.0</c><c>  PAW_PBE O 08Apr2002</c></rc>\n'
+            '</set>\n</array>\n</atominfo>\n%s%s%s%s</modeling>\n'
+            % (incar, varray('kpointlist', [[0.0, 0.0, 0.0]]), varray('weights', [[1.0]]),
+               parameters, atoms, structure_xml('initialpos', INITIAL_POSITIONS),
+               calculation_xml(INITIAL_POSITIONS, -20.0), calculation_xml(FINAL_POSITIONS, -20.5),
+               structure_xml('finalpos', FINAL_POSITIONS)))
+
+
+def magnetization_table(moments, title='magnetization (x)'):
+    rows = ''.join('%5d        0.001  0.002  %6.3f  %6.3f\n' % (i, moment, moment + 0.003)
+                   for i, moment in enumerate(moments, 1))
+    return (' %s\n \n# of ion       s       p       d       tot\n'
+            '------------------------------------------\n%s'
+            '--------------------------------------------------\n'
+            'tot          0.004  0.008  %6.3f  %6.3f\n \n'
+            % (title, rows, sum(moments), sum(moments) + 0.012))
+
+
+def ionic_step(step, moments=None, complete=True):
+    text = ''
+    for iteration in range(1, 4):
+        text += ('----------------------------------------- Iteration %4d(%4d)  '
+                 '---------------------------------------\n' % (step, iteration))
+        text += '      1     -14.3456      1.00000\n' * 5
+    if not complete:
+        return text
+    text += ' ------------------------ aborting loop because EDIFF is reached ----------------\n'
+    text += magnetization_table([2.0, 2.0, 1.0, 1.0], 'total charge')
+    if moments is not None:
+        text += magnetization_table(moments)
+    text += ('  FREE ENERGIE OF THE ION-ELECTRON SYSTEM (eV)\n'
+             '  ---------------------------------------------------\n'
+             '  free  energy   TOTEN  =       -20.50000000 eV\n\n')
+    return text
+
+
+class TestReadFinalMagnetization(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.outcar_path = os.path.join(self.tmp.name, 'OUTCAR')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def read(self, text):
+        with open(self.outcar_path, 'w') as f:
+            f.write(text)
+        return read_final_magnetization(self.outcar_path)
+
+    def test_last_table(self):
+        text = ionic_step(1, [1.0, -1.0, 0.1, 0.1]) + ionic_step(2, [1.5, -1.5, 0.2, 0.0])
+        self.assertEqual(self.read(text), [1.503, -1.497, 0.203, 0.003])
+
+    def test_run_stopped_during_scf(self):
+        # the last complete ionic step has the table to use
+        text = ionic_step(1, [1.0, -1.0, 0.1, 0.1]) + ionic_step(2, complete=False)
+        self.assertEqual(self.read(text), [1.003, -0.997, 0.103, 0.103])
+
+    def test_no_table(self):
+        # ISPIN = 1, or no LORBIT; only the total charge table
+        self.assertIsNone(self.read(ionic_step(1) + ionic_step(2)))
+        self.assertIsNone(self.read(ionic_step(1) + ionic_step(2, complete=False)))
+        self.assertIsNone(self.read(''))
+
+    def test_scan_stops_at_last_ionic_step(self):
+        # without a table only the end of the last ionic step is read
+        text = ''.join(ionic_step(step) for step in range(1, 200))
+        lines_read = []
+        reverse_lines = finalstructure.reverse_lines
+
+        def counting_reverse_lines(path):
+            for line in reverse_lines(path):
+                lines_read.append(line)
+                yield line
+        with mock.patch.object(finalstructure, 'reverse_lines', counting_reverse_lines):
+            self.assertIsNone(self.read(text))
+        self.assertLess(len(lines_read), len(ionic_step(199).split('\n')))
+
+
+class TestReadVasprunHead(unittest.TestCase):
+    def test_head(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'vasprun.xml')
+            with open(path, 'w') as f:
+                f.write(vasprun_xml(ldau=True))
+            head = read_vasprun_head(path)
+        self.assertEqual(head['atomic_symbols'], SPECIES)
+        self.assertEqual(head['incar']['LDAUL'], [2, -1])
+        self.assertEqual(head['incar']['MAGMOM'], [5.0, -5.0, 0.6, 0.6])
+        self.assertEqual(head['parameters']['ISPIN'], 2)
+        self.assertEqual(head['parameters']['LDAU'], True)
+
+
+@unittest.skipUnless(HAS_PYMATGEN, 'pymatgen is not installed')
+class TestFinalStructureFromPrevRun(unittest.TestCase):
+    # compared with pymatgen's get_structure_from_prev_run(Vasprun, Outcar)
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write_run(self, ispin=2, ldau=False, moments=None):
+        with open(os.path.join(self.directory, 'vasprun.xml'), 'w') as f:
+            f.write(vasprun_xml(ispin, ldau))
+        with open(os.path.join(self.directory, 'OUTCAR'), 'w') as f:
+            f.write(ionic_step(1, moments) + ionic_step(2, moments))
+
+    def assert_matches_pymatgen(self):
+        vasprun = Vasprun(os.path.join(self.directory, 'vasprun.xml'),
+                          parse_dos=False, parse_eigen=False, parse_potcar_file=False)
+        outcar = Outcar(os.path.join(self.directory, 'OUTCAR'))
+        expected = get_structure_from_prev_run(vasprun, outcar)
+        structure = finalstructure.final_structure_from_prev_run(self.directory)
+        self.assertEqual(structure, expected)
+        self.assertEqual(sorted(structure.site_properties), sorted(expected.site_properties))
+        for key, values in expected.site_properties.items():
+            self.assertEqual(list(structure.site_properties[key]), list(values))
+        return structure
+
+    def test_magnetization_table(self):
+        self.write_run(moments=[1.5, -1.5, 0.2, 0.0])
+        structure = self.assert_matches_pymatgen()
+        self.assertEqual(structure.site_properties['magmom'], [1.503, -1.497, 0.203, 0.003])
+
+    def test_ispin2_without_table(self):
+        # falls back to the MAGMOM of the run
+        self.write_run()
+        structure = self.assert_matches_pymatgen()
+        self.assertEqual(list(structure.site_properties['magmom']), [5.0, -5.0, 0.6, 0.6])
+
+    def test_ldau(self):
+        self.write_run(ldau=True, moments=[1.5, -1.5, 0.2, 0.0])
+        structure = self.assert_matches_pymatgen()
+        self.assertEqual(structure.site_properties['ldauu'], [6.2, 6.2, 0.0, 0.0])
+
+    def test_non_spin_polarized(self):
+        self.write_run(ispin=1)
+        structure = self.assert_matches_pymatgen()
+        self.assertNotIn('magmom', structure.site_properties)
+
+
+if __name__ == '__main__':
+    unittest.main()
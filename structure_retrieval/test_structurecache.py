@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+import os
+import glob
+import gzip
+import json
+import tempfile
+import unittest
+from types import SimpleNamespace
+import numpy as np
+from structure_retrieval.structurecache import StructureCache, serialize_structure
+
+try:
+    from pymatgen.core.structure import Structure
+    from pymatgen.core.lattice import Lattice
+    HAS_PYMATGEN = True
+except ImportError:
+    HAS_PYMATGEN = False
+
+
+class FakeStructure:
+    # all serialize_structure and put_many need from an ordered structure
+    def __init__(self, species, a=4.17, magmoms=None):
+        self.lattice = SimpleNamespace(matrix=np.eye(3) * a)
+        self.frac_coords = np.array([[i / 2.0, i / 2.0, i / 2.0] for i in range(len(species))])
+        self.species = species
+        self.site_properties = {'magmom': np.array(magmoms)} if magmoms else {}
+        self.is_ordered = True
+        self.formula = ' '.join('%s1' % symbol for symbol in species)
+
+    def __iter__(self):
+        return iter(SimpleNamespace(specie=symbol) for symbol in self.species)
+
+
+class TestStructureCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = StructureCache(self.tmp.name)
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp.cleanup()
+
+    def objects(self):
+        return glob.glob(os.path.join(self.cache.objects_dir, '*', '*.json.gz'))
+
+    def test_miss(self):
+        self.assertEqual(self.cache.get_many(['mp-19009']), {})
+        self.assertIsNone(self.cache.get('mp-19009'))
+        self.assertEqual(self.cache.formulas(['mp-19009']), {})
+
+    def test_serialized_content(self):
+        self.cache.put('mp-19009', FakeStructure(['Ni', 'O'], magmoms=[2.0, 0.0]))
+        digest = self.cache.lookup(['mp-19009'])['mp-19009'][0]
+        with gzip.open(self.cache.object_path(digest), 'rb') as f:
+            compact = json.loads(f.read().decode('utf-8'))
+        self.assertEqual(compact['species'], ['Ni', 'O'])
+        self.assertEqual(compact['coords'], [[0, 0, 0], [0.5, 0.5, 0.5]])
+        self.assertEqual(compact['site_properties'], {'magmom': [2.0, 0.0]})
+
+    def test_identical_content_stored_once(self):
+        self.cache.put_many({'mp-19009': FakeStructure(['Ni', 'O']),
+                             'mp-1234': FakeStructure(['Ni', 'O']),
+                             'mp-715': FakeStructure(['Co', 'O'])})
+        entries = self.cache.lookup(['mp-19009', 'mp-1234', 'mp-715'])
+        self.assertEqual(entries['mp-19009'][0], entries['mp-1234'][0])
+        self.assertNotEqual(entries['mp-19009'][0], entries['mp-715'][0])
+        self.assertEqual(len(self.objects()), 2)
+        self.assertEqual(self.cache.formulas(['mp-1234', 'mp-715', 'mp-1']),
+                         {'mp-1234': 'Ni1 O1', 'mp-715': 'Co1 O1'})
+        # the same content put again leaves the object untouched
+        self.cache.put('mp-1', FakeStructure(['Co', 'O']))
+        self.assertEqual(len(self.objects()), 2)
+
+    def test_persistent(self):
+        self.cache.put('mp-19009', FakeStructure(['Ni', 'O']))
+        self.cache.close()
+        self.cache = StructureCache(self.tmp.name)
+        self.assertEqual(self.cache.formulas(['mp-19009']), {'mp-19009': 'Ni1 O1'})
+
+    def test_max_age(self):
+        self.cache.put('mp-19009', FakeStructure(['Ni', 'O']))
+        self.cache.connection.execute('UPDATE structures SET fetched = fetched - 100')
+        self.cache.max_age = 50
+        self.assertEqual(self.cache.formulas(['mp-19009']), {})
+        self.assertEqual(self.cache.get_many(['mp-19009']), {})
+        self.assertEqual(self.cache.formulas(['mp-19009'], ignore_max_age=True),
+                         {'mp-19009': 'Ni1 O1'})
+
+    def test_missing_or_damaged_object(self):
+        # counts as a miss, so the structure is fetched again
+        self.cache.put_many({'mp-19009': FakeStructure(['Ni', 'O']),
+                             'mp-715': FakeStructure(['Co', 'O'])})
+        entries = self.cache.lookup(['mp-19009', 'mp-715'])
+        os.remove(self.cache.object_path(entries['mp-19009'][0]))
+        with open(self.cache.object_path(entries['mp-715'][0]), 'wb') as f:
+            f.write(b'not gzipped')
+        self.assertEqual(self.cache.get_many(['mp-19009', 'mp-715']), {})
+
+
+@unittest.skipUnless(HAS_PYMATGEN, 'pymatgen is not installed')
+class TestStructureCacheStructures(unittest.TestCase):
+    def test_hit(self):
+        structure = Structure(Lattice.cubic(4.17), ['Ni', 'O'], [[0, 0, 0], [0.5, 0.5, 0.5]],
+                              site_properties={'magmom': [2.0, 0.0]})
+        disordered = Structure(Lattice.cubic(4.17), [{'Ni': 0.5, 'Co': 0.5}, 'O'],
+                               [[0, 0, 0], [0.5, 0.5, 0.5]])
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = StructureCache(tmp)
+            cache.put_many({'mp-19009': structure, 'mp-1': disordered})
+            structures = cache.get_many(['mp-19009', 'mp-1', 'mp-2'])
+            cache.close()
+        self.assertEqual(sorted(structures), ['mp-1', 'mp-19009'])
+        self.assertEqual(structures['mp-19009'], structure)
+        self.assertEqual(structures['mp-19009'].site_properties['magmom'], [2.0, 0.0])
+        self.assertEqual(structures['mp-1'], disordered)
+        self.assertEqual(serialize_structure(structures['mp-19009']),
+                         serialize_structure(structure))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+import io
+import os
+import json
+import tempfile
+import unittest
+import contextlib
+from structure_retrieval.structureretrieval import (LocalStructureClient, StructureRetriever,
+                                                    chunks, report_invalid_mpids)
+
+try:
+    from pymatgen.core.structure import Structure
+    from pymatgen.core.lattice import Lattice
+    HAS_PYMATGEN = True
+except ImportError:
+    HAS_PYMATGEN = False
+
+
+class FakeStructure:
+    # all LocalStructureClient needs from a structure
+    def __init__(self, formula):
+        self.formula = formula
+
+    def copy(self):
+        return FakeStructure(self.formula)
+
+
+class RecordingClient(LocalStructureClient):
+    # also records the mp-ids of each bulk query
+    def __init__(self, structures=None, fail_bulk=False):
+        LocalStructureClient.__init__(self, structures)
+        self.queries = []
+        self.fail_bulk = fail_bulk
+
+    def query(self, criteria, properties):
+        self.queries.append(list(criteria['material_id']['$in']))
+        if self.fail_bulk:
+            self.num_requests += 1
+            raise RuntimeError('query failed')
+        return LocalStructureClient.query(self, criteria, properties)
+
+
+class TestStructureRetriever(unittest.TestCase):
+    def setUp(self):
+        self.structures = {'mp-%s' % i: FakeStructure('X%s' % i) for i in range(1, 8)}
+
+    def test_chunks(self):
+        self.assertEqual(list(chunks(list(range(5)), 2)), [[0, 1], [2, 3], [4]])
+
+    def test_batched_retrieval(self):
+        client = RecordingClient(self.structures)
+        retriever = StructureRetriever(client=client, chunk_size=3)
+        mpids = ['mp-7', 'mp-2', 'mp-5', 'mp-1', 'mp-3', 'mp-2', 'mp-4']
+        structures, invalid_mpids = retriever.get_structures(mpids)
+        # duplicates dropped, order of first appearance kept
+        self.assertEqual(list(structures), ['mp-7', 'mp-2', 'mp-5', 'mp-1', 'mp-3', 'mp-4'])
+        self.assertEqual(structures['mp-5'].formula, 'X5')
+        self.assertEqual(invalid_mpids, [])
+        self.assertEqual(client.queries, [['mp-7', 'mp-2', 'mp-5'], ['mp-1', 'mp-3', 'mp-4']])
+        self.assertEqual(client.num_requests, 2)
+
+    def test_invalid_mpids(self):
+        client = RecordingClient(self.structures)
+        retriever = StructureRetriever(client=client, chunk_size=200)
+        structures, invalid_mpids = retriever.get_structures(['mp-1', 'mp-999', 'mp-2', 'mvc-1'])
+        self.assertEqual(list(structures), ['mp-1', 'mp-2'])
+        self.assertEqual(invalid_mpids, ['mp-999', 'mvc-1'])
+        # one bulk query, then each missing id once on its own
+        self.assertEqual(client.num_requests, 3)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            report_invalid_mpids(invalid_mpids, 4)
+        self.assertEqual(output.getvalue(), '2 of 4 mp-ids are not valid mp-ids: mp-999, mvc-1\n')
+
+    def test_failed_bulk_query(self):
+        client = RecordingClient(self.structures, fail_bulk=True)
+        retriever = StructureRetriever(client=client, chunk_size=200)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            structures, invalid_mpids = retriever.get_structures(['mp-3', 'mp-4', 'mp-999'])
+        self.assertEqual(list(structures), ['mp-3', 'mp-4'])
+        self.assertEqual(invalid_mpids, ['mp-999'])
+        self.assertIn('querying them one by one', output.getvalue())
+
+    def test_returned_structures_are_copies(self):
+        retriever = StructureRetriever(client=LocalStructureClient(self.structures))
+        structures, invalid_mpids = retriever.get_structures(['mp-1'])
+        structures['mp-1'].formula = 'changed'
+        self.assertEqual(self.structures['mp-1'].formula, 'X1')
+
+    def test_offline_without_cache(self):
+        self.assertRaises(ValueError, StructureRetriever, offline=True)
+
+
+@unittest.skipUnless(HAS_PYMATGEN, 'pymatgen is not installed')
+class TestLocalStructureClientDirectory(unittest.TestCase):
+    def test_from_directory(self):
+        structure = Structure(Lattice.cubic(4.17), ['Ni', 'O'], [[0, 0, 0], [0.5, 0.5, 0.5]])
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'mp-19009.json'), 'w') as f:
+                json.dump(structure.as_dict(), f)
+            structure.to(filename=os.path.join(directory, 'mp-1.cif'))
+            client = LocalStructureClient.from_directory(directory)
+        structures, invalid_mpids = StructureRetriever(client=client).get_structures(
+            ['mp-19009', 'mp-1', 'mp-2'])
+        self.assertEqual(list(structures), ['mp-19009', 'mp-1'])
+        self.assertEqual(structures['mp-19009'], structure)
+        self.assertEqual(structures['mp-1'].composition.reduced_formula, 'NiO')
+        self.assertEqual(invalid_mpids, ['mp-2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
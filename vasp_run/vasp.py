@@ -303,22 +303,36 @@ parser.add_argument('--pc', help='Do plane constrained run',
 parser.add_argument('--frozen', help='Monitors jobs which constantlyfreeze',
                     action='store_true')
 
-args = parser.parse_args()
+def render_script(template_dir, template, keywords, account, script):
+    """
+    Args:
+        template_dir: directory containing the jinja2 template
+        template: template file name
+        keywords: keywords rendered into the template
+        account: allocation written into the #SBATCH --account line
+        script: path of the submission script to write
+    Returns: list of lines written to script
+    """
+    env = Environment(loader=FileSystemLoader(template_dir))
+    template = env.get_template(template)
+    data = template.render(keywords).splitlines(True)
 
-if __name__ == '__main__':
-    if args.finish_convergence is not None:
-        run = Vasprun(
-            'vasprun.xml',
-            parse_dos=False,
-            parse_eigen=False,
-            parse_potcar_file=False, 
-            exception_on_bad_xml=False)
-        if run.converged:
-            exit('Run is already converged')
-        elif args.finish_convergence != []:
-            stage = Incar.from_file('INCAR')['STAGE_NUMBER']
-            if stage not in args.finish_convergence:
-                exit('Not correct stage')
+    # adds the account variable to the submission script 
+    account_line = '#SBATCH --account=%s' % account
+    data[9] = str(account_line)+'\n'
+    with open(script, 'w') as f:
+        f.writelines(data)
+    return data
+
+
+def prepare_run(args):
+    """
+    Backs up the run in the current directory, sets up the next run and
+    writes its submission script
+    Args:
+        args: parsed vasp.py arguments
+    Returns: Dict with the submission settings, or None for backup only runs
+    """
     jobtype = getJobType('.')
     incar = Incar.from_file('INCAR')
     computer = getComputerName()
@@ -326,7 +340,7 @@ if __name__ == '__main__':
     print('Backing up previous run')
     backup_vasp('.')
     if args.backup:
-        exit(0)
+        return None
     if not args.inplace:
         print('Setting up next run')
         restart_vasp('.')
@@ -487,20 +501,37 @@ if __name__ == '__main__':
         'openmp': openmp}
     keywords.update(additional_keywords)
 
-    env = Environment(loader=FileSystemLoader(template_dir))
-    template = env.get_template(template)
-    with open(script, 'w+') as f:
-        f.write(template.render(keywords))
+    render_script(template_dir, template, keywords, account, script)
+    return {'script': script,
+            'submit': submit,
+            'name': name,
+            'queue': queue,
+            'queue_type': queue_type,
+            'template_dir': template_dir,
+            'template': template,
+            'account': account,
+            'keywords': keywords}
 
-    # adds the account variable to the submission script 
-    account_line = '#SBATCH --account=%s' % account
-    with open(script, 'r') as f:
-        data = f.readlines()
 
-    data[9] = str(account_line)+'\n'
-    with open(script, 'w') as f:
-        f.writelines(data)
+if __name__ == '__main__':
+    args = parser.parse_args()
+    if args.finish_convergence is not None:
+        run = Vasprun(
+            'vasprun.xml',
+            parse_dos=False,
+            parse_eigen=False,
+            parse_potcar_file=False, 
+            exception_on_bad_xml=False)
+        if run.converged:
+            exit('Run is already converged')
+        elif args.finish_convergence != []:
+            stage = Incar.from_file('INCAR')['STAGE_NUMBER']
+            if stage not in args.finish_convergence:
+                exit('Not correct stage')
+    run = prepare_run(args)
+    if run is None:
+        exit(0)
 
-    os.system(submit + script)
+    os.system(run['submit'] + run['script'])
     # subprocess.call([submit, script])
-    print('Submitted ' + name + ' to ' + queue)
+    print('Submitted ' + run['name'] + ' to ' + run['queue'])
@@ -0,0 +1 @@
+"__init__.py for workflow_management"
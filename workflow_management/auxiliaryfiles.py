@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+import os
+import hashlib
+
+# sha256sum format, so `sha256sum -c AUXILIARY_FILES` also checks a job
+AUXILIARY_MANIFEST = 'AUXILIARY_FILES'
+HASH_BLOCK_SIZE = 1048576
+
+# (device, inode, size, mtime) -> sha256; a file linked into many job
+# directories is hashed once per process
+_digests = {}
+
+
+def file_digest(path):
+    stat = os.stat(path)
+    key = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    if key not in _digests:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                digest.update(block)
+        _digests[key] = digest.hexdigest()
+    return _digests[key]
+
+
+def write_manifest(directory, digests):
+    # digests is {file name: sha256}
+    with open(os.path.join(directory, AUXILIARY_MANIFEST), 'w') as f:
+        for name in sorted(digests):
+            f.write('%s  %s\n' % (digests[name], name))
+
+
+def read_manifest(directory):
+    # {file name: sha256}; empty if the job has no manifest
+    manifest_path = os.path.join(directory, AUXILIARY_MANIFEST)
+    digests = {}
+    if not os.path.exists(manifest_path):
+        return digests
+    with open(manifest_path, 'r') as f:
+        for line in f:
+            fields = line.rstrip('\n').split('  ', 1)
+            if len(fields) == 2:
+                digests[fields[1]] = fields[0]
+    return digests
+
+
+def verify_auxiliary_files(directory):
+    # problems with the auxiliary files listed in the manifest of directory,
+    # e.g. a missing file, a broken symlink or changed contents
+    problems = []
+    for name, expected in read_manifest(directory).items():
+        path = os.path.join(directory, name)
+        if os.path.islink(path) and not os.path.exists(path):
+            problems.append('%s is a broken symlink to %s' % (name, os.readlink(path)))
+        elif not os.path.exists(path):
+            problems.append('%s is missing' % name)
+        elif file_digest(path) != expected:
+            problems.append('%s does not match its recorded sha256' % name)
+    return problems
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+
+import os
+import re
+import json
+import time
+import contextlib
+import subprocess
+
+SUBMISSION_DIR = 'array_submissions'
+# keywords that differ between jobs of one array; everything else must match
+PER_JOB_KEYWORDS = ('name', 'logname')
+
+
+def vasp_arguments(job_type, job_name):
+    # vasp.py arguments for a rerun decision; None if nothing is submitted
+    if job_type == 'multi':
+        return ['-m', 'CONVERGENCE', '-n', job_name]
+    elif job_type == 'single':
+        return ['-n', job_name]
+    elif job_type == 'multi_initial':
+        return ['-m', 'CONVERGENCE', '--init', '-n', job_name]
+    else:
+        return None
+
+
+def parse_submission_id(output):
+    submitted = re.search(r'Submitted batch job (\d+)', output)
+    if submitted is None:
+        return None
+    return submitted.group(1)
+
+
+@contextlib.contextmanager
+def working_directory(path):
+    # vasp.py backs up and restarts runs relative to the working directory
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+class ArraySubmitter:
+    # Collects the rerun decisions of a pass, prepares each job with vasp.py's
+    # prepare_run in this interpreter, groups jobs with identical resource
+    # requests and submits every group as a single SLURM job array. Each task
+    # reads its directory and job name from a per-array list file.
+    def __init__(self, workflow_root, workflow_name='workflow'):
+        self.workflow_root = os.path.abspath(workflow_root)
+        self.workflow_name = str(workflow_name).replace(' ', '_')
+        self.submission_dir = os.path.join(self.workflow_root, SUBMISSION_DIR)
+        self.jobs = []
+        # paths of the last submit() that were not submitted
+        self.failed = []
+        # list files of earlier passes may still be read by pending tasks
+        self.pass_label = time.strftime('%Y%m%d-%H%M%S')
+
+    def add(self, job_type, job_name, path):
+        if vasp_arguments(job_type, job_name) is None:
+            return False
+        self.jobs.append((job_type, job_name, os.path.abspath(path)))
+        return True
+
+    def prepare_jobs(self):
+        # a job that cannot be prepared, e.g. with no Nodes in its INCAR or
+        # VASP_MPI unset, is reported and left out; the others still go
+        from vasp_run import vasp
+        prepared = []
+        for job_type, job_name, path in self.jobs:
+            args = vasp.parser.parse_args(vasp_arguments(job_type, job_name))
+            try:
+                with working_directory(path):
+                    run = vasp.prepare_run(args)
+            except Exception as error:
+                print('%s Not submitted, preparation failed: %s: %s'
+                      % (job_name, type(error).__name__, error))
+                self.failed.append(path)
+                continue
+            if run is not None:
+                prepared.append((path, job_name, run))
+        return prepared
+
+    def group_key(self, run):
+        keywords = {key: value for key, value in run['keywords'].items()
+                    if key not in PER_JOB_KEYWORDS}
+        return json.dumps([run['template_dir'], run['template'], run['submit'],
+                           run['account'], keywords], sort_keys=True, default=str)
+
+    def group_jobs(self, prepared):
+        # groups keep the order in which their first job was added
+        groups = {}
+        for path, job_name, run in prepared:
+            groups.setdefault(self.group_key(run), []).append((path, job_name, run))
+        return list(groups.values())
+
+    def write_array(self, group, group_number):
+        from vasp_run import vasp
+        group_name = '%s_%s_array%s' % (self.workflow_name, self.pass_label, group_number)
+        list_path = os.path.join(self.submission_dir, group_name + '.dirs')
+        script_path = os.path.join(self.submission_dir, group_name + '.sh')
+        with open(list_path, 'w') as f:
+            for path, job_name, run in group:
+                f.write('%s\t%s\n' % (path, job_name))
+
+        run = group[0][2]
+        keywords = dict(run['keywords'])
+        keywords['name'] = group_name
+        # expanded by bash inside the rendered python -c "..." block
+        keywords['logname'] = '${VASP_JOB_NAME}.log'
+        data = vasp.render_script(run['template_dir'], run['template'], keywords,
+                                  run['account'], script_path)
+
+        data.insert(1, '#SBATCH --array=1-%s\n' % len(group))
+        last_directive = max(i for i, line in enumerate(data) if line.startswith('#SBATCH'))
+        data[last_directive + 1:last_directive + 1] = [
+            '\n',
+            'VASP_JOB_DIR=$(sed -n "${SLURM_ARRAY_TASK_ID}p" %s | cut -f1)\n' % list_path,
+            'VASP_JOB_NAME=$(sed -n "${SLURM_ARRAY_TASK_ID}p" %s | cut -f2)\n' % list_path,
+            'cd "$VASP_JOB_DIR"\n']
+        with open(script_path, 'w') as f:
+            f.writelines(data)
+        return script_path
+
+    def submit_script(self, submit, script, cwd):
+        # the scheduler's job ID; None, with its error output printed, if the
+        # submission failed
+        command = submit.split() + [script]
+        try:
+            p = subprocess.run(command, cwd=cwd, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE, universal_newlines=True)
+        except OSError as error:
+            print('%s failed: %s' % (' '.join(command), error))
+            return None
+        print(p.stdout, end='')
+        submission_id = parse_submission_id(p.stdout)
+        if submission_id is None:
+            print('%s failed (exit status %s): %s'
+                  % (' '.join(command), p.returncode, p.stderr.strip() or 'no job ID returned'))
+        return submission_id
+
+    def submit(self):
+        # returns {path: submission ID}; array tasks are '<array ID>_<task>'.
+        # Paths that were not submitted are left in self.failed
+        submission_ids = {}
+        self.failed = []
+        if not self.jobs:
+            return submission_ids
+        os.makedirs(self.submission_dir, exist_ok=True)
+        # a new label per submission, e.g. for every pass of --watch
+        self.pass_label = time.strftime('%Y%m%d-%H%M%S')
+        prepared = self.prepare_jobs()
+        for group_number, group in enumerate(self.group_jobs(prepared), 1):
+            run = group[0][2]
+            if run['queue_type'] != 'slurm':
+                # no job arrays outside SLURM; submit each prepared script
+                for path, job_name, job_run in group:
+                    submission_id = self.submit_script(job_run['submit'], job_run['script'], path)
+                    if submission_id is None:
+                        print('%s Not submitted' % job_name)
+                        self.failed.append(path)
+                    else:
+                        submission_ids[path] = submission_id
+                continue
+            script_path = self.write_array(group, group_number)
+            array_id = self.submit_script(run['submit'], script_path, self.submission_dir)
+            if array_id is None:
+                print('Array of %s jobs to %s not submitted: %s'
+                      % (len(group), run['queue'], ', '.join(job_name for path, job_name, job_run in group)))
+                self.failed += [path for path, job_name, job_run in group]
+                continue
+            print('Submitted %s jobs as array %s to %s' % (len(group), array_id, run['queue']))
+            for task_number, (path, job_name, job_run) in enumerate(group, 1):
+                submission_ids[path] = '%s_%s' % (array_id, task_number)
+        self.jobs = []
+        return submission_ids
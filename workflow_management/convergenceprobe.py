@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+
+import xml.etree.ElementTree as ET
+from output_parsing.outputreaders import parse_value
+
+
+class ConvergenceProbe:
+    # Streams vasprun.xml with iterparse and keeps only what the convergence
+    # flags need: INCAR and parameters, the number of ionic steps, the energy
+    # keys of each SCF step of the last ionic step and its final energies.
+    # Memory stays bounded by a single ionic step regardless of file size.
+    # Raises xml.etree.ElementTree.ParseError for truncated files, like
+    # pymatgen's Vasprun.
+    def __init__(self, filename):
+        self.filename = filename
+        self.incar = {}
+        self.parameters = {}
+        self.nionic_steps = 0
+        self.final_electronic_steps = []
+        self.final_energies = {}
+
+        self.probe()
+
+    def probe(self):
+        path = []
+        scsteps = []
+        energies = {}
+        root = None
+        for event, elem in ET.iterparse(self.filename, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = elem
+                path.append(elem.tag)
+                continue
+
+            path.pop()
+            tag = elem.tag
+            parent = path[-1] if path else None
+            if 'calculation' in path:
+                if tag == 'scstep' and parent == 'calculation':
+                    energy = elem.find('energy')
+                    if energy is None:
+                        scsteps.append(frozenset())
+                    else:
+                        scsteps.append(frozenset(i.get('name') for i in energy.findall('i')))
+                    elem.clear()
+                elif tag == 'energy' and parent == 'calculation':
+                    energies = {i.get('name'): parse_value(i.text, i.get('type'))
+                                for i in elem.findall('i')}
+                    elem.clear()
+                elif tag == 'i' or (tag == 'energy' and parent == 'scstep'):
+                    # needed until the enclosing scstep/energy block ends
+                    pass
+                else:
+                    elem.clear()
+            elif tag == 'calculation' and parent == 'modeling':
+                self.nionic_steps += 1
+                self.final_electronic_steps = scsteps
+                self.final_energies = energies
+                scsteps = []
+                energies = {}
+            elif tag == 'incar' and parent == 'modeling':
+                self.incar = {i.get('name'): parse_value(i.text, i.get('type'))
+                              for i in elem.findall('i')}
+            elif tag == 'parameters' and parent == 'modeling':
+                self.parameters = {i.get('name'): parse_value(i.text, i.get('type'))
+                                   for i in elem.iter('i')}
+
+            if parent == 'modeling':
+                # drop every fully processed top-level block
+                root.clear()
+
+    @property
+    def final_energy(self):
+        return self.final_energies.get('e_0_energy')
+
+    @property
+    def converged_electronic(self):
+        if self.nionic_steps == 0:
+            return False
+        if str(self.incar.get('ALGO', '')).lower() == 'chi':
+            # response function runs have no scf steps
+            return True
+        nelm = self.parameters.get('NELM', 60)
+        if self.incar.get('LEPSILON'):
+            i = 1
+            to_check = {'e_wo_entrp', 'e_fr_energy', 'e_0_energy'}
+            while i < len(self.final_electronic_steps) and \
+                    set(self.final_electronic_steps[i]) == to_check:
+                i += 1
+            return i + 1 != nelm
+        return len(self.final_electronic_steps) < nelm
+
+    @property
+    def converged_ionic(self):
+        nsw = self.parameters.get('NSW', 0)
+        return nsw <= 1 or self.nionic_steps < nsw
+
+    @property
+    def converged(self):
+        return self.converged_electronic and self.converged_ionic
+
+    def as_dict(self):
+        return {'converged': self.converged,
+                'converged_electronic': self.converged_electronic,
+                'converged_ionic': self.converged_ionic,
+                'nionic_steps': self.nionic_steps,
+                'final_energy': self.final_energy}
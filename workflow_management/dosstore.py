@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+import os
+import json
+import shutil
+import numpy as np
+
+DOS_ARRAYS = ('energies', 'total', 'projected')
+
+
+class DosStore:
+    # Stores each job's complete DOS as float32 .npy arrays in its own
+    # directory below store_dir:
+    #   energies.npy   (n_energies,)
+    #   total.npy      (n_spins, n_energies)
+    #   projected.npy  (n_sites, n_orbitals, n_spins, n_energies)
+    #   dos.json       Fermi level, spins, orbital labels and energy window
+    # .npy files (unlike .npz members) can be memory-mapped on load.
+    def __init__(self, store_dir, energy_window=None):
+        self.store_dir = os.path.abspath(store_dir)
+        # (min, max) in eV relative to the Fermi level, or None for all energies
+        self.energy_window = energy_window
+
+    def entry_dir(self, entry_id):
+        return os.path.join(self.store_dir, str(entry_id).replace(os.sep, '_'))
+
+    def dos_arrays(self, complete_dos):
+        from pymatgen.electronic_structure.core import Spin
+        energies = np.asarray(complete_dos.energies, dtype=np.float64)
+        spins = [spin for spin in (Spin.up, Spin.down) if spin in complete_dos.densities]
+        mask = np.ones(len(energies), dtype=bool)
+        if self.energy_window is not None:
+            shifted = energies - complete_dos.efermi
+            mask = (shifted >= self.energy_window[0]) & (shifted <= self.energy_window[1])
+
+        total = np.array([complete_dos.densities[spin][mask] for spin in spins],
+                         dtype=np.float32)
+        sites = list(complete_dos.structure)
+        orbitals = []
+        for site in sites:
+            for orbital in complete_dos.pdos.get(site, {}):
+                if orbital not in orbitals:
+                    orbitals.append(orbital)
+        projected = np.zeros((len(sites), len(orbitals), len(spins), int(mask.sum())),
+                             dtype=np.float32)
+        for i, site in enumerate(sites):
+            site_pdos = complete_dos.pdos.get(site, {})
+            for j, orbital in enumerate(orbitals):
+                for k, spin in enumerate(spins):
+                    if orbital in site_pdos and spin in site_pdos[orbital]:
+                        projected[i, j, k] = site_pdos[orbital][spin][mask]
+
+        metadata = {'efermi': float(complete_dos.efermi),
+                    'spins': [int(spin) for spin in spins],
+                    'orbitals': [str(orbital) for orbital in orbitals],
+                    'energy_window': list(self.energy_window) if self.energy_window else None}
+        return {'energies': energies[mask].astype(np.float32),
+                'total': np.ascontiguousarray(total),
+                'projected': np.ascontiguousarray(projected)}, metadata
+
+    def write(self, entry_id, complete_dos):
+        # returns the entry directory relative to the parent of store_dir
+        arrays, metadata = self.dos_arrays(complete_dos)
+        entry_dir = self.entry_dir(entry_id)
+        tmp_dir = entry_dir + '.tmp'
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir)
+        os.makedirs(tmp_dir)
+        for name in DOS_ARRAYS:
+            np.save(os.path.join(tmp_dir, name + '.npy'), arrays[name])
+        with open(os.path.join(tmp_dir, 'dos.json'), 'w') as f:
+            json.dump(metadata, f)
+        if os.path.exists(entry_dir):
+            shutil.rmtree(entry_dir)
+        os.replace(tmp_dir, entry_dir)
+        return os.path.relpath(entry_dir, os.path.dirname(self.store_dir))
+
+    def load(self, entry_id, mmap=True):
+        return load_dos(self.entry_dir(entry_id), mmap)
+
+    def entry_ids(self):
+        if not os.path.isdir(self.store_dir):
+            return []
+        return sorted(name for name in os.listdir(self.store_dir)
+                      if not name.endswith('.tmp') and
+                      os.path.exists(os.path.join(self.store_dir, name, 'dos.json')))
+
+
+def load_dos(entry_dir, mmap=True):
+    # dict of (memory-mapped) arrays plus the dos.json metadata
+    mmap_mode = 'r' if mmap else None
+    with open(os.path.join(entry_dir, 'dos.json'), 'r') as f:
+        dos = json.load(f)
+    for name in DOS_ARRAYS:
+        dos[name] = np.load(os.path.join(entry_dir, name + '.npy'), mmap_mode=mmap_mode)
+    return dos
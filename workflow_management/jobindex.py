@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+
+import os
+import json
+
+VASP_INPUTS = ('INCAR', 'KPOINTS', 'POTCAR', 'POSCAR')
+INDEX_NAME = 'JOB_INDEX.json'
+INDEX_VERSION = 1
+
+
+class JobIndex:
+    # Discovers VASP job directories (INCAR, KPOINTS, POTCAR and POSCAR all
+    # present) below a workflow root and persists them next to WORKFLOW_NAME.
+    # Directories whose mtime is unchanged since the last pass are not
+    # rescanned, so later passes cost one stat per directory.
+    def __init__(self, workflow_root, index_name=INDEX_NAME):
+        self.workflow_root = os.path.abspath(workflow_root)
+        self.index_path = os.path.join(self.workflow_root, index_name)
+        self.directories = {}
+        self.jobs = {}
+
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, 'r') as f:
+                loaded_index = json.load(f)
+        except (OSError, ValueError):
+            print('%s not readable; rebuilding job index' % self.index_path)
+            return
+        if loaded_index.get('Version') != INDEX_VERSION or \
+                loaded_index.get('Root') != self.workflow_root:
+            # workflow moved or index format changed; rebuild from scratch
+            return
+        self.directories = loaded_index.get('Directories', {})
+        self.jobs = loaded_index.get('Jobs', {})
+
+    def save(self):
+        index_dict = {'Version': INDEX_VERSION,
+                      'Root': self.workflow_root,
+                      'Directories': self.directories,
+                      'Jobs': self.jobs}
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(index_dict, f)
+        os.replace(tmp_path, self.index_path)
+
+    def scan_directory(self, directory):
+        subdirs = []
+        input_mtimes = {}
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                    elif entry.name in VASP_INPUTS and entry.is_file():
+                        input_mtimes[entry.name] = entry.stat().st_mtime
+                except OSError:
+                    # broken symlink or file removed mid-scan
+                    continue
+        return sorted(subdirs), input_mtimes
+
+    def refresh(self):
+        # incremental walk of the workflow tree; returns number of rescans
+        directories = {}
+        jobs = {}
+        rescanned = 0
+        stack = [self.workflow_root]
+        while stack:
+            directory = stack.pop()
+            try:
+                dir_mtime = os.stat(directory).st_mtime
+            except OSError:
+                continue
+            cached = self.directories.get(directory)
+            if cached is not None and cached['mtime'] == dir_mtime:
+                subdirs = cached['subdirs']
+                is_job = cached['job']
+                job_record = self.jobs.get(directory)
+                if is_job and job_record is not None:
+                    job_record = self.refresh_job_record(directory, job_record)
+                elif is_job:
+                    job_record = {'job_name': None,
+                                  'mtimes': self.scan_directory(directory)[1]}
+            else:
+                try:
+                    subdirs, input_mtimes = self.scan_directory(directory)
+                except OSError:
+                    continue
+                rescanned += 1
+                is_job = len(input_mtimes) == len(VASP_INPUTS)
+                job_record = None
+                if is_job:
+                    job_record = self.jobs.get(directory)
+                    if job_record is None or \
+                            job_record['mtimes'].get('INCAR') != input_mtimes['INCAR']:
+                        job_record = {'job_name': None}
+                    job_record['mtimes'] = input_mtimes
+
+            directories[directory] = {'mtime': dir_mtime, 'subdirs': subdirs,
+                                      'job': is_job}
+            if is_job and job_record is not None:
+                jobs[directory] = job_record
+            for subdir in reversed(subdirs):
+                stack.append(os.path.join(directory, subdir))
+
+        self.directories = directories
+        self.jobs = jobs
+        return rescanned
+
+    def refresh_job_record(self, directory, job_record):
+        # INCAR can be rewritten in place (SYSTEM, NELM) without touching the
+        # directory mtime; a changed INCAR invalidates the cached job name
+        try:
+            incar_mtime = os.stat(os.path.join(directory, 'INCAR')).st_mtime
+        except OSError:
+            return None
+        if job_record['mtimes'].get('INCAR') != incar_mtime:
+            job_record['mtimes']['INCAR'] = incar_mtime
+            job_record['job_name'] = None
+        return job_record
+
+    def job_paths(self):
+        return sorted(self.jobs.keys())
+
+    def num_jobs(self):
+        return len(self.jobs)
+
+    def __contains__(self, path):
+        return os.path.abspath(path) in self.jobs
+
+    def job_name(self, path):
+        try:
+            return self.jobs[os.path.abspath(path)]['job_name']
+        except KeyError:
+            return None
+
+    def set_job_name(self, path, job_name):
+        path = os.path.abspath(path)
+        if path not in self.jobs:
+            return
+        self.jobs[path]['job_name'] = job_name
+        try:
+            self.jobs[path]['mtimes']['INCAR'] = os.stat(
+                os.path.join(path, 'INCAR')).st_mtime
+        except OSError:
+            pass
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+import time
+
+
+class PollInterval:
+    # Exponential backoff between scheduler polls: reset to min_interval
+    # whenever a pass sees a change, doubled (up to max_interval) otherwise.
+    def __init__(self, min_interval=60, max_interval=1800, factor=2):
+        if min_interval <= 0 or max_interval < min_interval:
+            raise ValueError('Poll intervals must satisfy 0 < min <= max; got %s and %s' %
+                             (min_interval, max_interval))
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.factor = factor
+        self.interval = min_interval
+
+    def update(self, changed):
+        # returns the number of seconds to wait before the next poll
+        if changed:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.factor, self.max_interval)
+        return self.interval
+
+    def wait(self):
+        time.sleep(self.interval)
+
+
+class ChangeTracker:
+    # Remembers, per job directory, whether it was in the queue and the
+    # output fingerprint it had out of the queue. A job only needs attention
+    # when it is new, enters or leaves the queue, or its outputs change while
+    # it is out of the queue; output written by running jobs is ignored.
+    # A state is only remembered once it has been acted on (record), so a job
+    # whose submission failed still needs attention on the next pass.
+    def __init__(self):
+        self.states = {}
+        self.num_changed = 0
+
+    def start_pass(self):
+        self.num_changed = 0
+
+    def job_state(self, queued, fingerprint=None):
+        return (True, None) if queued else (False, tuple(fingerprint or ()))
+
+    def changed(self, path, queued, fingerprint=None):
+        if self.states.get(path) == self.job_state(queued, fingerprint):
+            return False
+        self.num_changed += 1
+        return True
+
+    def record(self, path, queued, fingerprint=None):
+        self.states[path] = self.job_state(queued, fingerprint)
+
+    def forget(self, paths):
+        # drop jobs no longer in the index
+        for path in set(self.states) - set(paths):
+            del self.states[path]
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+import os
+import time
+import getpass
+import subprocess
+
+FINISHED_STATES = ('COMPLETING', 'COMPLETED')
+
+
+class QueueSnapshot:
+    # One squeue call per pass (or per ttl seconds), filtered to the current
+    # user. Lookups by working directory and by job ID are dictionary reads.
+    def __init__(self, ttl=300, user=None):
+        self.ttl = ttl
+        if user is None:
+            user = getpass.getuser()
+        self.user = user
+        self.by_directory = {}
+        self.by_job_id = {}
+        self.taken_at = None
+
+    def expired(self):
+        if self.taken_at is None:
+            return True
+        return time.monotonic() - self.taken_at > self.ttl
+
+    def query_scheduler(self):
+        # -r lists array tasks one per line; '|' separates fields because
+        # working directories can contain spaces
+        command = ['squeue', '-h', '-r', '-u', self.user, '-o', '%i|%T|%Z']
+        p = subprocess.run(command, stdout=subprocess.PIPE,
+                           stderr=subprocess.PIPE, universal_newlines=True)
+        if p.returncode != 0:
+            raise Exception('squeue failed with exit code %s: %s' %
+                            (p.returncode, p.stderr.strip()))
+        return p.stdout.splitlines()
+
+    def refresh(self, force=False):
+        if not force and not self.expired():
+            return False
+        by_directory = {}
+        by_job_id = {}
+        for line in self.query_scheduler():
+            fields = line.strip().split('|', 2)
+            if len(fields) != 3:
+                continue
+            job_id, state, directory = fields
+            directory = os.path.normpath(directory)
+            by_job_id[job_id] = (directory, state)
+            # a directory can hold a finishing job and its resubmission
+            if directory not in by_directory or \
+                    by_directory[directory] in FINISHED_STATES:
+                by_directory[directory] = state
+        self.by_directory = by_directory
+        self.by_job_id = by_job_id
+        self.taken_at = time.monotonic()
+        return True
+
+    def state(self, path):
+        return self.by_directory.get(os.path.normpath(path))
+
+    def job_state(self, job_id):
+        try:
+            return self.by_job_id[str(job_id)][1]
+        except KeyError:
+            return None
+
+    def in_queue(self, path):
+        state = self.state(path)
+        return state is not None and state not in FINISHED_STATES
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+
+import os
+import io
+import gzip
+import json
+import zlib
+from workflow_management.dosstore import DosStore
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_EXTENSIONS = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+RESULT_FIELDS = ('energy', 'final_structure', 'magmoms', 'convergence',
+                 'parameters', 'incar', 'dos', 'complete_dos', 'vasprun')
+DEFAULT_FIELDS = ('energy', 'final_structure', 'magmoms', 'convergence')
+# fields that need pymatgen's full Vasprun parse, and those that also need the DOS
+VASPRUN_FIELDS = ('parameters', 'incar', 'dos', 'complete_dos', 'vasprun')
+DOS_FIELDS = ('dos', 'complete_dos', 'vasprun')
+
+
+class ResultsSink:
+    # Appends one JSON record per newly converged job to a JSON-lines file,
+    # optionally gzip or zstd compressed. Recorded entry IDs are kept in a
+    # plain text '.ids' file next to it, so jobs are never written twice and
+    # the data file is never read back or rewritten. The 'dos' field writes
+    # the DOS to a DosStore and records only its location.
+    def __init__(self, path, compression=None, fields=DEFAULT_FIELDS, dos_store=None):
+        if compression not in COMPRESSION_EXTENSIONS:
+            raise ValueError('Compression %s not supported; use one of %s' %
+                             (compression, [c for c in COMPRESSION_EXTENSIONS if c]))
+        if compression == 'zstd' and zstandard is None:
+            raise ImportError('zstd compression requires the zstandard package')
+        for field in fields:
+            if field not in RESULT_FIELDS:
+                raise ValueError('%s not a supported result field; choose from %s' %
+                                 (field, list(RESULT_FIELDS)))
+        self.compression = compression
+        self.fields = tuple(fields)
+        self.path = path + COMPRESSION_EXTENSIONS[compression]
+        self.ids_path = self.path + '.ids'
+        if 'dos' in self.fields and dos_store is None:
+            dos_store = DosStore(os.path.splitext(path)[0] + '_dos')
+        self.dos_store = dos_store
+        self.recorded = self.read_recorded()
+        self.data_file = None
+        self.ids_file = None
+
+    def read_recorded(self):
+        if os.path.exists(self.ids_path):
+            with open(self.ids_path, 'r') as f:
+                return set(line.rstrip('\n') for line in f if line.strip())
+        recorded = set()
+        if os.path.exists(self.path):
+            # rebuild a lost ids file from the data itself
+            for entry in self.iter_entries():
+                recorded.add(entry['entry_id'])
+            with open(self.ids_path, 'w') as f:
+                f.writelines('%s\n' % entry_id for entry_id in sorted(recorded))
+        return recorded
+
+    def open_for_reading(self):
+        if self.compression == 'gzip':
+            return gzip.open(self.path, 'rt')
+        elif self.compression == 'zstd':
+            reader = zstandard.ZstdDecompressor().stream_reader(
+                open(self.path, 'rb'), read_across_frames=True)
+            return io.TextIOWrapper(reader, encoding='utf-8')
+        else:
+            return open(self.path, 'r')
+
+    def iter_entries(self):
+        # an unfinished last record (interrupted pass) ends the iteration
+        with self.open_for_reading() as f:
+            try:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        return
+            except (EOFError, zlib.error):
+                return
+
+    def open_for_appending(self):
+        if self.compression == 'gzip':
+            # every pass appends one gzip member
+            return gzip.open(self.path, 'at')
+        elif self.compression == 'zstd':
+            # every pass appends one zstd frame
+            writer = zstandard.ZstdCompressor().stream_writer(open(self.path, 'ab'))
+            return io.TextIOWrapper(writer, encoding='utf-8')
+        else:
+            return open(self.path, 'a')
+
+    def build_entry(self, entry_id, path, summary=None):
+        # a field that cannot be read, e.g. from a vasprun.xml pymatgen fails
+        # to parse, is left out and its error kept under 'errors'
+        entry = {'entry_id': entry_id, 'path': path}
+        errors = {}
+        outputs = {}
+        for field in self.fields:
+            try:
+                entry[field] = self.field_value(field, entry_id, path, summary, outputs)
+            except Exception as error:
+                errors[field] = '%s: %s' % (type(error).__name__, error)
+        if errors:
+            print('%s results not read: %s' % (entry_id, '; '.join(
+                '%s (%s)' % (field, error) for field, error in errors.items())))
+            entry['errors'] = errors
+        return entry
+
+    def field_value(self, field, entry_id, path, summary, outputs):
+        # outputs holds what was read for this entry, so final_structure and
+        # magmoms share one vasprun.xml head and one OUTCAR scan
+        if field == 'final_structure':
+            from structure_retrieval.finalstructure import read_final_vasprun_structure, \
+                prev_run_site_properties
+            head = self.read_output(path, outputs, 'head')
+            structure = read_final_vasprun_structure(os.path.join(path, 'vasprun.xml'),
+                                                     head['atomic_symbols'])
+            magnetization = self.read_output(path, outputs, 'magnetization')
+            return structure.copy(site_properties=prev_run_site_properties(
+                structure, head, magnetization)).as_dict()
+        elif field == 'magmoms':
+            # None for runs that are not spin polarized, without reading OUTCAR
+            return self.read_output(path, outputs, 'magnetization')
+        elif field == 'energy' and summary is not None:
+            return summary['final_energy']
+        elif field == 'convergence' and summary is not None:
+            return {key: summary[key] for key in
+                    ('converged', 'converged_electronic', 'converged_ionic')}
+
+        V = self.parse_vasprun(path, outputs)
+        if field == 'energy':
+            return V.final_energy
+        elif field == 'convergence':
+            return {'converged': V.converged,
+                    'converged_electronic': V.converged_electronic,
+                    'converged_ionic': V.converged_ionic}
+        elif field == 'parameters':
+            return dict(V.parameters)
+        elif field == 'incar':
+            return dict(V.incar)
+        elif field == 'dos':
+            return self.dos_store.write(entry_id, V.complete_dos)
+        elif field == 'complete_dos':
+            return V.complete_dos.as_dict()
+        elif field == 'vasprun':
+            return V.as_dict()
+
+    def read_output(self, path, outputs, name):
+        # the vasprun.xml head or the final OUTCAR magnetization, read once
+        from structure_retrieval.finalstructure import read_vasprun_head, read_run_magnetization
+        if name not in outputs:
+            if name == 'head':
+                outputs['head'] = read_vasprun_head(os.path.join(path, 'vasprun.xml'))
+            else:
+                outputs['magnetization'] = read_run_magnetization(
+                    path, self.read_output(path, outputs, 'head'))
+        return outputs[name]
+
+    def parse_vasprun(self, path, outputs):
+        # parsed at most once per entry, also when the parse fails
+        if 'vasprun_error' in outputs:
+            raise outputs['vasprun_error']
+        if 'vasprun' not in outputs:
+            from pymatgen.io.vasp.outputs import Vasprun
+            parse_dos = any(field in DOS_FIELDS for field in self.fields)
+            try:
+                outputs['vasprun'] = Vasprun(os.path.join(path, 'vasprun.xml'), parse_dos=parse_dos,
+                                             parse_eigen=parse_dos, parse_potcar_file=False)
+            except Exception as error:
+                outputs['vasprun_error'] = error
+                raise
+        return outputs['vasprun']
+
+    def record(self, entry_id, path, summary=None):
+        # returns False if entry_id was recorded by an earlier pass
+        if entry_id in self.recorded:
+            return False
+        entry = self.build_entry(entry_id, path, summary)
+        if self.data_file is None:
+            self.data_file = self.open_for_appending()
+            self.ids_file = open(self.ids_path, 'a')
+        self.data_file.write(json.dumps(entry) + '\n')
+        self.data_file.flush()
+        # ids only after the record itself is written
+        self.ids_file.write('%s\n' % entry_id)
+        self.ids_file.flush()
+        self.recorded.add(entry_id)
+        return True
+
+    def close(self):
+        if self.data_file is not None:
+            self.data_file.close()
+            self.ids_file.close()
+            self.data_file = None
+            self.ids_file = None
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+
+import os
+import re
+import math
+from output_parsing.outputreaders import reverse_lines, OUTCAR_ITERATION, OUTCAR_FREE_ENERGY
+
+# electronic steps used for the convergence trend of an ionic step
+TREND_WINDOW = 10
+DEFAULT_NELM = 60
+DEFAULT_EDIFF = 1e-4
+# NELM is never raised past MAX_NELM; a trend needing more steps is hopeless
+INCREASED_NELM = 500
+MAX_NELM = 1000
+FALLBACK_ALGO = 'All'
+
+# DAV:   3    -0.108718060E+03   -0.41217E+00   -0.52190E+00  1152   0.364E+00
+OSZICAR_ELECTRONIC = re.compile(r'^\s*(\w+)\s*:\s+(\d+)\s+(\S+)\s+(\S+)')
+#    1 F= -.10871806E+03 E0= -.10871806E+03  d E =-.108718E+03  mag=     2.0000
+OSZICAR_IONIC = re.compile(r'^\s*(\d+)\s+F=\s*(\S+)\s+E0=\s*(\S+)')
+#   total energy-change (2. order) :-0.4121709E+00  (-0.5219036E+00)
+OUTCAR_ENERGY_CHANGE = re.compile(r'total energy-change \(2\. order\)\s*:\s*(\S+)')
+
+
+def to_float(text):
+    # VASP writes '********' for values that overflow their field
+    try:
+        return float(text)
+    except ValueError:
+        return float('nan')
+
+
+def new_ionic_step(ionic_step=None, complete=False, energy=None):
+    return {'ionic_step': ionic_step, 'complete': complete, 'energy': energy,
+            'dE': []}
+
+
+def read_oszicar_tail(path, num_ionic_steps):
+    # last num_ionic_steps ionic steps, oldest first; the newest step is
+    # incomplete (no 'F=' line) when the run stopped during its SCF
+    ionic_steps = []
+    current = new_ionic_step()
+    for line in reverse_lines(path):
+        ionic = OSZICAR_IONIC.match(line)
+        if ionic is not None:
+            if current['complete'] or current['dE']:
+                ionic_steps.append(current)
+                if len(ionic_steps) == num_ionic_steps:
+                    break
+            current = new_ionic_step(int(ionic.group(1)), True, to_float(ionic.group(2)))
+            continue
+        electronic = OSZICAR_ELECTRONIC.match(line)
+        if electronic is not None:
+            current['dE'].append(to_float(electronic.group(4)))
+    else:
+        if current['complete'] or current['dE']:
+            ionic_steps.append(current)
+    for ionic_step in ionic_steps:
+        ionic_step['dE'].reverse()
+    ionic_steps.reverse()
+    return ionic_steps
+
+
+def read_outcar_tail(path, num_ionic_steps):
+    # same as read_oszicar_tail from the OUTCAR iteration blocks
+    ionic_steps = []
+    current = None
+    energy_change = None
+    free_energy_seen = False
+    for line in reverse_lines(path):
+        if OUTCAR_FREE_ENERGY in line:
+            free_energy_seen = True
+            continue
+        change = OUTCAR_ENERGY_CHANGE.search(line)
+        if change is not None:
+            energy_change = to_float(change.group(1))
+            continue
+        iteration = OUTCAR_ITERATION.search(line)
+        if iteration is None:
+            continue
+        ionic_step = int(iteration.group(1))
+        if current is None or current['ionic_step'] != ionic_step:
+            if current is not None:
+                ionic_steps.append(current)
+                if len(ionic_steps) == num_ionic_steps:
+                    current = None
+                    break
+            current = new_ionic_step(ionic_step, free_energy_seen)
+        free_energy_seen = False
+        if energy_change is not None:
+            current['dE'].append(energy_change)
+        energy_change = None
+    if current is not None:
+        ionic_steps.append(current)
+    for ionic_step in ionic_steps:
+        ionic_step['dE'].reverse()
+    ionic_steps.reverse()
+    return ionic_steps
+
+
+def log_slope(values):
+    # least squares slope of log10|value| per step; None for < 2 usable values
+    points = [(i, math.log10(abs(value))) for i, value in enumerate(values)
+              if value != 0 and not math.isnan(value)]
+    if len(points) < 2:
+        return None
+    n = len(points)
+    mean_x = sum(x for x, y in points) / n
+    mean_y = sum(y for x, y in points) / n
+    variance = sum((x - mean_x) ** 2 for x, y in points)
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+
+
+class ScfMonitor:
+    # Reads only the tail of OSZICAR (or OUTCAR if there is no OSZICAR) and
+    # summarises the electronic convergence of the last few ionic steps.
+    def __init__(self, path, num_ionic_steps=3):
+        self.path = path
+        if os.path.basename(path).startswith('OUTCAR'):
+            self.ionic_steps = read_outcar_tail(path, num_ionic_steps)
+        else:
+            self.ionic_steps = read_oszicar_tail(path, num_ionic_steps)
+
+    @classmethod
+    def from_directory(cls, directory, num_ionic_steps=3):
+        # None if the job has written neither file
+        for file_name in ('OSZICAR', 'OUTCAR'):
+            path = os.path.join(directory, file_name)
+            if os.path.exists(path) and os.path.getsize(path) > 0:
+                return cls(path, num_ionic_steps)
+        return None
+
+    def step_counts(self):
+        return [len(ionic_step['dE']) for ionic_step in self.ionic_steps]
+
+    def trend(self, ionic_step, window=TREND_WINDOW):
+        # log10|dE| slope, sign changes of dE and final |dE| over the last
+        # window electronic steps of ionic_step
+        dE = [value for value in ionic_step['dE'][-window:] if not math.isnan(value)]
+        sign_changes = sum(1 for a, b in zip(dE, dE[1:]) if a * b < 0)
+        return {'num_steps': len(ionic_step['dE']),
+                'final_dE': abs(dE[-1]) if dE else None,
+                'slope': log_slope(dE),
+                'oscillation': sign_changes / float(len(dE) - 1) if len(dE) > 1 else 0.0}
+
+    def unconverged_step(self, nelm):
+        # the most recent complete ionic step that used up NELM, otherwise
+        # the most recent step with electronic steps
+        for ionic_step in reversed(self.ionic_steps):
+            if ionic_step['complete'] and len(ionic_step['dE']) >= nelm:
+                return ionic_step
+        for ionic_step in reversed(self.ionic_steps):
+            if ionic_step['dE']:
+                return ionic_step
+        return None
+
+    def diagnose(self, ediff=DEFAULT_EDIFF, nelm=DEFAULT_NELM):
+        # 'slow' (steadily decreasing |dE|), 'sloshing' (|dE| oscillating
+        # without decreasing), 'stagnant', or None without electronic steps.
+        # For 'slow' also the estimated number of electronic steps needed
+        ionic_step = self.unconverged_step(nelm)
+        if ionic_step is None:
+            return None, None
+        trend = self.trend(ionic_step)
+        slope = trend['slope']
+        if slope is not None and slope < -0.01:
+            if trend['final_dE'] <= ediff:
+                return 'slow', trend['num_steps']
+            remaining = (math.log10(ediff) - math.log10(trend['final_dE'])) / slope
+            return 'slow', int(math.ceil(trend['num_steps'] + remaining))
+        if trend['oscillation'] >= 0.5:
+            return 'sloshing', None
+        return 'stagnant', None
+
+
+def electronic_rerun_policy(monitor, incar):
+    # (action, value) for a job that missed electronic convergence:
+    # ('increase_nelm', NELM), ('switch_algo', ALGO) or ('leave', reason)
+    nelm = int(incar.get('NELM', DEFAULT_NELM))
+    if monitor is None:
+        return 'increase_nelm', max(nelm, INCREASED_NELM)
+    diagnosis, steps_needed = monitor.diagnose(float(incar.get('EDIFF', DEFAULT_EDIFF)), nelm)
+    if diagnosis is None:
+        return 'increase_nelm', max(nelm, INCREASED_NELM)
+    if diagnosis == 'slow' and steps_needed <= MAX_NELM:
+        if steps_needed <= nelm:
+            # converging, but the run stopped before the step finished; the
+            # same NELM would not be a change, so allow the steps again on top
+            return 'increase_nelm', min(MAX_NELM, max(INCREASED_NELM, nelm + steps_needed))
+        return 'increase_nelm', min(MAX_NELM, max(INCREASED_NELM, int(1.5 * steps_needed)))
+    algo = str(incar.get('ALGO', 'Normal'))
+    if algo.lower() != FALLBACK_ALGO.lower():
+        return 'switch_algo', FALLBACK_ALGO
+    if diagnosis == 'slow':
+        return 'leave', 'electronic convergence needs about %s steps (NELM limit %s)' % (steps_needed, MAX_NELM)
+    return 'leave', 'electronic steps %s with ALGO = %s' % (
+        'oscillating' if diagnosis == 'sloshing' else 'not decreasing', algo)
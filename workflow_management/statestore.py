@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+
+import os
+import time
+import json
+import sqlite3
+
+STORE_NAME = 'WORKFLOW_STATE.db'
+FINGERPRINT_FILES = ('vasprun.xml', 'OUTCAR')
+COLUMNS = ('path', 'job_name', 'stage', 'decision', 'vasprun_mtime',
+           'vasprun_size', 'outcar_mtime', 'outcar_size', 'submission_id',
+           'result_summary', 'updated')
+
+
+def output_fingerprint(path):
+    # (vasprun mtime, vasprun size, OUTCAR mtime, OUTCAR size); None if absent
+    fingerprint = []
+    for file_name in FINGERPRINT_FILES:
+        try:
+            st = os.stat(os.path.join(path, file_name))
+            fingerprint += [st.st_mtime, st.st_size]
+        except OSError:
+            fingerprint += [None, None]
+    return tuple(fingerprint)
+
+
+class JobStateStore:
+    # Per-workflow record of each job's stage, last rerun decision, output
+    # fingerprint, submission ID and result summary. A job whose last decision
+    # was 'converged' and whose fingerprint is unchanged does not need to be
+    # parsed again.
+    def __init__(self, workflow_root, store_name=STORE_NAME):
+        self.workflow_root = os.path.abspath(workflow_root)
+        self.store_path = os.path.join(self.workflow_root, store_name)
+        self.connection = sqlite3.connect(self.store_path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            'path TEXT PRIMARY KEY, job_name TEXT, stage INTEGER, '
+            'decision TEXT, vasprun_mtime REAL, vasprun_size INTEGER, '
+            'outcar_mtime REAL, outcar_size INTEGER, submission_id TEXT, '
+            'result_summary TEXT, updated REAL)')
+        self.connection.commit()
+
+    def get(self, path):
+        row = self.connection.execute(
+            'SELECT * FROM jobs WHERE path = ?', (os.path.abspath(path),)).fetchone()
+        if row is None:
+            return None
+        job_state = dict(row)
+        if job_state['result_summary'] is not None:
+            job_state['result_summary'] = json.loads(job_state['result_summary'])
+        return job_state
+
+    def fingerprint(self, path):
+        job_state = self.get(path)
+        if job_state is None:
+            return None
+        return (job_state['vasprun_mtime'], job_state['vasprun_size'],
+                job_state['outcar_mtime'], job_state['outcar_size'])
+
+    def is_unchanged_convergence(self, path, fingerprint):
+        # True if path converged last time and its outputs have not changed
+        job_state = self.get(path)
+        if job_state is None or job_state['decision'] != 'converged':
+            return False
+        return self.fingerprint(path) == tuple(fingerprint)
+
+    def record(self, path, **fields):
+        # merges fields into the stored row; changes are committed by commit()
+        path = os.path.abspath(path)
+        job_state = self.get(path) or {column: None for column in COLUMNS}
+        fingerprint = fields.pop('fingerprint', None)
+        if fingerprint is not None:
+            (fields['vasprun_mtime'], fields['vasprun_size'],
+             fields['outcar_mtime'], fields['outcar_size']) = fingerprint
+        for key in fields:
+            if key not in COLUMNS:
+                raise KeyError('%s is not a job state field' % key)
+        job_state.update(fields)
+        job_state['path'] = path
+        job_state['updated'] = time.time()
+        if job_state['decision'] is not None:
+            job_state['decision'] = str(job_state['decision'])
+        if job_state['result_summary'] is not None:
+            job_state['result_summary'] = json.dumps(job_state['result_summary'])
+        self.connection.execute(
+            'INSERT OR REPLACE INTO jobs (%s) VALUES (%s)' %
+            (', '.join(COLUMNS), ', '.join('?' * len(COLUMNS))),
+            [job_state[column] for column in COLUMNS])
+
+    def completed_jobs(self, paths=None):
+        # {path: job_name} of converged jobs, optionally restricted to paths
+        rows = self.connection.execute(
+            "SELECT path, job_name FROM jobs WHERE decision = 'converged' "
+            "ORDER BY path").fetchall()
+        completed = {row['path']: row['job_name'] for row in rows}
+        if paths is not None:
+            paths = set(paths)
+            completed = {path: name for path, name in completed.items() if path in paths}
+        return completed
+
+    def commit(self):
+        self.connection.commit()
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
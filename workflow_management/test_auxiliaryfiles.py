@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+
+import os
+import hashlib
+import tempfile
+import unittest
+from workflow_management.auxiliaryfiles import (file_digest, write_manifest, read_manifest,
+                                                verify_auxiliary_files, AUXILIARY_MANIFEST)
+
+
+class TestAuxiliaryFiles(unittest.TestCase):
+    def setUp(self):
+        # a job directory with a copied and a symlinked auxiliary file
+        self.tmp = tempfile.TemporaryDirectory()
+        self.job = os.path.join(self.tmp.name, 'job')
+        os.makedirs(self.job)
+        self.kernel = os.path.join(self.tmp.name, 'vdw_kernel.bindat')
+        with open(self.kernel, 'wb') as f:
+            f.write(b'kernel' * 1000)
+        os.symlink(self.kernel, os.path.join(self.job, 'vdw_kernel.bindat'))
+        with open(os.path.join(self.job, 'EXTRA'), 'w') as f:
+            f.write('extra data')
+        write_manifest(self.job, {name: file_digest(os.path.join(self.job, name))
+                                  for name in ('vdw_kernel.bindat', 'EXTRA')})
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_manifest(self):
+        # sha256sum format, sorted by name
+        with open(os.path.join(self.job, AUXILIARY_MANIFEST)) as f:
+            lines = f.read().splitlines()
+        expected = hashlib.sha256(b'kernel' * 1000).hexdigest()
+        self.assertEqual(lines[1], '%s  vdw_kernel.bindat' % expected)
+        self.assertEqual(read_manifest(self.job)['vdw_kernel.bindat'], expected)
+        self.assertEqual(sorted(read_manifest(self.job)), ['EXTRA', 'vdw_kernel.bindat'])
+
+    def test_intact(self):
+        self.assertEqual(verify_auxiliary_files(self.job), [])
+
+    def test_no_manifest(self):
+        os.remove(os.path.join(self.job, AUXILIARY_MANIFEST))
+        self.assertEqual(read_manifest(self.job), {})
+        self.assertEqual(verify_auxiliary_files(self.job), [])
+
+    def test_changed(self):
+        path = os.path.join(self.job, 'EXTRA')
+        os.remove(path)
+        with open(path, 'w') as f:
+            f.write('other data!')
+        self.assertEqual(verify_auxiliary_files(self.job),
+                         ['EXTRA does not match its recorded sha256'])
+
+    def test_missing(self):
+        os.remove(os.path.join(self.job, 'EXTRA'))
+        self.assertEqual(verify_auxiliary_files(self.job), ['EXTRA is missing'])
+
+    def test_broken_symlink(self):
+        os.remove(self.kernel)
+        self.assertEqual(verify_auxiliary_files(self.job),
+                         ['vdw_kernel.bindat is a broken symlink to %s' % self.kernel])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+import io
+import os
+import sys
+import tempfile
+import unittest
+import argparse
+import contextlib
+from types import SimpleNamespace
+from unittest import mock
+from workflow_management.batchsubmission import ArraySubmitter
+
+
+def fake_vasp(failing_job):
+    # stands in for vasp_run.vasp, whose prepare_run fails for one job
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-m')
+    parser.add_argument('-n')
+    parser.add_argument('--init', action='store_true')
+
+    def prepare_run(args):
+        if args.n == failing_job:
+            raise KeyError('VASP_MPI')
+        return {'name': args.n, 'cwd': os.getcwd()}
+    return SimpleNamespace(parser=parser, prepare_run=prepare_run)
+
+
+class TestArraySubmitter(unittest.TestCase):
+    def test_failed_preparation_skips_only_that_job(self):
+        with tempfile.TemporaryDirectory() as root:
+            submitter = ArraySubmitter(root)
+            for job_name in ('a', 'b', 'c'):
+                os.makedirs(os.path.join(root, job_name))
+                submitter.add('single', job_name, os.path.join(root, job_name))
+            output = io.StringIO()
+            with mock.patch.dict(sys.modules, {'vasp_run.vasp': fake_vasp('b')}), \
+                    contextlib.redirect_stdout(output):
+                prepared = submitter.prepare_jobs()
+            self.assertEqual([job_name for path, job_name, run in prepared], ['a', 'c'])
+            self.assertEqual(prepared[1][2]['cwd'], os.path.realpath(os.path.join(root, 'c')))
+            self.assertIn('b Not submitted, preparation failed: KeyError', output.getvalue())
+
+    def test_failed_array_submission(self):
+        # sbatch exits with an error and no job ID
+        with tempfile.TemporaryDirectory() as root:
+            sbatch = os.path.join(root, 'sbatch')
+            with open(sbatch, 'w') as f:
+                f.write('#!/bin/sh\necho "sbatch: error: invalid partition" >&2\nexit 1\n')
+            os.chmod(sbatch, 0o755)
+            submitter = ArraySubmitter(root)
+            run = {'queue_type': 'slurm', 'submit': sbatch, 'queue': 'short'}
+            prepared = []
+            for job_name in ('a', 'b'):
+                path = os.path.join(root, job_name)
+                submitter.add('single', job_name, path)
+                prepared.append((path, job_name, run))
+            output = io.StringIO()
+            with mock.patch.object(submitter, 'prepare_jobs', return_value=prepared), \
+                    mock.patch.object(submitter, 'group_key', return_value='group'), \
+                    mock.patch.object(submitter, 'write_array', return_value='array.sh'), \
+                    contextlib.redirect_stdout(output):
+                submission_ids = submitter.submit()
+            self.assertEqual(submission_ids, {})
+            self.assertEqual(submitter.failed, [path for path, job_name, run in prepared])
+            self.assertIn('sbatch: error: invalid partition', output.getvalue())
+            self.assertIn('Array of 2 jobs to short not submitted: a, b', output.getvalue())
+            self.assertNotIn('as array None', output.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
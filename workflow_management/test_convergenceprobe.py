@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+import os
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+from workflow_management.convergenceprobe import ConvergenceProbe, parse_value
+
+
+def scstep():
+    return ('<scstep><energy><i name="e_fr_energy"> -10.0 </i>'
+            '<i name="e_wo_entrp"> -10.0 </i><i name="e_0_energy"> -10.0 </i>'
+            '</energy></scstep>')
+
+
+def vasprun_xml(scsteps_per_ionic_step, nsw=3, nelm=5, algo='Normal'):
+    calculations = ''
+    for i, num_scsteps in enumerate(scsteps_per_ionic_step):
+        calculations += ('<calculation>%s<structure><crystal/></structure>'
+                         '<energy><i name="e_fr_energy"> %s </i><i name="e_0_energy"> %s </i>'
+                         '</energy></calculation>\n'
+                         % (scstep() * num_scsteps, -11.0 - i, -11.5 - i))
+    return ('<?xml version="1.0" encoding="ISO-8859-1"?>\n<modeling>\n'
+            '<incar><i type="string" name="ALGO">%s</i></incar>\n'
+            '<parameters><separator name="electronic">'
+            '<i type="int" name="NELM"> %s </i></separator>'
+            '<separator name="ionic"><i type="int" name="NSW"> %s </i></separator>'
+            '</parameters>\n%s</modeling>\n' % (algo, nelm, nsw, calculations))
+
+
+class TestConvergenceProbe(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'vasprun.xml')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def probe(self, text):
+        with open(self.path, 'w') as f:
+            f.write(text)
+        return ConvergenceProbe(self.path)
+
+    def test_converged(self):
+        probe = self.probe(vasprun_xml([4, 2]))
+        self.assertEqual(probe.nionic_steps, 2)
+        self.assertEqual(probe.parameters['NELM'], 5)
+        self.assertEqual(probe.incar['ALGO'], 'Normal')
+        self.assertEqual(probe.final_energy, -12.5)
+        self.assertEqual(probe.as_dict(), {'converged': True, 'converged_electronic': True,
+                                           'converged_ionic': True, 'nionic_steps': 2,
+                                           'final_energy': -12.5})
+
+    def test_electronic_not_converged(self):
+        # only the last ionic step counts
+        probe = self.probe(vasprun_xml([2, 5]))
+        self.assertFalse(probe.converged_electronic)
+        self.assertTrue(probe.converged_ionic)
+        self.assertFalse(probe.converged)
+        self.assertTrue(self.probe(vasprun_xml([5, 2])).converged_electronic)
+
+    def test_ionic_not_converged(self):
+        probe = self.probe(vasprun_xml([2, 2, 2]))
+        self.assertTrue(probe.converged_electronic)
+        self.assertFalse(probe.converged_ionic)
+        self.assertTrue(self.probe(vasprun_xml([2], nsw=1)).converged_ionic)
+
+    def test_no_ionic_steps(self):
+        probe = self.probe(vasprun_xml([]))
+        self.assertFalse(probe.converged_electronic)
+        self.assertIsNone(probe.final_energy)
+
+    def test_chi_has_no_scf_steps(self):
+        self.assertTrue(self.probe(vasprun_xml([0], algo='CHI')).converged_electronic)
+
+    def test_truncated(self):
+        text = vasprun_xml([4, 3])
+        for end in (len(text) // 2, text.index('</modeling>')):
+            self.assertRaises(ET.ParseError, self.probe, text[:end])
+
+    def test_parse_value(self):
+        self.assertEqual(parse_value(' T ', 'logical'), True)
+        self.assertEqual(parse_value(' 60 ', 'int'), 60)
+        self.assertEqual(parse_value('1e-05', None), 1e-05)
+        self.assertEqual(parse_value('****', 'int'), '****')
+        self.assertEqual(parse_value(None, 'string'), '')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+from workflow_management.dosstore import DosStore, load_dos
+
+try:
+    from pymatgen.core.structure import Structure
+    from pymatgen.core.lattice import Lattice
+    from pymatgen.electronic_structure.core import Spin, Orbital
+    from pymatgen.electronic_structure.dos import Dos, CompleteDos
+    HAS_PYMATGEN = True
+except ImportError:
+    HAS_PYMATGEN = False
+
+
+def dos_arrays(n_sites=2, n_orbitals=3, n_spins=2, n_energies=50):
+    # what DosStore.dos_arrays returns for a spin polarized complete DOS
+    rng = np.random.default_rng(0)
+    arrays = {'energies': np.linspace(-5, 5, n_energies).astype(np.float32),
+              'total': rng.random((n_spins, n_energies)).astype(np.float32),
+              'projected': rng.random((n_sites, n_orbitals, n_spins, n_energies)).astype(np.float32)}
+    metadata = {'efermi': 0.5, 'spins': [1, -1], 'orbitals': ['s', 'py', 'pz'],
+                'energy_window': None}
+    return arrays, metadata
+
+
+class TestDosStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = DosStore(os.path.join(self.tmp.name, 'dos'))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, entry_id, arrays_metadata):
+        with mock.patch.object(self.store, 'dos_arrays', return_value=arrays_metadata):
+            return self.store.write(entry_id, None)
+
+    def test_round_trip(self):
+        arrays, metadata = dos_arrays()
+        self.assertEqual(self.write('NiO/FM', (arrays, metadata)), os.path.join('dos', 'NiO_FM'))
+        self.assertEqual(self.store.entry_ids(), ['NiO_FM'])
+        for mmap in (True, False):
+            dos = self.store.load('NiO/FM', mmap=mmap)
+            self.assertEqual(sorted(dos), ['efermi', 'energies', 'energy_window', 'orbitals',
+                                           'projected', 'spins', 'total'])
+            self.assertEqual(dos['spins'], [1, -1])
+            self.assertEqual(dos['orbitals'], ['s', 'py', 'pz'])
+            for name in ('energies', 'total', 'projected'):
+                self.assertEqual(dos[name].dtype, np.float32)
+                self.assertEqual(dos[name].shape, arrays[name].shape)
+                np.testing.assert_array_equal(dos[name], arrays[name])
+            self.assertEqual(isinstance(dos['total'], np.memmap), mmap)
+            del dos
+
+    def test_rewrite(self):
+        self.write('NiO', dos_arrays(n_energies=50))
+        self.write('NiO', dos_arrays(n_energies=20))
+        self.assertEqual(self.store.load('NiO')['energies'].shape, (20,))
+        self.assertEqual(os.listdir(self.store.store_dir), ['NiO'])
+
+    def test_interrupted_write(self):
+        # a .tmp directory left by a killed write is not an entry
+        self.write('NiO', dos_arrays())
+        os.makedirs(os.path.join(self.store.store_dir, 'CoO.tmp'))
+        self.assertEqual(self.store.entry_ids(), ['NiO'])
+        self.write('CoO', dos_arrays())
+        self.assertEqual(self.store.entry_ids(), ['CoO', 'NiO'])
+
+    def test_missing_file(self):
+        self.write('NiO', dos_arrays())
+        os.remove(os.path.join(self.store.entry_dir('NiO'), 'projected.npy'))
+        with self.assertRaises(FileNotFoundError):
+            self.store.load('NiO')
+        os.remove(os.path.join(self.store.entry_dir('NiO'), 'dos.json'))
+        self.assertEqual(self.store.entry_ids(), [])
+        with self.assertRaises(FileNotFoundError):
+            load_dos(self.store.entry_dir('NiO'))
+
+    def test_corrupt_file(self):
+        self.write('NiO', dos_arrays())
+        total_path = os.path.join(self.store.entry_dir('NiO'), 'total.npy')
+        with open(total_path, 'rb') as f:
+            data = f.read()
+        # cut off in the middle of the array data
+        with open(total_path, 'wb') as f:
+            f.write(data[:len(data) // 2])
+        for mmap in (True, False):
+            with self.assertRaises(ValueError):
+                self.store.load('NiO', mmap=mmap)
+        # not a .npy file at all
+        with open(total_path, 'wb') as f:
+            f.write(b'not an array')
+        with self.assertRaises(ValueError):
+            self.store.load('NiO')
+
+
+@unittest.skipUnless(HAS_PYMATGEN, 'pymatgen is not installed')
+class TestDosStoreCompleteDos(unittest.TestCase):
+    def test_complete_dos(self):
+        structure = Structure(Lattice.cubic(4.17), ['Ni', 'O'], [[0, 0, 0], [0.5, 0.5, 0.5]])
+        energies = np.linspace(-10, 10, 101)
+        densities = {Spin.up: np.linspace(0, 1, 101), Spin.down: np.linspace(1, 0, 101)}
+        pdoss = {structure[0]: {Orbital.s: densities, Orbital.dxy: densities},
+                 structure[1]: {Orbital.s: densities}}
+        complete_dos = CompleteDos(structure, Dos(1.0, energies, densities), pdoss)
+        with tempfile.TemporaryDirectory() as tmp:
+            store = DosStore(tmp, energy_window=(-2, 2))
+            store.write('NiO', complete_dos)
+            dos = store.load('NiO')
+            window = (energies - 1.0 >= -2) & (energies - 1.0 <= 2)
+            self.assertEqual(dos['spins'], [1, -1])
+            self.assertEqual(dos['orbitals'], ['s', 'dxy'])
+            self.assertEqual(dos['total'].shape, (2, window.sum()))
+            self.assertEqual(dos['projected'].shape, (2, 2, 2, window.sum()))
+            np.testing.assert_allclose(dos['energies'], energies[window], rtol=1e-6)
+            np.testing.assert_allclose(dos['total'][1], densities[Spin.down][window], rtol=1e-6)
+            # O has no d orbitals
+            self.assertEqual(np.abs(dos['projected'][1, 1]).max(), 0)
+            del dos
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+from workflow_management.jobindex import JobIndex, VASP_INPUTS
+
+
+class TestJobIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = os.path.realpath(self.tmp.name)
+        self.jobs = [self.make_job('bulk', 'NiO', 'FM'), self.make_job('bulk', 'NiO', 'AFM1')]
+        # not a job: POTCAR missing
+        os.makedirs(os.path.join(self.root, 'bulk', 'notes'))
+        with open(os.path.join(self.root, 'bulk', 'notes', 'INCAR'), 'w') as f:
+            f.write('SYSTEM = notes\n')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def make_job(self, *parts):
+        path = os.path.join(self.root, *parts)
+        os.makedirs(path)
+        for file_name in VASP_INPUTS:
+            with open(os.path.join(path, file_name), 'w') as f:
+                f.write('%s\n' % file_name)
+        return path
+
+    def touch(self, path, offset):
+        # explicit mtimes, so changes are seen on coarse-grained filesystems
+        stat = os.stat(path)
+        os.utime(path, (stat.st_atime, stat.st_mtime + offset))
+
+    def test_discovery(self):
+        job_index = JobIndex(self.root)
+        self.assertGreater(job_index.refresh(), 0)
+        self.assertEqual(job_index.job_paths(), sorted(self.jobs))
+        self.assertIn(self.jobs[0], job_index)
+        self.assertEqual(job_index.refresh(), 0)
+
+    def test_incremental_refresh(self):
+        job_index = JobIndex(self.root)
+        job_index.refresh()
+        new_job = self.make_job('bulk', 'NiO', 'AFM2')
+        self.touch(os.path.dirname(new_job), 1)
+        # the changed parent and the new job directory
+        self.assertEqual(job_index.refresh(), 2)
+        self.assertEqual(job_index.num_jobs(), 3)
+
+        shutil.rmtree(self.jobs[1])
+        self.touch(os.path.dirname(self.jobs[1]), 2)
+        self.assertEqual(job_index.refresh(), 1)
+        self.assertEqual(job_index.job_paths(), sorted([self.jobs[0], new_job]))
+
+    def test_persisted(self):
+        job_index = JobIndex(self.root)
+        job_index.refresh()
+        job_index.set_job_name(self.jobs[0], 'NiO-FM')
+        job_index.save()
+        job_index = JobIndex(self.root)
+        # only the root, where the index itself was written
+        self.assertEqual(job_index.refresh(), 1)
+        self.assertEqual(job_index.job_name(self.jobs[0]), 'NiO-FM')
+        self.assertIsNone(job_index.job_name(self.jobs[1]))
+
+    def test_incar_rewrite_clears_job_name(self):
+        # rewriting INCAR in place leaves the directory mtime unchanged
+        job_index = JobIndex(self.root)
+        job_index.refresh()
+        job_index.set_job_name(self.jobs[0], 'NiO-FM')
+        self.touch(os.path.join(self.jobs[0], 'INCAR'), 1)
+        self.assertEqual(job_index.refresh(), 0)
+        self.assertIsNone(job_index.job_name(self.jobs[0]))
+
+    def test_moved_workflow_rebuilt(self):
+        job_index = JobIndex(self.root)
+        job_index.refresh()
+        job_index.save()
+        moved_root = self.root + '_moved'
+        shutil.move(self.root, moved_root)
+        try:
+            job_index = JobIndex(moved_root)
+            self.assertEqual(job_index.jobs, {})
+            job_index.refresh()
+            self.assertEqual(job_index.num_jobs(), 2)
+        finally:
+            shutil.move(moved_root, self.root)
+
+
+if __name__ == '__main__':
+    unittest.main()
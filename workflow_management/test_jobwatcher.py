@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+import unittest
+from workflow_management.jobwatcher import PollInterval, ChangeTracker
+
+
+class TestChangeTracker(unittest.TestCase):
+    def test_new_job(self):
+        tracker = ChangeTracker()
+        self.assertTrue(tracker.changed('/wf/a', False, (1.0, 10, 2.0, 20)))
+        self.assertEqual(tracker.num_changed, 1)
+
+    def test_recorded_state_unchanged(self):
+        tracker = ChangeTracker()
+        tracker.record('/wf/a', False, (1.0, 10, 2.0, 20))
+        self.assertFalse(tracker.changed('/wf/a', False, [1.0, 10, 2.0, 20]))
+        self.assertTrue(tracker.changed('/wf/a', False, (1.0, 10, 3.0, 30)))
+        self.assertTrue(tracker.changed('/wf/a', True))
+
+    def test_unrecorded_job_changed_again(self):
+        # e.g. a submission that failed; the job is looked at next pass too
+        tracker = ChangeTracker()
+        for poll in range(3):
+            tracker.start_pass()
+            self.assertTrue(tracker.changed('/wf/a', False, (1.0, 10, 2.0, 20)))
+            self.assertEqual(tracker.num_changed, 1)
+
+    def test_queue_output_ignored(self):
+        # output written while the job runs does not count as a change
+        tracker = ChangeTracker()
+        tracker.record('/wf/a', True, (1.0, 10, 2.0, 20))
+        self.assertFalse(tracker.changed('/wf/a', True, (5.0, 50, 6.0, 60)))
+
+    def test_forget(self):
+        tracker = ChangeTracker()
+        tracker.record('/wf/a', True)
+        tracker.record('/wf/b', True)
+        tracker.forget(['/wf/b'])
+        self.assertEqual(list(tracker.states), ['/wf/b'])
+
+
+class TestPollInterval(unittest.TestCase):
+    def test_backoff(self):
+        poll_interval = PollInterval(60, 300)
+        self.assertEqual([poll_interval.update(False) for i in range(4)], [120, 240, 300, 300])
+        self.assertEqual(poll_interval.update(True), 60)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, PollInterval, 0, 10)
+        self.assertRaises(ValueError, PollInterval, 60, 30)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+from workflow_management.queuesnapshot import QueueSnapshot
+
+SQUEUE = '''#!/bin/sh
+echo "$@" >> "%(calls)s"
+if [ -f "%(error)s" ]; then
+    cat "%(error)s" >&2
+    exit 1
+fi
+cat "%(output)s"
+'''
+
+
+class TestQueueSnapshot(unittest.TestCase):
+    def setUp(self):
+        # a fake squeue first on PATH, printing the contents of self.output
+        self.tmp = tempfile.TemporaryDirectory()
+        self.calls = os.path.join(self.tmp.name, 'calls')
+        self.output = os.path.join(self.tmp.name, 'output')
+        self.error = os.path.join(self.tmp.name, 'error')
+        squeue = os.path.join(self.tmp.name, 'squeue')
+        with open(squeue, 'w') as f:
+            f.write(SQUEUE % {'calls': self.calls, 'output': self.output, 'error': self.error})
+        os.chmod(squeue, 0o755)
+        path = self.tmp.name + os.pathsep + os.environ.get('PATH', '')
+        patcher = mock.patch.dict(os.environ, {'PATH': path})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.squeue('')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def squeue(self, lines):
+        with open(self.output, 'w') as f:
+            f.write(lines)
+
+    def num_calls(self):
+        if not os.path.exists(self.calls):
+            return 0
+        with open(self.calls) as f:
+            return len(f.readlines())
+
+    def test_parse(self):
+        self.squeue('101|RUNNING|/scratch/wf/bulk/NiO/FM\n'
+                    '102|PENDING|/scratch/wf/bulk/Ni O/AFM1/\n'
+                    '123_4|RUNNING|/scratch/wf/array_submissions\n'
+                    'not a job line\n')
+        snapshot = QueueSnapshot(user='someone')
+        self.assertTrue(snapshot.refresh())
+        with open(self.calls) as f:
+            self.assertEqual(f.read().split(), ['-h', '-r', '-u', 'someone', '-o', '%i|%T|%Z'])
+        self.assertEqual(snapshot.state('/scratch/wf/bulk/NiO/FM'), 'RUNNING')
+        self.assertEqual(snapshot.state('/scratch/wf/bulk/Ni O/AFM1'), 'PENDING')
+        self.assertIsNone(snapshot.state('/scratch/wf/bulk/NiO/AFM2'))
+        self.assertEqual(snapshot.job_state('123_4'), 'RUNNING')
+        self.assertIsNone(snapshot.job_state('123_5'))
+        self.assertEqual(snapshot.job_state(101), 'RUNNING')
+        self.assertEqual(sorted(snapshot.by_job_id), ['101', '102', '123_4'])
+
+    def test_resubmission_in_same_directory(self):
+        # the new job wins over one that is finishing
+        self.squeue('101|COMPLETING|/scratch/wf/bulk/NiO/FM\n'
+                    '105|PENDING|/scratch/wf/bulk/NiO/FM\n')
+        snapshot = QueueSnapshot(user='someone')
+        snapshot.refresh()
+        self.assertEqual(snapshot.state('/scratch/wf/bulk/NiO/FM'), 'PENDING')
+        self.assertTrue(snapshot.in_queue('/scratch/wf/bulk/NiO/FM'))
+
+    def test_ttl(self):
+        self.squeue('101|RUNNING|/scratch/wf/bulk/NiO/FM\n')
+        snapshot = QueueSnapshot(ttl=300, user='someone')
+        self.assertTrue(snapshot.refresh())
+        self.squeue('')
+        # reused within the ttl, unless forced
+        self.assertFalse(snapshot.refresh())
+        self.assertEqual(self.num_calls(), 1)
+        self.assertEqual(snapshot.state('/scratch/wf/bulk/NiO/FM'), 'RUNNING')
+        snapshot.taken_at -= 301
+        self.assertTrue(snapshot.refresh())
+        self.assertEqual(self.num_calls(), 2)
+        self.assertIsNone(snapshot.state('/scratch/wf/bulk/NiO/FM'))
+        self.assertTrue(snapshot.refresh(force=True))
+        self.assertEqual(self.num_calls(), 3)
+
+    def test_squeue_failure(self):
+        with open(self.error, 'w') as f:
+            f.write('slurm_load_jobs error: Socket timed out\n')
+        snapshot = QueueSnapshot(user='someone')
+        with self.assertRaisesRegex(Exception, 'exit code 1: slurm_load_jobs error'):
+            snapshot.refresh()
+        self.assertTrue(snapshot.expired())
+
+
+if __name__ == '__main__':
+    unittest.main()
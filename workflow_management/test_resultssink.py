@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+import io
+import os
+import json
+import tempfile
+import unittest
+import contextlib
+from unittest import mock
+from workflow_management.resultssink import ResultsSink
+
+try:
+    import pymatgen
+    HAS_PYMATGEN = True
+except ImportError:
+    HAS_PYMATGEN = False
+
+VASPRUN_HEAD = ('<?xml version="1.0"?>\n<modeling>\n<incar/>\n<parameters>\n'
+                '<separator name="electronic"><i type="int" name="ISPIN"> %s </i></separator>\n'
+                '</parameters>\n<atominfo><array name="atoms"><set>\n'
+                '<rc><c>Ni</c><c>1</c></rc>\n<rc><c>O </c><c>2</c></rc>\n'
+                '</set></array></atominfo>\n'
+                '<structure name="finalpos"><crystal><varray name="basis">\n'
+                '<v> 4.17 0 0 </v>\n<v> 0 4.17 0 </v>\n<v> 0 0 4.17 </v>\n</varray></crystal>\n'
+                '<varray name="positions">\n<v> 0 0 0 </v>\n<v> 0.5 0.5 0.5 </v>\n</varray>'
+                '</structure>\n</modeling>\n')
+SUMMARY = {'final_energy': -12.5, 'converged': True,
+           'converged_electronic': True, 'converged_ionic': True}
+
+
+class TestResultsSink(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.job = os.path.join(self.tmp.name, 'job')
+        os.makedirs(self.job)
+        # a vasprun.xml no parser can read
+        with open(os.path.join(self.job, 'vasprun.xml'), 'w') as f:
+            f.write('<?xml version="1.0"?>\n<modeling>\n')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_failing_field_left_out(self):
+        sink = ResultsSink(os.path.join(self.tmp.name, 'results.jsonl'),
+                           fields=('energy', 'convergence', 'parameters', 'incar'))
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.assertTrue(sink.record('job', self.job, SUMMARY))
+        sink.close()
+        with open(sink.path, 'r') as f:
+            entry = json.loads(f.readline())
+        self.assertEqual(entry['energy'], -12.5)
+        self.assertEqual(entry['convergence']['converged'], True)
+        self.assertNotIn('parameters', entry)
+        self.assertEqual(sorted(entry['errors']), ['incar', 'parameters'])
+        self.assertIn('job results not read', output.getvalue())
+
+    def magmoms_entry(self, ispin, fields=('magmoms',)):
+        with open(os.path.join(self.job, 'vasprun.xml'), 'w') as f:
+            f.write(VASPRUN_HEAD % ispin)
+        with open(os.path.join(self.job, 'OUTCAR'), 'w') as f:
+            f.write('OUTCAR\n')
+        sink = ResultsSink(os.path.join(self.tmp.name, 'results.jsonl'), fields=fields)
+        with mock.patch('structure_retrieval.finalstructure.read_final_magnetization',
+                        return_value=[1.5, 0.0]) as read_magnetization:
+            entry = sink.build_entry('job', self.job, SUMMARY)
+        return entry, read_magnetization.call_count
+
+    def test_magmoms_not_spin_polarized(self):
+        # OUTCAR is not read for ISPIN = 1
+        self.assertEqual(self.magmoms_entry(1), ({'entry_id': 'job', 'path': self.job,
+                                                  'magmoms': None}, 0))
+
+    def test_magmoms_spin_polarized(self):
+        entry, num_reads = self.magmoms_entry(2)
+        self.assertEqual(entry['magmoms'], [1.5, 0.0])
+        self.assertEqual(num_reads, 1)
+
+    @unittest.skipUnless(HAS_PYMATGEN, 'pymatgen is not installed')
+    def test_outcar_read_once(self):
+        # final_structure reuses the magnetization read for magmoms
+        entry, num_reads = self.magmoms_entry(2, ('final_structure', 'magmoms'))
+        self.assertNotIn('errors', entry)
+        self.assertEqual(num_reads, 1)
+        self.assertEqual([site['properties']['magmom'] for site in entry['final_structure']['sites']],
+                         [1.5, 0.0])
+
+    def test_recorded_once(self):
+        path = os.path.join(self.tmp.name, 'results.jsonl')
+        sink = ResultsSink(path, fields=('energy',))
+        self.assertTrue(sink.record('job', self.job, SUMMARY))
+        sink.close()
+        sink = ResultsSink(path, fields=('energy',))
+        self.assertFalse(sink.record('job', self.job, SUMMARY))
+        sink.close()
+        self.assertEqual([entry['entry_id'] for entry in sink.iter_entries()], ['job'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+import os
+import tempfile
+import unittest
+from workflow_management.scfmonitor import (ScfMonitor, electronic_rerun_policy, reverse_lines,
+                                            INCREASED_NELM, MAX_NELM, FALLBACK_ALGO)
+
+
+def oszicar(ionic_steps):
+    # ionic_steps is a list of (dE values, complete)
+    lines = []
+    for number, (dEs, complete) in enumerate(ionic_steps, 1):
+        lines.append('       N       E                     dE             d eps       ncg     rms          rms(c)')
+        for step, dE in enumerate(dEs, 1):
+            lines.append('DAV: %3d    -0.108718060E+03   %.5E   -0.52190E+00  1152   0.364E+00' % (step, dE))
+        if complete:
+            lines.append('   %s F= -.10871806E+03 E0= -.10871806E+03  d E =-.108718E+03  mag=     2.0000' % number)
+    return '\n'.join(lines) + '\n'
+
+
+class TestElectronicRerunPolicy(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def monitor(self, ionic_steps):
+        with open(os.path.join(self.tmp.name, 'OSZICAR'), 'w') as f:
+            f.write(oszicar(ionic_steps))
+        return ScfMonitor.from_directory(self.tmp.name)
+
+    def test_reads_tail(self):
+        monitor = self.monitor([([1.0] * 4, True), ([1.0] * 6, True), ([1.0] * 2, False)])
+        self.assertEqual(monitor.step_counts(), [4, 6, 2])
+        self.assertEqual([step['complete'] for step in monitor.ionic_steps], [True, True, False])
+        monitor = ScfMonitor(os.path.join(self.tmp.name, 'OSZICAR'), num_ionic_steps=1)
+        self.assertEqual(monitor.step_counts(), [2])
+
+    def test_no_output(self):
+        self.assertIsNone(ScfMonitor.from_directory(self.tmp.name))
+        self.assertEqual(electronic_rerun_policy(None, {'NELM': 60}),
+                         ('increase_nelm', INCREASED_NELM))
+
+    def test_slow_convergence(self):
+        # |dE| falls a decade every 20 steps and reaches 1e-4 after about 80
+        dEs = [-10 ** (-i / 20.0) for i in range(60)]
+        action, nelm = electronic_rerun_policy(self.monitor([(dEs, True)]),
+                                               {'NELM': 60, 'EDIFF': 1e-4})
+        self.assertEqual(action, 'increase_nelm')
+        self.assertEqual(nelm, INCREASED_NELM)
+
+    def test_too_slow_switches_algo(self):
+        # a decade every 90 steps needs more than MAX_NELM steps for 1e-12
+        dEs = [-10 ** (-i / 90.0) for i in range(60)]
+        monitor = self.monitor([(dEs, True)])
+        incar = {'NELM': 60, 'EDIFF': 1e-12, 'ALGO': 'Fast'}
+        self.assertEqual(electronic_rerun_policy(monitor, incar), ('switch_algo', FALLBACK_ALGO))
+        incar['ALGO'] = 'All'
+        action, reason = electronic_rerun_policy(monitor, incar)
+        self.assertEqual(action, 'leave')
+        self.assertIn(str(MAX_NELM), reason)
+
+    def test_sloshing(self):
+        dEs = [(-1) ** i * 0.1 for i in range(60)]
+        monitor = self.monitor([(dEs, True)])
+        self.assertEqual(monitor.diagnose(1e-4, 60), ('sloshing', None))
+        self.assertEqual(electronic_rerun_policy(monitor, {'NELM': 60}),
+                         ('switch_algo', FALLBACK_ALGO))
+        self.assertEqual(electronic_rerun_policy(monitor, {'NELM': 60, 'ALGO': 'all'}),
+                         ('leave', 'electronic steps oscillating with ALGO = all'))
+
+    def test_stopped_while_converging(self):
+        # converging fast enough, but the run ended during the SCF
+        dEs = [-10 ** (-i / 2.0) for i in range(12)]
+        self.assertEqual(electronic_rerun_policy(self.monitor([(dEs, False)]),
+                                                 {'NELM': 60, 'EDIFF': 1e-4}),
+                         ('increase_nelm', INCREASED_NELM))
+        # already above INCREASED_NELM: raised by the steps needed, up to MAX_NELM
+        self.assertEqual(electronic_rerun_policy(self.monitor([(dEs, False)]),
+                                                 {'NELM': 600, 'EDIFF': 1e-4}),
+                         ('increase_nelm', 612))
+        self.assertEqual(electronic_rerun_policy(self.monitor([(dEs, False)]),
+                                                 {'NELM': 995, 'EDIFF': 1e-4}),
+                         ('increase_nelm', MAX_NELM))
+
+    def test_reverse_lines(self):
+        path = os.path.join(self.tmp.name, 'lines')
+        lines = ['line %s' % i for i in range(1000)]
+        with open(path, 'w') as f:
+            f.write('\n'.join(lines))
+        self.assertEqual(list(reverse_lines(path, block_size=7)), lines[::-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+import os
+import tempfile
+import unittest
+from workflow_management.statestore import JobStateStore, output_fingerprint
+
+
+class TestJobStateStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        self.job = os.path.join(self.root, 'bulk', 'job')
+        os.makedirs(self.job)
+        for file_name in ('vasprun.xml', 'OUTCAR'):
+            with open(os.path.join(self.job, file_name), 'w') as f:
+                f.write('output\n')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip(self):
+        fingerprint = output_fingerprint(self.job)
+        summary = {'final_energy': -3.25, 'converged': True}
+        store = JobStateStore(self.root)
+        store.record(self.job, job_name='NiO-bulk-job', decision='converged', stage=2,
+                     fingerprint=fingerprint, submission_id='123_4', result_summary=summary)
+        store.close()
+
+        store = JobStateStore(self.root)
+        job_state = store.get(self.job)
+        self.assertEqual(job_state['job_name'], 'NiO-bulk-job')
+        self.assertEqual(job_state['stage'], 2)
+        self.assertEqual(job_state['submission_id'], '123_4')
+        self.assertEqual(job_state['result_summary'], summary)
+        self.assertEqual(store.fingerprint(self.job), fingerprint)
+        self.assertTrue(store.is_unchanged_convergence(self.job, fingerprint))
+        self.assertEqual(store.completed_jobs([self.job]), {self.job: 'NiO-bulk-job'})
+        store.close()
+
+    def test_record_merges_fields(self):
+        store = JobStateStore(self.root)
+        store.record(self.job, job_name='job', decision='single', result_summary={'a': 1})
+        store.record(self.job, submission_id='77')
+        job_state = store.get(self.job)
+        self.assertEqual(job_state['decision'], 'single')
+        self.assertEqual(job_state['submission_id'], '77')
+        self.assertEqual(job_state['result_summary'], {'a': 1})
+        self.assertEqual(store.completed_jobs(), {})
+        self.assertRaises(KeyError, store.record, self.job, unknown=1)
+        store.close()
+
+    def test_changed_outputs(self):
+        store = JobStateStore(self.root)
+        store.record(self.job, decision='converged', fingerprint=output_fingerprint(self.job))
+        with open(os.path.join(self.job, 'OUTCAR'), 'a') as f:
+            f.write('more output\n')
+        self.assertFalse(store.is_unchanged_convergence(self.job, output_fingerprint(self.job)))
+        store.close()
+
+    def test_uncommitted_changes_not_visible(self):
+        store = JobStateStore(self.root)
+        store.record(self.job, decision='converged')
+        reader = JobStateStore(self.root)
+        self.assertIsNone(reader.get(self.job))
+        store.commit()
+        self.assertEqual(reader.get(self.job)['decision'], 'converged')
+        reader.close()
+        store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
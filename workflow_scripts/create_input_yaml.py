@@ -3,7 +3,9 @@ import yaml
 import argparse
 import os
 import sys
-from yaml_generation.writeyaml import WriteYaml
+from yaml_generation.writeyaml import WriteYaml, read_entries_file
+from structure_retrieval.structureretrieval import StructureRetriever
+from structure_retrieval.structurecache import StructureCache
 from pathlib import Path
 
 def argument_parser():
@@ -17,6 +19,22 @@ def argument_parser():
         choices=['MPIDs', 'PATHs', 'Calculation_Type', 'Relaxation_Set',
                  'Magnetization_Scheme', 'INCAR_Tags', 'KPOINTs',
                  'Max_Submissions'], default=None)
+    parser.add_argument(
+        '-m', '--mpids_file',
+        help='Text or .csv file of mp-ids (and optional labels) added without prompting',
+        type=str, default=None)
+    parser.add_argument(
+        '-p', '--paths_file',
+        help='Text or .csv file of structure paths (and optional labels) added without prompting',
+        type=str, default=None)
+    parser.add_argument(
+        '-w', '--workers', help='Processes used to validate --paths_file structures',
+        type=int, default=1)
+    parser.add_argument(
+        '--offline', help='Validate MPIDs against the local structure cache only',
+        action='store_true')
+    parser.add_argument(
+        '--cache_dir', help='Structure cache directory', type=str, default=None)
     args = parser.parse_args()
 
     return args
@@ -41,7 +59,14 @@ def reorder_args(args):
 
 def yml_inputs(args, args_fields):
     # add in something to organize the fields read-in in the manner that you want them read-in
-    WY = WriteYaml(args.copyfile_name)
+    SR = StructureRetriever(cache=StructureCache(args.cache_dir), offline=args.offline)
+    WY = WriteYaml(args.copyfile_name, SR)
+
+    # bulk, non-interactive additions
+    if args.mpids_file is not None:
+        WY.add_mpids(read_entries_file(args.mpids_file, 'mpid'))
+    if args.paths_file is not None:
+        WY.add_paths(read_entries_file(args.paths_file, 'path'), args.workers)
 
     if args_fields is None:
         pass
@@ -84,7 +109,9 @@ def write_yaml(write_dict, path):
     if '.yml' in path and os.path.exists(parent):
         print('Writing new .yml to path %s' % abs_path)
         with open(abs_path, "w") as outfile:
-            yaml.safe_dump(write_dict, outfile, default_flow_style=False)
+            # the C dumper, if available, keeps large MPIDs/PATHs lists fast
+            yaml.dump(write_dict, outfile, Dumper=getattr(yaml, 'CSafeDumper', yaml.SafeDumper),
+                      default_flow_style=False)
     else:
         new_path = input('Provide write path that exists; file should have .yml file extension'/n)
         write_yaml(write_dict, new_path)
@@ -5,6 +5,8 @@ import os
 import copy
 from runfile_generation.runfilegeneration import *
 from workflow_scripts.create_input_yaml import write_yaml
+from structure_retrieval.structureretrieval import StructureRetriever, LocalStructureClient
+from structure_retrieval.structurecache import StructureCache
 
 def argument_parser():
     parser = argparse.ArgumentParser()
@@ -13,6 +15,43 @@ def argument_parser():
         help='Read-in .yml file path; best to put "" around path name',
         type=str,
         required=True)
+    parser.add_argument(
+        '-s', '--structures_dir',
+        help='Directory of <mpid>.json/.cif/... structures used instead of the Materials Project',
+        type=str,
+        default=None)
+    parser.add_argument(
+        '-w', '--workers',
+        help='Number of processes used to load PATHs structures and write the run directories',
+        type=int,
+        default=1)
+    parser.add_argument(
+        '--offline',
+        help='Use only the local structure cache for MPIDs; no Materials Project queries',
+        action='store_true')
+    parser.add_argument(
+        '--max_age',
+        help='Days after which cached MPID structures are fetched again',
+        type=float,
+        default=None)
+    parser.add_argument(
+        '--stream',
+        help='Generate one structure at a time, from loading to writing its directories, to bound memory',
+        action='store_true')
+    parser.add_argument(
+        '--magnetic_symmetry',
+        help='Find unique defect sites with the magnetic symmetry of each variant (more defect structures)',
+        action='store_true')
+    parser.add_argument(
+        '--link_mode',
+        help='How shared POTCARs and auxiliary files are placed in job directories; falls back to symlink, then copy',
+        choices=['hardlink', 'symlink', 'copy'],
+        default='hardlink')
+    parser.add_argument(
+        '--cache_dir',
+        help='Structure cache directory (default $VASP_WORKFLOW_STRUCTURE_CACHE or ~/.cache/vasp_workflow/structures)',
+        type=str,
+        default=None)
     args = parser.parse_args()
 
     return args
@@ -20,11 +59,31 @@ def argument_parser():
 def main():
     args = argument_parser()
     LY = LoadYaml(args.readfile_path)
-    PSO = PmgStructureObjects(LY.mpids, LY.paths, LY.calculation_type["Rescale"])
-    M = Magnetism(PSO.structures_dict, LY.magnetization_scheme)
-    CT = CalculationType(M.magnetized_structures_dict, LY.calculation_type)
-    WVF = WriteVaspFiles(CT.calculation_structures_dict, LY.calculation_type, LY.relaxation_set,
-                         LY.incar_tags, LY.kpoints)
+    if args.structures_dir is not None:
+        SR = StructureRetriever(LocalStructureClient.from_directory(args.structures_dir))
+    else:
+        max_age = args.max_age * 86400 if args.max_age is not None else None
+        SR = StructureRetriever(cache=StructureCache(args.cache_dir, max_age), offline=args.offline)
+    if args.stream:
+        # each structure flows through magnetism, calculation type and
+        # writing before the next one is loaded
+        SC = SymmetryCache(max_size=STREAM_CACHE_SIZE, magnetic_symmetry=args.magnetic_symmetry)
+        PSO = PmgStructureObjects(LY.mpids, LY.paths, LY.calculation_type["Rescale"], SR,
+                                  args.workers, stream=True)
+        M = Magnetism(PSO.iter_structures(), LY.magnetization_scheme, SC, stream=True)
+        CT = CalculationType(M.iter_magnetic_structures(), LY.calculation_type, SC, stream=True)
+        WVF = WriteVaspFiles(CT.iter_calculation_structures(), LY.calculation_type,
+                             LY.relaxation_set, LY.incar_tags, LY.kpoints, args.workers, args.link_mode,
+                             LY.auxiliary_files)
+    else:
+        PSO = PmgStructureObjects(LY.mpids, LY.paths, LY.calculation_type["Rescale"], SR,
+                                  args.workers)
+        SC = SymmetryCache(magnetic_symmetry=args.magnetic_symmetry)
+        M = Magnetism(PSO.structures_dict, LY.magnetization_scheme, SC)
+        CT = CalculationType(M.magnetized_structures_dict, LY.calculation_type, SC)
+        WVF = WriteVaspFiles(CT.calculation_structures_dict, LY.calculation_type, LY.relaxation_set,
+                             LY.incar_tags, LY.kpoints, args.workers, args.link_mode,
+                             LY.auxiliary_files)
 
 if __name__ == "__main__":
     main()
@@ -1,40 +1,118 @@
 #!/usr/bin/env python
 
 import os
+import io
+import time
+import argparse
+import contextlib
 import subprocess
-import json
+from concurrent.futures import ProcessPoolExecutor
 import yaml
-from vasp_run import vasp
+import vasp_run
+from workflow_management.jobindex import JobIndex
+from workflow_management.queuesnapshot import QueueSnapshot, FINISHED_STATES
+from workflow_management.convergenceprobe import ConvergenceProbe
+from workflow_management.statestore import JobStateStore, output_fingerprint
+from workflow_management.batchsubmission import ArraySubmitter, vasp_arguments, parse_submission_id
+from workflow_management.resultssink import ResultsSink, RESULT_FIELDS, DEFAULT_FIELDS
+from workflow_management.dosstore import DosStore
+from workflow_management.jobwatcher import PollInterval, ChangeTracker
+from workflow_management.scfmonitor import ScfMonitor, electronic_rerun_policy
+from workflow_management.auxiliaryfiles import verify_auxiliary_files
 from pymatgen.io.vasp.inputs import Incar
 from pymatgen.io.vasp.inputs import Poscar
-from pymatgen.io.vasp.outputs import Vasprun
+
+_job_indices = {}
+_state_stores = {}
+_queue_snapshot = QueueSnapshot()
+
+def argument_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '-t', '--queue_ttl',
+        help='Seconds a squeue snapshot is reused before the scheduler is queried again',
+        type=float,
+        default=300)
+    parser.add_argument(
+        '-w', '--workers',
+        help='Number of processes used to evaluate jobs; 1 evaluates serially',
+        type=int,
+        default=1)
+    parser.add_argument(
+        '-b', '--batch',
+        help='Submit the reruns of a pass as SLURM job arrays of jobs with identical resources',
+        action='store_true')
+    parser.add_argument(
+        '-c', '--compression',
+        help='Compression of the converged results file',
+        type=str,
+        choices=['gzip', 'zstd'],
+        default=None)
+    parser.add_argument(
+        '-f', '--result_fields',
+        help='Fields stored for each converged job',
+        nargs='+',
+        type=str,
+        choices=list(RESULT_FIELDS),
+        default=list(DEFAULT_FIELDS))
+    parser.add_argument(
+        '--dos_window',
+        help='Energy window (eV, relative to the Fermi level) kept by the dos result field',
+        nargs=2,
+        type=float,
+        default=None)
+    parser.add_argument(
+        '--watch',
+        help='Keep running, polling the scheduler and acting on jobs as their state changes',
+        action='store_true')
+    parser.add_argument(
+        '--poll_min',
+        help='Shortest interval (s) between polls in watch mode',
+        type=float,
+        default=60)
+    parser.add_argument(
+        '--poll_max',
+        help='Longest interval (s) between polls in watch mode; idle polls back off up to it',
+        type=float,
+        default=1800)
+    args = parser.parse_args()
+
+    return args
 
 def check_path_exists(path):
-    # called in check_vasp_input, among others
+    # called in vasp_run_main, among others
     if os.path.exists(path):
         return True
     else:
         return False
 
-def check_vasp_input(path):
-    # called in check_num_jobs_in_workflow
-    incar = os.path.join(path, 'INCAR')
-    kpoints = os.path.join(path, 'KPOINTS')
-    potcar = os.path.join(path, 'POTCAR')
-    poscar = os.path.join(path, 'POSCAR')
-    if check_path_exists(incar) and check_path_exists(kpoints) and check_path_exists(potcar) and check_path_exists(poscar):
-        return True
-    else:
-        return False
+def get_job_index(pwd):
+    # called in driver, among others; one in-memory index per workflow root
+    pwd = os.path.abspath(pwd)
+    if pwd not in _job_indices:
+        job_index = JobIndex(pwd)
+        job_index.refresh()
+        _job_indices[pwd] = job_index
+    return _job_indices[pwd]
+
+def find_job_index(path):
+    # called in get_job_name; index of the workflow containing path, if any
+    path = os.path.abspath(path)
+    for job_index in _job_indices.values():
+        if path in job_index.jobs:
+            return job_index
+    return None
+
+def get_state_store(pwd):
+    # called in vasp_run_main and driver; sqlite job state in the workflow root
+    pwd = os.path.abspath(pwd)
+    if pwd not in _state_stores:
+        _state_stores[pwd] = JobStateStore(pwd)
+    return _state_stores[pwd]
 
 def check_num_jobs_in_workflow(pwd):
     # called in driver
-    num_jobs = 0
-    for root, dirs, files in os.walk(pwd):
-        for file in files:
-            if file == 'POTCAR' and check_vasp_input(root) == True:
-                num_jobs +=1
-    return num_jobs
+    return get_job_index(pwd).num_jobs()
 
 def get_incar_value(path, tag):
     # called in get_job_name
@@ -50,6 +128,11 @@ def default_naming(path):
 
     return formula + '-' + directories[-2] + '-' + directories[-1]
 
+def get_stage_number(path):
+    # called in vasp_run_main; None for single step jobs
+    incar = Incar.from_file(os.path.join(path, 'INCAR'))
+    return incar.get('STAGE_NUMBER')
+
 def replace_incar_tags(path, tag, value):
     # called in get_job_name
     incar = Incar.from_file(os.path.join(path, 'INCAR'))
@@ -58,55 +141,83 @@ def replace_incar_tags(path, tag, value):
 
 def get_job_name(path):
     # called in get_single_job_name
+    job_index = find_job_index(path)
+    if job_index is not None and job_index.job_name(path) is not None:
+        return job_index.job_name(path)
+
     if 'SYSTEM' in open(os.path.join(path, 'INCAR')).read():
-        name = get_incar_value(path, 'SYSTEM')
-        return str(name)
+        name = str(get_incar_value(path, 'SYSTEM'))
     else:
-        name = default_naming(path)
+        name = str(default_naming(path))
         replace_incar_tags(path, 'SYSTEM', name)
-        return str(name)
+    if job_index is not None:
+        job_index.set_job_name(path, name)
+    return name
 
 def get_single_job_name(pwd):
     # called in driver
-    for root, dirs, files in os.walk(pwd):
-        for file in files:
-            if file == 'POTCAR' and check_vasp_input(root) == True:
-                job_name = get_job_name(root)
+    job_name = get_job_name(get_job_index(pwd).job_paths()[-1])
     return job_name
 
+def get_queue_snapshot(ttl=None):
+    # called in not_in_queue; squeue only runs when the snapshot has expired
+    if ttl is not None:
+        _queue_snapshot.ttl = ttl
+    _queue_snapshot.refresh()
+    return _queue_snapshot
+
 def jobs_in_queue():
-    # called in not_in_queue
-    p = subprocess.Popen(['squeue' ,'-o', '"%Z %T"'], stdout=subprocess.PIPE)
-    #can be user specific, add -u username
-    jobs_running = []
-    line_count = 0
-    for line in p.stdout:
-        if line_count > 0:
-            line = str(line, 'utf-8').replace('"', '').split()
-            jobs_running.append((line[0], line[1])) # tuple is (directory, status)
-        line_count += 1
-    all_jobs_dict = {job[0]:job[1] for job in jobs_running}
-    return all_jobs_dict
+    # kept for external callers; returns {directory: status}
+    return dict(get_queue_snapshot().by_directory)
+
+def job_queue_status(path, state_store):
+    # called in vasp_run_main; array tasks run from array_submissions, so
+    # they are found by their recorded submission ID instead of directory
+    queue_status = not_in_queue(path)
+    if queue_status == True:
+        job_state = state_store.get(path)
+        if job_state is not None and job_state['submission_id'] is not None:
+            state = get_queue_snapshot().job_state(job_state['submission_id'])
+            if state is not None and state not in FINISHED_STATES:
+                return state
+    return queue_status
 
 def not_in_queue(path):
     # called in vasp_run_main
-    all_jobs_dict = jobs_in_queue()
+    state = get_queue_snapshot().state(path)
 
-    if path not in all_jobs_dict:
+    if state is None:
         return True
-    elif all_jobs_dict[path] == 'COMPLETING' or all_jobs_dict[path] == 'COMPLETED':
+    elif state in FINISHED_STATES:
         return True
     else:
-        return all_jobs_dict[path]
+        return state
 
-def is_converged(path):
-    # called in vasp_run_main
+def electronic_rerun(path, job_name, rerun_type):
+    # called in is_converged; decides from the tail of OSZICAR (or OUTCAR)
+    # whether a job that missed electronic convergence is worth rerunning
+    incar = Incar.from_file(os.path.join(path, 'INCAR'))
+    action, value = electronic_rerun_policy(ScfMonitor.from_directory(path), incar)
+    if action == 'increase_nelm':
+        replace_incar_tags(path, 'NELM', value) #increase number of electronic steps
+        print('Increased NELM to ' + str(value) + ' max steps for electronic convergence.')
+        return rerun_type
+    elif action == 'switch_algo':
+        replace_incar_tags(path, 'ALGO', value)
+        print('Electronic steps not converging; switched ALGO to ' + str(value) + '.')
+        return rerun_type
+    else:
+        print(job_name + ' Not resubmitting, check electronic convergence: ' + value)
+        return False
+
+def is_converged(path, probe=None, check_queue=True):
+    # called in evaluate_job; probe is a ConvergenceProbe of path/vasprun.xml
     job_name = get_job_name(path)
     rerun = False
-    if not_in_queue(path) == True:  # Continue if job is not in queue
+    if check_queue == False or not_in_queue(path) == True:  # Continue if job is not in queue
         if 'STAGE_NUMBER' in open(os.path.join(path, 'INCAR')).read():
             if os.path.exists(os.path.join(path, 'CONVERGENCE')):
-                with open('CONVERGENCE') as fd:
+                with open(os.path.join(path, 'CONVERGENCE')) as fd:
                     pairs = (line.split(None) for line in fd)
                     res   = {int(pair[0]):pair[1] for pair in pairs if len(pair) == 2 and pair[0].isdigit()}
                     max_stage_number = len(res) - 1
@@ -121,12 +232,12 @@ def is_converged(path):
                 rerun = 'multi'    #RERUN JOB
                 print('Rerunning ' + job_name + ' stage ' + str(current_stage_number) + ' of ' + str(max_stage_number))
             elif current_stage_number == max_stage_number:
-                V = Vasprun(os.path.join(path, 'vasprun.xml'))
+                if probe is None:
+                    probe = ConvergenceProbe(os.path.join(path, 'vasprun.xml'))
+                V = probe
                 if V.converged != True:
                     if V.converged_electronic != True:
-                        replace_incar_tags(path, 'NELM', 500) #increase number of electronic steps
-                        print('Increased NELM to 500 max steps for electronic convergence.')
-                        rerun = 'multi'  #RERUN JOB
+                        rerun = electronic_rerun(path, job_name, 'multi')
                     elif V.converged_ionic != True and int(get_incar_value(path, 'NSW')) == 0:
                         print(job_name + ' Assuming you do not want to resubmit job! Single point energy calculation: converged_electronic = TRUE, converged_ionic = FALSE')
                         rerun = 'converged'
@@ -139,12 +250,12 @@ def is_converged(path):
             elif 'IMAGES' in open(os.path.join(path,'INCAR')).read():
                 print('DOES NOT HANDLE NEB YET')
             else:
-                V = Vasprun(os.path.join(path, 'vasprun.xml'))
+                if probe is None:
+                    probe = ConvergenceProbe(os.path.join(path, 'vasprun.xml'))
+                V = probe
                 if V.converged != True:        #Job not converge
                     if V.converged_electronic != True:
-                        replace_incar_tags(path, 'NELM', 500) #increase number of electronic steps
-                        print('Increased NELM to 500 max steps for electronic convergence.')
-                        rerun = 'single'  #RERUN JOB
+                        rerun = electronic_rerun(path, job_name, 'single')
                     elif V.converged_ionic != True and int(get_incar_value(path, 'NSW')) == 0:
                         print(job_name + ' Assuming you do not want to resubmit job!! Single point energy calculation: converged_electronic = TRUE, converged_ionic = FALSE')
                         rerun = 'converged'
@@ -156,31 +267,40 @@ def is_converged(path):
 
             return rerun
 
-def rerun_job(job_type, job_name):
+def rerun_job(job_type, job_name, path=None):
     # called in vasp_run_main. Requires vasp.py to be in path
-    vasp_path = os.path.abspath(vasp.__file__)
-    if job_type == 'multi':
-        os.system(vasp_path + ' -m CONVERGENCE -n ' + job_name)
-    if job_type == 'single':
-        os.system(vasp_path + ' -n ' + job_name)
-    if job_type == 'multi_initial':
-        os.system(vasp_path + ' -m CONVERGENCE --init -n ' + job_name)
-
-def store_data(vasprun_obj, job_name):
-    # called in vasp_run_main
-    entry_obj = vasprun_obj.as_dict()
-    entry_obj["complete_dos"] = vasprun_obj.complete_dos.as_dict()
-    entry_obj["entry_id"] = job_name
-
-    return entry_obj
-
-def fizzled_job(path):
+    # vasp.py runs with path as its working directory
+    # Returns the scheduler job ID if one was reported
+    vasp_path = os.path.join(os.path.dirname(os.path.abspath(vasp_run.__file__)), 'vasp.py')
+    arguments = vasp_arguments(job_type, job_name)
+    if arguments is None:
+        return None
+    p = subprocess.run([vasp_path] + arguments, cwd=path, stdout=subprocess.PIPE, universal_newlines=True)
+    print(p.stdout, end='')
+    return parse_submission_id(p.stdout)
+
+def submit_job(job_type, job_name, path, array_submitter=None):
+    # called in vasp_run_main; with an ArraySubmitter the job waits for the
+    # batched submission at the end of the pass. Jobs whose auxiliary files
+    # (e.g. a linked vdW kernel) are not intact are not submitted
+    if vasp_arguments(job_type, job_name) is not None:
+        problems = verify_auxiliary_files(path)
+        if problems:
+            print(job_name + ' Not submitting, auxiliary files not intact: ' + '; '.join(problems))
+            return None
+    if array_submitter is None:
+        return rerun_job(job_type, job_name, path)
+    array_submitter.add(job_type, job_name, path)
+    return None
+
+def fizzled_job(path, check_queue=True):
+    # called in evaluate_job
     job_name = get_job_name(path)
     rerun = False
-    if not_in_queue(path) == True: # Continue if job is not in queue
+    if check_queue == False or not_in_queue(path) == True: # Continue if job is not in queue
         if 'STAGE_NUMBER' in open(os.path.join(path, 'INCAR')).read():
             if check_path_exists(os.path.join(path, 'CONVERGENCE')):
-                with open('CONVERGENCE') as fd:
+                with open(os.path.join(path, 'CONVERGENCE')) as fd:
                     pairs = (line.split(None) for line in fd)
                     res   = {int(pair[0]):pair[1] for pair in pairs if len(pair) == 2 and pair[0].isdigit()}
                     max_stage_number = len(res) - 1
@@ -195,49 +315,146 @@ def fizzled_job(path):
 
     return rerun
 
-def vasp_run_main(pwd):
-    # called in driver
-    completed_jobs = {'PATHs': {}}
-    computed_entries = []
-    for root, dirs, files in os.walk(pwd):
-        for file in files:
-            if file == 'POTCAR':
-                if check_vasp_input(root) == True:
-                    print('#********************************************#\n')
-                    job_name = get_job_name(root)
-                    if not_in_queue(root) == True:
-                        if check_path_exists(os.path.join(root, 'vasprun.xml')):
-                            try:
-                                V = Vasprun(os.path.join(root, 'vasprun.xml'))
-                                fizzled = False
-                            except:
-                                print(root, '  Fizzled job, check errors! Attempting to resubmit...')
-                                fizzled = True
-                            if fizzled == False:
-                                os.chdir(root)
-                                job = is_converged(root)
-                                rerun_job(job, job_name)
-                                if job == 'converged':
-                                    completed_jobs['PATHs'][str(root)] = str(job_name)
-                                    store_dict = store_data(V, job_name)
-                                    computed_entries.append(store_dict)
-                                else:
-                                    pass
-                            else:
-                                os.chdir(root)
-                                job = fizzled_job(root)
-                                rerun_job(job, job_name)
-                        elif check_path_exists(os.path.join(root, 'CONVERGENCE')):
-                            print(job_name + ' Initializing multi-step run.')
-                            os.chdir(root)
-                            rerun_job('multi_initial', job_name)
-                        else:
-                            print(job_name + ' Initializing run.')
-                            os.chdir(root)
-                            rerun_job('single', job_name)
-                    else:
-                        print(job_name + ' Job in queue. Status: ' + not_in_queue(root))
-                    print('\n')
+def evaluate_job(path):
+    # called in vasp_run_main, in a worker process when --workers > 1
+    # Reads and decides on a single job from absolute paths only; the
+    # queue check and submission stay in the calling process
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        try:
+            probe = ConvergenceProbe(os.path.join(path, 'vasprun.xml'))
+            fizzled = False
+        except:
+            print(path, '  Fizzled job, check errors! Attempting to resubmit...')
+            fizzled = True
+        if fizzled == False:
+            job = is_converged(path, probe, check_queue=False)
+            result_summary = probe.as_dict()
+        else:
+            job = fizzled_job(path, check_queue=False)
+            result_summary = None
+        stage = get_stage_number(path)
+    return {'decision': job, 'stage': stage, 'result_summary': result_summary,
+            'output': output.getvalue()}
+
+def evaluate_jobs(paths, workers):
+    # called in vasp_run_main; results are returned in the order of paths
+    if workers <= 1 or len(paths) <= 1:
+        return [evaluate_job(path) for path in paths]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(evaluate_job, paths,
+                                 chunksize=max(1, len(paths) // (workers * 4))))
+
+def job_settled(job_type, job_name, submission_id):
+    # called in vasp_run_main; True if nothing is left to do for a decision:
+    # nothing to submit, or submitted with a scheduler job ID
+    return vasp_arguments(job_type, job_name) is None or submission_id is not None
+
+def record_job_state(state_store, path, job_name, decision, fingerprint=None,
+                     submission_id=None, result_summary=None, stage=None):
+    # called in vasp_run_main; a job that is left alone (decision False, e.g.
+    # electronic convergence to be checked by hand) is stored as 'leave'
+    if decision is False or decision is None:
+        decision = 'leave'
+    fields = {'job_name': job_name, 'decision': decision}
+    if stage is not None:
+        fields['stage'] = stage
+    if fingerprint is not None:
+        fields['fingerprint'] = fingerprint
+    if submission_id is not None:
+        fields['submission_id'] = submission_id
+    if result_summary is not None:
+        fields['result_summary'] = result_summary
+    state_store.record(path, **fields)
+
+def vasp_run_main(pwd, results_sink, workers=1, array_submitter=None, change_tracker=None):
+    # called in driver and watch_workflow; returns the names of jobs newly
+    # added to results_sink. With a ChangeTracker only jobs whose queue state
+    # or outputs changed since the last pass are reported and acted on
+    job_index = get_job_index(pwd)
+    state_store = get_state_store(pwd)
+    recorded_jobs = []
+
+    # queue and fingerprint checks for every job, in index order
+    planned_jobs = []
+    evaluate_paths = []
+    tracked_states = {}
+    for root in job_index.job_paths():
+        fingerprint = None
+        queue_status = job_queue_status(root, state_store)
+        if change_tracker is not None:
+            tracked_states[root] = (queue_status != True, output_fingerprint(root))
+            if not change_tracker.changed(root, *tracked_states[root]):
+                continue
+        job_name = get_job_name(root)
+        if queue_status != True:
+            action = 'queued'
+        elif check_path_exists(os.path.join(root, 'vasprun.xml')):
+            fingerprint = output_fingerprint(root)
+            if state_store.is_unchanged_convergence(root, fingerprint):
+                action = 'unchanged'
+            else:
+                action = 'evaluate'
+                evaluate_paths.append(root)
+        elif check_path_exists(os.path.join(root, 'CONVERGENCE')):
+            action = 'multi_initial'
+        else:
+            action = 'single'
+        planned_jobs.append((root, job_name, action, queue_status, fingerprint))
+
+    # parsing and decisions, in parallel when workers > 1
+    evaluations = dict(zip(evaluate_paths, evaluate_jobs(evaluate_paths, workers)))
+
+    # reporting, submission and bookkeeping, serially in index order
+    # the state is committed even if a submission fails part way through
+    try:
+        for root, job_name, action, queue_status, fingerprint in planned_jobs:
+            print('#********************************************#\n')
+            settled = True
+            if action == 'queued':
+                print(job_name + ' Job in queue. Status: ' + queue_status)
+            elif action == 'unchanged':
+                print(job_name + ' Complete and ready for post processing. Outputs unchanged since last pass.')
+            elif action == 'evaluate':
+                evaluation = evaluations[root]
+                print(evaluation['output'], end='')
+                job = evaluation['decision']
+                submission_id = submit_job(job, job_name, root, array_submitter)
+                settled = job_settled(job, job_name, submission_id)
+                record_job_state(state_store, root, job_name, job, fingerprint,
+                                 submission_id, evaluation['result_summary'],
+                                 evaluation['stage'])
+                if job == 'converged':
+                    if results_sink.record(job_name, root, evaluation['result_summary']):
+                        recorded_jobs.append(job_name)
+            elif action == 'multi_initial':
+                print(job_name + ' Initializing multi-step run.')
+                submission_id = submit_job('multi_initial', job_name, root, array_submitter)
+                settled = job_settled('multi_initial', job_name, submission_id)
+                record_job_state(state_store, root, job_name, 'multi_initial',
+                                 submission_id=submission_id,
+                                 stage=get_stage_number(root))
+            else:
+                print(job_name + ' Initializing run.')
+                submission_id = submit_job('single', job_name, root, array_submitter)
+                settled = job_settled('single', job_name, submission_id)
+                record_job_state(state_store, root, job_name, 'single',
+                                 submission_id=submission_id)
+            # a job whose submission failed is looked at again next pass
+            if settled and change_tracker is not None:
+                change_tracker.record(root, *tracked_states[root])
+            print('\n')
+        if array_submitter is not None:
+            for path, submission_id in array_submitter.submit().items():
+                state_store.record(path, submission_id=submission_id)
+                if change_tracker is not None:
+                    change_tracker.record(path, *tracked_states[path])
+            # an earlier pass's submission ID must not be taken for this one
+            for path in array_submitter.failed:
+                state_store.record(path, decision='submit_failed', submission_id=None)
+    finally:
+        state_store.commit()
+    completed_jobs = {'PATHs': state_store.completed_jobs(job_index.job_paths())}
 
     num_jobs_in_workflow = check_num_jobs_in_workflow(pwd)
     if num_jobs_in_workflow > 1:
@@ -253,9 +470,44 @@ def vasp_run_main(pwd):
                 f.write('WORKFLOW_CONVERGED = True')
                 f.close()
 
-    return computed_entries
+    return recorded_jobs
+
+def workflow_converged(pwd):
+    # called in watch_workflow
+    job_index = get_job_index(pwd)
+    completed_jobs = get_state_store(pwd).completed_jobs(job_index.job_paths())
+    return job_index.num_jobs() > 0 and len(completed_jobs) == job_index.num_jobs()
+
+def watch_workflow(pwd, results_sink, workers=1, array_submitter=None,
+                   poll_min=60, poll_max=1800):
+    # called in driver; repeats vasp_run_main until every job has converged,
+    # keeping the job index and queue snapshot in memory between passes
+    job_index = get_job_index(pwd)
+    change_tracker = ChangeTracker()
+    poll_interval = PollInterval(poll_min, poll_max)
+    recorded_jobs = []
+    try:
+        while True:
+            job_index.refresh()
+            change_tracker.forget(job_index.job_paths())
+            get_queue_snapshot().refresh(force=True)
+            change_tracker.start_pass()
+            recorded_jobs += vasp_run_main(pwd, results_sink, workers,
+                                           array_submitter, change_tracker)
+            job_index.save()
+            if workflow_converged(pwd):
+                break
+            interval = poll_interval.update(change_tracker.num_changed > 0)
+            print('%s  %s jobs changed; next poll in %s s' %
+                  (time.strftime('%Y-%m-%d %H:%M:%S'), change_tracker.num_changed, interval))
+            poll_interval.wait()
+    except KeyboardInterrupt:
+        print('\nStopped watching workflow.')
+    return recorded_jobs
 
 def driver():
+    args = argument_parser()
+    get_queue_snapshot(args.queue_ttl)
     pwd = os.getcwd()
     num_jobs_in_workflow = check_num_jobs_in_workflow(pwd)
 
@@ -280,12 +532,25 @@ def driver():
         workflow_name = get_single_job_name(pwd)
 
     # need dependencies for vasp_run_main
-    computed_entries = vasp_run_main(pwd)
-    if computed_entries is None:
-        pass
+    if args.batch:
+        array_submitter = ArraySubmitter(pwd, workflow_name)
     else:
-        with open(os.path.join(pwd, str(workflow_name) + '_converged.json'), 'w') as f:
-            json.dump(computed_entries, f)
+        array_submitter = None
+    dos_store = DosStore(os.path.join(pwd, str(workflow_name) + '_dos'), args.dos_window)
+    results_sink = ResultsSink(os.path.join(pwd, str(workflow_name) + '_converged.jsonl'),
+                               args.compression, args.result_fields, dos_store)
+    try:
+        if args.watch:
+            recorded_jobs = watch_workflow(pwd, results_sink, args.workers, array_submitter,
+                                           args.poll_min, args.poll_max)
+        else:
+            recorded_jobs = vasp_run_main(pwd, results_sink, args.workers, array_submitter)
+    finally:
+        results_sink.close()
+    if recorded_jobs:
+        print('%s newly converged jobs written to %s' % (len(recorded_jobs), results_sink.path))
+    get_job_index(pwd).save()
+    get_state_store(pwd).close()
 
 if __name__ == '__main__':
     driver()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+import io
+import os
+import tempfile
+import unittest
+import contextlib
+from unittest import mock
+
+try:
+    import pymatgen
+    HAS_PYMATGEN = True
+except ImportError:
+    HAS_PYMATGEN = False
+
+if HAS_PYMATGEN:
+    from workflow_scripts import rerun_workflow
+    from workflow_management.jobwatcher import ChangeTracker
+    from workflow_management.resultssink import ResultsSink
+    from workflow_management.statestore import JobStateStore
+    from workflow_management.auxiliaryfiles import write_manifest
+
+
+class FakeQueueSnapshot:
+    # an empty queue
+    def refresh(self, force=False):
+        return False
+
+    def state(self, path):
+        return None
+
+    def job_state(self, job_id):
+        return None
+
+
+@unittest.skipUnless(HAS_PYMATGEN, 'pymatgen is not installed')
+class TestWatchResubmission(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = os.path.realpath(self.tmp.name)
+        self.job = os.path.join(self.root, 'bulk', 'NiO', 'FM')
+        os.makedirs(self.job)
+        with open(os.path.join(self.job, 'INCAR'), 'w') as f:
+            f.write('SYSTEM = NiO-FM\n')
+        for file_name in ('KPOINTS', 'POTCAR', 'POSCAR'):
+            with open(os.path.join(self.job, file_name), 'w') as f:
+                f.write('%s\n' % file_name)
+        self.results_sink = ResultsSink(os.path.join(self.root, 'results.jsonl'))
+
+    def tearDown(self):
+        self.results_sink.close()
+        for workflow_root in list(rerun_workflow._state_stores):
+            if workflow_root.startswith(self.root):
+                rerun_workflow._state_stores.pop(workflow_root).close()
+                rerun_workflow._job_indices.pop(workflow_root, None)
+        self.tmp.cleanup()
+
+    def watch_passes(self, submission_ids):
+        # vasp_run_main once per submission ID; returns the rerun_job calls
+        tracker = ChangeTracker()
+        calls = []
+
+        def rerun_job(job_type, job_name, path=None):
+            calls.append(job_type)
+            return submission_ids[len(calls) - 1]
+        with mock.patch.object(rerun_workflow, 'rerun_job', rerun_job), \
+                mock.patch.object(rerun_workflow, 'get_queue_snapshot', FakeQueueSnapshot), \
+                contextlib.redirect_stdout(io.StringIO()):
+            for poll in range(len(submission_ids) + 1):
+                tracker.start_pass()
+                rerun_workflow.vasp_run_main(self.root, self.results_sink,
+                                             change_tracker=tracker)
+        return calls
+
+    def test_failed_submission_retried(self):
+        # sbatch failed twice (no job ID); the job is retried until it is
+        # submitted and then left alone
+        self.assertEqual(self.watch_passes([None, None, '42']), ['single'] * 3)
+        state = rerun_workflow.get_state_store(self.root).get(self.job)
+        self.assertEqual(state['submission_id'], '42')
+
+    def test_submitted_once(self):
+        self.assertEqual(self.watch_passes(['42', '43']), ['single'])
+
+
+@unittest.skipUnless(HAS_PYMATGEN, 'pymatgen is not installed')
+class TestRecordJobState(unittest.TestCase):
+    def test_left_alone_stored_as_leave(self):
+        with tempfile.TemporaryDirectory() as root:
+            state_store = JobStateStore(root)
+            rerun_workflow.record_job_state(state_store, os.path.join(root, 'a'), 'a', False)
+            rerun_workflow.record_job_state(state_store, os.path.join(root, 'b'), 'b', 'single')
+            self.assertEqual(state_store.get(os.path.join(root, 'a'))['decision'], 'leave')
+            self.assertEqual(state_store.get(os.path.join(root, 'b'))['decision'], 'single')
+            state_store.close()
+
+
+@unittest.skipUnless(HAS_PYMATGEN, 'pymatgen is not installed')
+class TestSubmitJob(unittest.TestCase):
+    def test_auxiliary_files_not_intact(self):
+        with tempfile.TemporaryDirectory() as job:
+            write_manifest(job, {'EXTRA': '0' * 64, 'vdw_kernel.bindat': '0' * 64})
+            with open(os.path.join(job, 'EXTRA'), 'w') as f:
+                f.write('extra data')
+            output = io.StringIO()
+            with mock.patch.object(rerun_workflow, 'rerun_job') as rerun_job, \
+                    contextlib.redirect_stdout(output):
+                self.assertIsNone(rerun_workflow.submit_job('single', 'NiO-FM', job))
+            rerun_job.assert_not_called()
+            self.assertEqual(output.getvalue(),
+                             'NiO-FM Not submitting, auxiliary files not intact: '
+                             'EXTRA does not match its recorded sha256; '
+                             'vdw_kernel.bindat is missing\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
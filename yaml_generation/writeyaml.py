@@ -3,11 +3,12 @@
 import yaml
 import os
 import sys
-from pymatgen.ext.matproj import MPRester
+import csv
+from concurrent.futures import ProcessPoolExecutor
 import json
 import copy
 from configuration import mp_api
-from configuration.mp_api import MP_api_key
+from structure_retrieval.structureretrieval import StructureRetriever
 from distutils.util import strtobool
 from yaml.scanner import ScannerError
 from pymatgen.core.periodic_table import Element
@@ -15,9 +16,51 @@ from pymatgen.io.vasp.inputs import Poscar
 from pathlib import Path
 
 
+def read_entries_file(file_path, column):
+    # [(entry, label or None)] from a text file (one entry per line, optional
+    # label after whitespace) or a .csv file with an entry column named
+    # column (otherwise the first column) and an optional 'label' column
+    entries = []
+    with open(file_path, 'r', newline='') as f:
+        if file_path.lower().endswith('.csv'):
+            reader = csv.DictReader(f)
+            fieldnames = reader.fieldnames or []
+            if not fieldnames:
+                return entries
+            entry_column = column if column in fieldnames else fieldnames[0]
+            for row in reader:
+                entry = (row.get(entry_column) or '').strip()
+                label = (row.get('label') or '').strip() or None
+                if entry and not entry.startswith('#'):
+                    entries.append((entry, label))
+        else:
+            for line in f:
+                fields = line.split(None, 1)
+                if not fields or fields[0].startswith('#'):
+                    continue
+                label = fields[1].strip() if len(fields) > 1 else None
+                entries.append((fields[0], label or None))
+    return entries
+
+
+def read_path_formula(path):
+    # (formula, None) or (None, error); called in worker processes
+    try:
+        return str(Poscar.from_file(str(Path(path))).structure.formula), None
+    except FileNotFoundError:
+        return None, '%s path does not exist' % path
+    except (UnicodeDecodeError, OSError):
+        return None, '%s likely not a valid CONTCAR or POSCAR' % path
+    except Exception as e:
+        return None, '%s not readable: %s' % (path, e)
+
+
 class WriteYaml():
 
-    def __init__(self, copy_path):
+    def __init__(self, copy_path, structure_retriever=None):
+        if structure_retriever is None:
+            structure_retriever = StructureRetriever()
+        self.structure_retriever = structure_retriever
         self.parent_folder = os.path.dirname(os.path.abspath(mp_api.__file__))
         # expects the write_parameters and incar_parameters files to be
         # in the configuration directory
@@ -93,14 +136,15 @@ class WriteYaml():
         except ValueError:
             return False
 
+    def get_mpid_structure(self, mpid):
+        # None if mpid is not a valid mp-id (or not cached when offline)
+        structures, invalid_mpids = self.structure_retriever.get_structures([mpid])
+        if mpid in invalid_mpids:
+            print('%s is not a valid mp-id' % mpid)
+        return structures.get(mpid)
+
     def is_mpid(self, mpid):
-        with MPRester(MP_api_key) as m:
-            try:
-                structure = m.get_structures(mpid, final=True)[0]
-                return True
-            except BaseException:
-                print('%s is not a valid mp-id' % mpid)
-                return False
+        return self.get_mpid_structure(mpid) is not None
 
     def is_vasp_readable_structure(self, path):
         try:
@@ -493,22 +537,37 @@ class WriteYaml():
             self.allowed_magnetism + ')\n')
         if magnetization.upper() == 'FM':
             self.new_dictionary['Magnetization_Scheme']['Scheme'] = 'FM'
-            try:
-                del self.new_dictionary['Magnetization_Scheme']['Max_antiferro']
-            except KeyError:
-                pass
+            for key in ['Max_antiferro', 'Seed']:
+                try:
+                    del self.new_dictionary['Magnetization_Scheme'][key]
+                except KeyError:
+                    pass
         elif magnetization.lower() == 'preserve':
             self.new_dictionary['Magnetization_Scheme']['Scheme'] = 'preserve'
-            try:
-                del self.new_dictionary['Magnetization_Scheme']['Max_antiferro']
-            except KeyError:
-                pass
+            for key in ['Max_antiferro', 'Seed']:
+                try:
+                    del self.new_dictionary['Magnetization_Scheme'][key]
+                except KeyError:
+                    pass
         elif magnetization.upper() == 'AFM':
             self.new_dictionary['Magnetization_Scheme']['Scheme'] = 'AFM'
             max_number = input('Max number of antiferromagnetic structures\n')
             if self.is_pos_int(max_number):
                 self.new_dictionary['Magnetization_Scheme']['Max_antiferro'] = int(
                     max_number)
+                self.validate_seed()
+            else:
+                print('Not valid positive integer; try again')
+                self.validate_magnetization()
+        elif magnetization.upper() == 'AFM-EXHAUSTIVE':
+            self.new_dictionary['Magnetization_Scheme']['Scheme'] = 'AFM-exhaustive'
+            max_number = input('Max number of antiferromagnetic structures\n')
+            if self.is_pos_int(max_number):
+                self.new_dictionary['Magnetization_Scheme']['Max_antiferro'] = int(
+                    max_number)
+                # enumeration is deterministic; Seed only applies to the
+                # random fallback for large magnetic sublattices
+                self.validate_seed()
             else:
                 print('Not valid positive integer; try again')
                 self.validate_magnetization()
@@ -518,6 +577,7 @@ class WriteYaml():
             if self.is_pos_int(max_number):
                 self.new_dictionary['Magnetization_Scheme']['Max_antiferro'] = int(
                     max_number)
+                self.validate_seed()
             else:
                 print('Not valid positive integer; try again')
                 self.validate_magnetization()
@@ -525,6 +585,19 @@ class WriteYaml():
             print('Not a valid option; try again')
             self.validate_magnetization()
 
+    def validate_seed(self):
+        seed = input('Random seed for reproducible antiferromagnetic structures; blank for none\n')
+        if seed == '':
+            try:
+                del self.new_dictionary['Magnetization_Scheme']['Seed']
+            except KeyError:
+                pass
+        elif seed.isdigit():
+            self.new_dictionary['Magnetization_Scheme']['Seed'] = int(seed)
+        else:
+            print('Not a valid non-negative integer; try again')
+            self.validate_seed()
+
     def validate_calculation_type(self):
         print('Calculation_Type; existing is %s' %
               self.new_dictionary['Calculation_Type'])
@@ -569,11 +642,10 @@ class WriteYaml():
         add_or_remove = input('Add or remove mpids?\n')
         if add_or_remove.lower() == 'add':
             mpid = input('Name of mpid to add\n')
-            if self.is_mpid(mpid):
-                with MPRester(MP_api_key) as m:
-                    structure = m.get_structures(mpid, final=True)[0]
-                    formula = structure.formula
-                    self.new_dictionary['MPIDs'][mpid] = formula
+            structure = self.get_mpid_structure(mpid)
+            if structure is not None:
+                formula = structure.formula
+                self.new_dictionary['MPIDs'][mpid] = formula
             else:
                 pass
             self.validate_mpids()
@@ -627,3 +699,43 @@ class WriteYaml():
         else:
             print('Not a valid option; try again')
             self.validate_paths()
+
+    def add_mpids(self, entries):
+        # non-interactive; entries are (mpid, label or None). All mp-ids are
+        # validated with one bulk query; invalid ones are reported together
+        mpids = [mpid for mpid, label in entries]
+        structures, invalid_mpids = self.structure_retriever.get_structures(mpids)
+        added = 0
+        for mpid, label in entries:
+            if mpid in structures:
+                self.new_dictionary['MPIDs'][mpid] = label or structures[mpid].formula
+                added += 1
+        if invalid_mpids:
+            print('%s of %s mp-ids are not valid mp-ids and were not added: %s' %
+                  (len(invalid_mpids), len(mpids), ', '.join(invalid_mpids)))
+        print('Added %s mp-ids' % added)
+        return added
+
+    def add_paths(self, entries, workers=1):
+        # non-interactive; entries are (path, label or None). Structures are
+        # read in parallel with more than one worker; errors are reported together
+        paths = [path for path, label in entries]
+        if workers > 1 and len(paths) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(read_path_formula, paths,
+                                            chunksize=max(1, len(paths) // (workers * 4))))
+        else:
+            results = [read_path_formula(path) for path in paths]
+        added = 0
+        errors = []
+        for (path, label), (formula, error) in zip(entries, results):
+            if error is not None:
+                errors.append(error)
+                continue
+            self.new_dictionary['PATHs'][path] = label or formula
+            added += 1
+        if errors:
+            print('%s of %s paths were not added:\n  %s' %
+                  (len(errors), len(paths), '\n  '.join(errors)))
+        print('Added %s paths' % added)
+        return added